@@ -2,7 +2,6 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-import sqlite3
 import statsmodels.api as sm
 import scipy.stats as stats
 import sys
@@ -12,10 +11,32 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "s
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 
-from scripts.database_queries import fetch_table_data, get_table_names, save_table_data
+from scripts.database_queries import fetch_table_data, get_table_names, get_column_names, save_table_data, get_table_version
 from scripts.graphs import *
-from scripts.weather_analysis import merged_df, run_weather_regression_, plot_general_weather_analysis, plot_user_weather_analysis
 from scripts.divide_the_day import convert_time_to_twentyfour_hours, assign_time_blocks
+from scripts.batched_ols import fit_grouped_ols
+from scripts.activity_cube import slice_cube
+from scripts.resampling import resampling_summary
+from scripts.model_registry import registered_fit
+from scripts.heart_rate_zones import ZONES
+from scripts.table_browser import FILTER_OPERATORS, parse_filter_value, approximate_row_count, fetch_page, column_summary
+from scripts.altair_charts import (
+    activity_sums_chart,
+    sleep_duration_bins_chart,
+    heart_rate_chart,
+    total_intensity_chart,
+    daily_line_chart,
+    weather_chart,
+    heart_rate_zones_chart,
+    sleep_state_heart_rate_chart,
+    regression_scatter_chart,
+    residual_histogram_chart,
+    qq_chart
+)
+from dashboard.warmup import start_warmup, prefetch_adjacent_days
+# Imported by its flat name, like the scripts do, so the probes in the scripts record into the same run
+from perf_probes import start_run, finish_run, probe, stages_frame, latency_percentiles
+from dashboard.data_cache import load_kpis, load_sleep_activity_frame, load_table, load_user_list, load_user_slice, load_weather_slices
 from scripts.sleep_analysis_2 import (
     connect_to_db,
     get_sleep_minutes_per_day,
@@ -31,445 +52,636 @@ st.set_page_config(layout="wide")
 st.sidebar.title("Navigation")
 page = st.sidebar.radio("Go to", ["🏠 Home", "📊 User Statistics", "⏳ Time-based Analysis", "💤 Sleep Analysis", "🌦️ Weather & Activity", "🔧 Database Management"])
 
-# Go to the folder where app.py is and then command: streamlit run app.py
+# Per-stage timings of this rerun, written to the performance log and optionally shown in the sidebar
+show_perf_panel = st.sidebar.checkbox("Show performance panel", value=False)
+track_memory = show_perf_panel and st.sidebar.checkbox("Track memory (tracemalloc)", value=False)
+run_profiler = show_perf_panel and st.sidebar.checkbox("Profile (cProfile)", value=False)
+start_run(page, track_memory=track_memory, profile=run_profiler)
 
-# =================== Home Page ===================
-if page == "🏠 Home":
-    st.title("Fitbit Research Dashboard")
-    st.write("This dashboard presents an analysis of Fitbit users' activity, sleep, and other fitness metrics.")
-    
-    daily_activity = fetch_table_data("daily_activity", use_modified=True)
-    sleep_data = fetch_table_data("merged_sleep_activity", use_modified=True)  
-    
-    if 'TotalActiveMinutes' not in daily_activity.columns:
-        daily_activity['TotalActiveMinutes'] = (
-            daily_activity['VeryActiveMinutes'] + 
-            daily_activity['FairlyActiveMinutes'] + 
-            daily_activity['LightlyActiveMinutes']
-        )
-    
-
-    total_users = daily_activity["Id"].nunique()
-    
-    avg_steps = daily_activity["TotalSteps"].mean()
-    avg_calories = daily_activity["Calories"].mean()
-    avg_active_minutes = daily_activity["TotalActiveMinutes"].mean()
-    
-    total_calories = daily_activity["Calories"].sum()
-    total_active_minutes = daily_activity["TotalActiveMinutes"].sum()
-
-    total_days = len(daily_activity["ActivityDate"].unique())
-    col1, col2, col3, col4, col5 = st.columns(5)
-    with col1:
-        st.metric("Total Users", total_users)
-    with col2:
-        st.metric("Total Number of Days Recorded", total_days)
-    with col3:
-        st.metric("Average Steps Per Day", round(avg_steps, 2))
-    with col4:
-        st.metric("Average Calories Burnt Per Day", round(avg_calories, 2))
-    with col5:
-        st.metric("Average Active Minutes Per Day", round(avg_active_minutes, 2))
-
-    col6, col7 = st.columns(2)
-
-    with col6:
-        st.pyplot(plot_activity_distribution(daily_activity))
-    with col7:
-        st.pyplot(plot_sleep_duration_histogram(fetch_table_data("minute_sleep", use_modified=True)))
-
-
-# =================== Database Management ===================
-elif page == "🔧 Database Management":
-    st.title("Database Management")
-    
-    tables = get_table_names(use_modified=True)
-    st.subheader("Tables in Database")
-    st.write(tables)
-
-    table_name = st.selectbox("Select Table", tables)
-    table_data = fetch_table_data(table_name, use_modified=True) 
-    
-    st.subheader(f"Data from {table_name}")
-    st.dataframe(table_data)
-    
-    st.info("Data modification is disabled. You can view data but cannot edit or save changes.")
-
-# =================== User Statistics ===================
-
-elif page == "📊 User Statistics":
-    st.title("User Activity Analysis")
-    
-    daily_activity = fetch_table_data("daily_activity", use_modified=True)  
-    sleep_data = fetch_table_data("merged_sleep_activity", use_modified=True)  
-    heart_rate_data = fetch_table_data("heart_rate", use_modified=True)
-    weight_data = fetch_table_data("weight_log", use_modified=True)
-    merged_data = fetch_table_data("merged_heart_rate_activity", use_modified=True)
-
-    merged_data['Date'] = pd.to_datetime(merged_data['Date']).dt.date
-    total_users = merged_data["Id"].nunique()
-    user_tracking_days = merged_data.groupby("Id")["Date"].nunique().reset_index()
-    user_tracking_days.columns = ["Id", "TrackedDays"]
-
-    user_tracking_days = user_tracking_days[user_tracking_days["TrackedDays"] >= 2]
-
-    daily_summary = merged_data.groupby(["Id", "Date"]).agg(
-        AvgHeartRate=("Value", "mean"),  
-        AvgDailySteps=("TotalSteps", "mean"),
-        AvgDailyCalories=("Calories", "mean"),
-        AvgVeryActiveMinutes=("VeryActiveMinutes", "mean") 
-    ).reset_index()
-
-    daily_summary = daily_summary.merge(user_tracking_days, on="Id", how="left")
-    
-    daily_summary = daily_summary[daily_summary["TrackedDays"] >= 2]
-
-    user_id = st.sidebar.selectbox("Select User ID", daily_summary["Id"].unique())
-    user_data = daily_summary[daily_summary["Id"] == user_id]
-    tracked_days = user_tracking_days[user_tracking_days["Id"] == user_id]["TrackedDays"].values[0]
-
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("Total Unique Individuals", total_users)
-    with col2:
-        st.metric("Tracked Days", tracked_days)
-    with col3:
-        st.metric("Average Heart Rate", round(user_data["AvgHeartRate"].mean(), 2))
-
-    col4, col5, col6 = st.columns(3)
-    with col4:
-        st.metric("Average Daily Steps", round(user_data["AvgDailySteps"].mean(), 2))
-    with col5:
-        st.metric("Average Daily Calories Burnt", round(user_data["AvgDailyCalories"].mean(), 2))
-    with col6:
-        st.metric("Average Daily Very Active Minutes", round(user_data["AvgVeryActiveMinutes"].mean(), 2))
-
-    st.subheader(f"Daily Summary for User {user_id}")
-    st.dataframe(user_data)
-
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.subheader(f"Average Heart Rate Over Time for User {user_id}")
-        fig, ax = plt.subplots()
-        ax.plot(user_data["Date"], user_data["AvgHeartRate"], marker="o", linestyle="-", color="red")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Average Heart Rate")
-        ax.set_title("Daily Average Heart Rate Over Time")
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
 
-    with col2:
-        st.subheader(f"Average Daily Steps Over Time for User {user_id}")
-        fig, ax = plt.subplots()
-        ax.plot(user_data["Date"], user_data["AvgDailySteps"], marker="o", linestyle="-", color="blue")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Average Daily Steps")
-        ax.set_title("Average Daily Steps Over Time")
-        plt.xticks(rotation=45)
+def render_figure(fig):
+    with probe("render: st.pyplot"):
         st.pyplot(fig)
+    plt.close(fig)
 
-    with col1:
-        st.subheader(f"Average Daily Calories Burnt Over Time for User {user_id}")
-        fig, ax = plt.subplots()
-        ax.plot(user_data["Date"], user_data["AvgDailyCalories"], marker="o", linestyle="-", color="green")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Average Daily Calories Burnt")
-        ax.set_title("Average Daily Calories Burnt Over Time")
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
 
-    with col2:
-        st.subheader(f"Average Daily Very Active Minutes Over Time for User {user_id}")
-        fig, ax = plt.subplots()
-        ax.plot(user_data["Date"], user_data["AvgVeryActiveMinutes"], marker="o", linestyle="-", color="purple")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Average Daily Very Active Minutes")
-        ax.set_title("Average Daily Very Active Minutes Over Time")
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+def render_chart(chart):
+    with probe("render: st.altair_chart"):
+        st.altair_chart(chart, use_container_width=True)
 
 
-    # user_id = st.sidebar.selectbox("Select User ID", daily_activity["Id"].unique())
-
-    # user_data = daily_activity[daily_activity["Id"] == user_id]
-    # user_sleep_data = sleep_data[sleep_data["Id"] == user_id]
-    # user_heart_rate_data = heart_rate_data[heart_rate_data["Id"] == user_id]
-    # user_weight_data = weight_data[weight_data["Id"] == user_id]
-
-    # total_steps = user_data["TotalSteps"].sum()
-    # total_calories = user_data["Calories"].sum()
-    # avg_steps = user_data["TotalSteps"].mean()
-    # avg_calories = user_data["Calories"].mean()
-
-    # #avg_resting_heart_rate = user_heart_rate_data["RestingHeartRate"].mean() if not user_heart_rate_data.empty else 0
-    # avg_weight = user_weight_data["WeightKg"].mean() if not user_weight_data.empty else 0
-
-    # col1, col2, col3, col4, col5 = st.columns(5)
-
-    # with col1:
-    #     st.metric("Total Steps", round(total_steps, 2))
-    # with col2:
-    #     st.metric("Total Calories Burnt", round(total_calories, 2))
-    # with col3:
-    #     st.metric("Average Steps Per Day", round(avg_steps, 2))
-    # with col4:
-    #     st.metric("Average Calories Burnt Per Day", round(avg_calories, 2))
-
-    # if avg_weight > 0:
-    #     with col5:
-    #         st.metric("Average Weight (kg)", round(avg_weight, 2))
-
-    # col6, col7 = st.columns(2)
-    # st.subheader(f"Calories Burnt Over Time for User {user_id}")
-    # fig, ax = plt.subplots(figsize=(5,5))
-    # ax.plot(user_data["ActivityDate"], user_data["Calories"], marker="o", linestyle="-", color="red")
-    # ax.set_xlabel("Date")
-    # ax.set_ylabel("Calories Burnt")
-    # ax.set_title("Daily Calories Burnt")
-    # plt.xticks(rotation=45)
-    # with col6:
-    #     st.pyplot(fig)
-
-    # st.subheader(f"Steps Over Time for User {user_id}")
-    # fig, ax = plt.subplots(figsize=(5,5))
-    # ax.plot(user_data["ActivityDate"], user_data["TotalSteps"], marker="o", linestyle="-", color="blue")
-    # ax.set_xlabel("Date")
-    # ax.set_ylabel("Total Steps")
-    # ax.set_title("Daily Steps")
-    # plt.xticks(rotation=45)
-    # with col7:
-    #     st.pyplot(fig)
-
-
-
-
-# =================== Time-based Analysis ===================
-elif page == "⏳ Time-based Analysis":
-    st.title("Time-Based Activity Analysis")
-    
-
-    heart_rate_data = fetch_table_data("heart_rate", use_modified=True)
-    merged_data = fetch_table_data("hourly_intensity", use_modified=True)
-    daily_activity = fetch_table_data("daily_activity", use_modified=True)
-    user_id = st.sidebar.selectbox("Select User ID", daily_activity["Id"].unique())
-
-    start_date = pd.to_datetime("2016-03-12")
-    end_date = pd.to_datetime("2016-09-04")
-
-    selected_date = st.date_input(
-        "Select a Date",
-        value=start_date, 
-        min_value=start_date,
-        max_value=end_date
-    )
-    session = st.text_input("nth session")
-    date = selected_date.strftime("%#m/%#d/%Y")
-
-
-    col8, col9 = st.columns(2)
-    if selected_date:
-        with col8:
-            fig = plot_total_intensity(merged_data, user_id, date)
-            st.pyplot(fig)
-        with col9:
-            if session:
-                fig = plot_heart_rate(heart_rate_data, user_id, date , session)
-                st.pyplot(fig) 
-
-
-# =================== Sleep Analysis ===================
-elif page == "💤 Sleep Analysis":
-    st.title("📈 Sleep Duration Regression Analysis")
-    db_path = "data/fitbit_database_modified.db"
-    conn = connect_to_db(db_path)
-
-    # Load & Merge
-    sleep_df = get_sleep_minutes_per_day(conn)
-    activity_df = get_daily_activity_with_active_minutes(conn)
-    merged_df = prepare_merged_data(sleep_df, activity_df)
-
-    # === Sidebar Filters ===
-    st.sidebar.header("Filter Options")
-    user_ids = merged_df["Id"].unique()
-    selected_id = st.sidebar.selectbox("Select User ID (or view all)", options=["All"] + sorted(user_ids.tolist()))
-
-    activity_options = [
-        "TotalActiveMinutes",
-        "SedentaryMinutes",
-        "VeryActiveMinutes",
-        "FairlyActiveMinutes",
-        "LightlyActiveMinutes"
-    ]
-    selected_predictor = st.sidebar.selectbox("Select Predictor Variable", activity_options)
-
-    # Filter data
-    if selected_id != "All":
-        filtered_df = merged_df[merged_df["Id"] == selected_id]
-    else:
-        filtered_df = merged_df.copy()
-
-    if filtered_df.empty:
-        st.warning("No data available for the selected user.")
-    else:
-        # Run regression
-        X = sm.add_constant(filtered_df[selected_predictor])
-        y = filtered_df["asleep_minutes"]
-        model = sm.OLS(y, X).fit()
-
-        # === Key Regression Metrics ===
-        st.subheader("📋 Key Regression Metrics")
-        r2 = model.rsquared
-        adj_r2 = model.rsquared_adj
-        coef_df = pd.DataFrame({
-            "Predictor": model.params.index,
-            "Coefficient": model.params.values,
-            "P-value": model.pvalues.values
-        }).reset_index(drop=True)
-
-        coef_df = coef_df[coef_df["Predictor"] != "const"]
-        significant = coef_df[coef_df["P-value"] < 0.05]
+# Altair charts get server-side aggregated/decimated data and are drawn in the browser,
+# so pan and zoom do not rerun the script
+use_altair = st.sidebar.radio("Chart backend", ["Matplotlib", "Altair (interactive)"]) == "Altair (interactive)"
 
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("R-squared", f"{r2:.4f}")
-            st.metric("Adjusted R-squared", f"{adj_r2:.4f}")
-        with col2:
-            if not significant.empty:
-                st.success("✅ Significant Predictors:")
-                for _, row in significant.iterrows():
-                    st.write(f"- **{row['Predictor']}**: coef = `{row['Coefficient']:.2f}`, p = `{row['P-value']:.4f}`")
-            else:
-                st.error("No significant predictors (p ≥ 0.05)")
-
-        # === Scatter Plot with Regression Line ===
-        st.subheader(f"📈 Sleep Duration vs {selected_predictor}")
-        fig1, ax1 = plt.subplots()
-        sns.scatterplot(data=filtered_df, x=selected_predictor, y="asleep_minutes", ax=ax1, alpha=0.6)
-        sorted_X = pd.DataFrame({selected_predictor: sorted(filtered_df[selected_predictor]), "const": 1})
-        y_pred = model.predict(sorted_X[["const", selected_predictor]])
-        ax1.plot(sorted_X[selected_predictor], y_pred, color="red", label="Regression Line")
-        ax1.set_xlabel(selected_predictor)
-        ax1.set_ylabel("Minutes Asleep")
-        ax1.set_title(f"Sleep vs {selected_predictor}")
-        ax1.legend()
-        st.pyplot(fig1)
-
-        # === Residual Diagnostics ===
-        st.subheader("🧪 Residual Diagnostics")
-        residuals = model.resid
-        col3, col4 = st.columns(2)
-        with col3:
-            fig2, ax2 = plt.subplots()
-            sns.histplot(residuals, kde=True, bins=30, ax=ax2)
-            ax2.set_title("Histogram of Residuals")
-            st.pyplot(fig2)
-        with col4:
-            fig3 = plt.figure()
-            stats.probplot(residuals, dist="norm", plot=plt)
-            plt.title("Q-Q Plot of Residuals")
-            st.pyplot(fig3)
-
-  
-  
-# =================== Weather & Activity ===================
-elif page == "🌦️ Weather & Activity":
-    #test
-    def load_user_selection():
-        st.sidebar.header("Select Data")
-        user_ids = merged_df["Id"].unique().tolist()
-        user_id = st.sidebar.selectbox("Select User ID", user_ids, index=0)
-        selected_blocks = st.sidebar.multiselect("Select Time Blocks", ["0-4", "4-8", "8-12", "12-16", "16-20", "20-24"], default=["8-12", "12-16", "16-20"])
-        y_variable = st.sidebar.selectbox("Select Target Variable", ["StepTotal", "Calories", "TotalIntensity"], index=0)
-        x_variables = st.sidebar.multiselect("Select Weather Variables", ["temp", "temp_squared", "precip"], default=["temp"])
-        return user_id, selected_blocks, y_variable, x_variables
-
-    def filter_data(user_id, selected_blocks):
-        filtered_df = merged_df[merged_df["TimeBlock"].isin(selected_blocks)]
-        filtered_df["temp_squared"] = filtered_df["temp"] ** 2
-        user_specific_df = filtered_df[filtered_df["Id"] == user_id]
-        return filtered_df, user_specific_df
-
-    def summarize_regression_results(model, y_variable, x_variables):
-        if not x_variables:
-            st.error("No weather variables were selected. Please choose at least one variable for regression analysis.")
-            return
-        
-        r_squared = model.rsquared
-        adj_r_squared = model.rsquared_adj
-        
-        coef_df = pd.DataFrame({
-            "Predictor": model.params.index,
-            "Coefficient": model.params.values,
-            "P-value": model.pvalues.values
-        })
-        coef_df = coef_df[coef_df["Predictor"] != "const"]
-        
-        significant_predictors = coef_df[coef_df["P-value"] < 0.05]
-        
-        st.write(f"Weather Variables Used: {', '.join(x_variables)}")
-        
-        if r_squared < 0.1:
-            st.warning(f"The model has a very low R-squared value ({r_squared:.4f}), indicating that the weather variables do not significantly explain the variance in `{y_variable}`.")
-        else:
-            st.success(f"The model has an R-squared value of {r_squared:.4f}, indicating that the weather variables moderately explain the variance in `{y_variable}`.")
-        
-        if not significant_predictors.empty:
-            significant_vars = ', '.join(significant_predictors['Predictor'].values)
-            st.success(f"Significant Predictors (P-value < 0.05): {significant_vars}.")
-        else:
-            st.error("None of the selected weather variables are statistically significant (P-value ≥ 0.05).")
 
-    def display_general_regression(filtered_df, selected_blocks, y_variable, x_variables):
-        if not x_variables:
-            st.error("No weather variables selected. Please choose at least one variable.")
-            return
+# Preloads the common tables and derived frames in the background, once per server process
+warmup = start_warmup()
+with st.sidebar.expander(f"Cache warm-up ({warmup.progress():.0%})"):
+    st.dataframe(warmup.summary(), hide_index=True)
+
+# Go to the folder where app.py is and then command: streamlit run app.py
+
+try:
+    # =================== Home Page ===================
+    if page == "🏠 Home":
+        st.title("Fitbit Research Dashboard")
+        st.write("This dashboard presents an analysis of Fitbit users' activity, sleep, and other fitness metrics.")
+
+        kpis = load_kpis()
+        total_users = kpis["total_users"]
+        total_days = kpis["total_days"]
+        avg_steps = kpis["avg_steps"]
+        avg_calories = kpis["avg_calories"]
+        avg_active_minutes = kpis["avg_active_minutes"]
 
-        st.subheader("General Regression Analysis With All Users")
-        col1, col2 = st.columns([1, 1])
+        col1, col2, col3, col4, col5 = st.columns(5)
         with col1:
-            print(f"run_regression function source: {run_regression.__module__}")
-            model = run_weather_regression_(filtered_df, y_variable=y_variable, x_variables=x_variables, selected_blocks=selected_blocks)
-            if model:
-                summarize_regression_results(model, y_variable, x_variables)
+            st.metric("Total Users", total_users)
         with col2:
-            for x_variable in x_variables:
-                fig1 = plot_general_weather_analysis(filtered_df, y_variable=y_variable, x_variable=x_variable, selected_blocks=selected_blocks)
-                if fig1:
-                    st.pyplot(fig1)
+            st.metric("Total Number of Days Recorded", total_days)
+        with col3:
+            st.metric("Average Steps Per Day", round(avg_steps, 2))
+        with col4:
+            st.metric("Average Calories Burnt Per Day", round(avg_calories, 2))
+        with col5:
+            st.metric("Average Active Minutes Per Day", round(avg_active_minutes, 2))
 
+        col6, col7 = st.columns(2)
 
-    def display_user_specific_analysis(user_specific_df, user_id, selected_blocks, y_variable, x_variables):
-        st.subheader(f"User-Specific Regression Analysis for User {user_id}")
-        col1, col2 = st.columns([1, 1])
+        with col6:
+            if use_altair:
+                render_chart(activity_sums_chart(kpis["activity_minutes"]))
+            else:
+                render_figure(plot_activity_sums(kpis["activity_minutes"]))
+        with col7:
+            if use_altair:
+                render_chart(sleep_duration_bins_chart(*kpis["sleep_histogram"]))
+            else:
+                render_figure(plot_sleep_duration_bins(*kpis["sleep_histogram"]))
+
+
+    # =================== Database Management ===================
+    elif page == "🔧 Database Management":
+        st.title("Database Management")
+
+        tables = get_table_names(use_modified=True)
+        st.subheader("Tables in Database")
+        st.write(tables)
+
+        table_name = st.selectbox("Select Table", tables)
+        columns = get_column_names(table_name, use_modified=True)
+        st.metric("Approximate Number of Rows", f"{approximate_row_count(table_name, use_modified=True):,}")
+
+        # === Filters & Sorting (run in SQL, only one page is loaded) ===
+        with st.expander("Filter & Sort"):
+            filter_col1, filter_col2, filter_col3 = st.columns(3)
+            with filter_col1:
+                filter_column = st.selectbox("Filter Column", ["(none)"] + columns)
+            with filter_col2:
+                filter_operator = st.selectbox("Operator", list(FILTER_OPERATORS.keys()))
+            with filter_col3:
+                filter_value = st.text_input("Value")
+            sort_col1, sort_col2, sort_col3 = st.columns(3)
+            with sort_col1:
+                sort_column = st.selectbox("Sort By", ["(row order)"] + columns,
+                                           help="The first sort on a column creates an index on it, so every page is read from the index.")
+            with sort_col2:
+                descending = st.checkbox("Descending")
+            with sort_col3:
+                page_size = st.selectbox("Rows per Page", [50, 100, 500, 1000], index=1)
+
+        filters = []
+        if filter_column != "(none)" and (filter_value or "null" in filter_operator):
+            value = parse_filter_value(filter_value) if filter_operator != "contains" else filter_value
+            filters.append((filter_column, filter_operator, value))
+        sort_column = None if sort_column == "(row order)" else sort_column
+
+        # The cursors of the pages seen so far, reset whenever the query changes
+        browse_key = (table_name, tuple(filters), sort_column, descending, page_size)
+        if st.session_state.get("browse_key") != browse_key:
+            st.session_state["browse_key"] = browse_key
+            st.session_state["browse_cursors"] = [None]
+        cursors = st.session_state["browse_cursors"]
+
+        try:
+            table_data, next_cursor = fetch_page(table_name, page_size=page_size, after=cursors[-1], sort_column=sort_column,
+                                                 descending=descending, filters=filters, use_modified=True)
+        except Exception as e:
+            st.error(f"Could not load {table_name}: {e}")
+            table_data, next_cursor = pd.DataFrame(), None
+
+        st.subheader(f"Data from {table_name} (page {len(cursors)})")
+        st.dataframe(table_data)
+
+        nav_col1, nav_col2 = st.columns(2)
+        with nav_col1:
+            if st.button("⬅️ Previous Page", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with nav_col2:
+            if st.button("Next Page ➡️", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+
+        # === Column Summary (computed only when asked for) ===
+        summary_column = st.selectbox("Summarize Column", columns)
+        if st.button("Compute Summary"):
+            st.dataframe(column_summary(table_name, summary_column, filters=filters, use_modified=True).to_frame("Value"))
+
+        st.info("Data modification is disabled. You can view data but cannot edit or save changes.")
+
+    # =================== User Statistics ===================
+
+    elif page == "📊 User Statistics":
+        st.title("User Activity Analysis")
+
+        total_users = len(load_user_list("merged_heart_rate_activity"))
+
+        user_id = st.sidebar.selectbox("Select User ID", load_user_list("merged_heart_rate_activity", min_days=2))
+        start_date = pd.to_datetime("2016-03-12")
+        end_date = pd.to_datetime("2016-09-04")
+        date_range = st.sidebar.date_input("Date Range", value=(start_date, end_date), min_value=start_date, max_value=end_date)
+        if len(date_range) == 2:
+            start_date, end_date = date_range
+
+        # Only the selected user's rows in the date range are read from the database
+        merged_data = load_user_slice(user_id, start_date, end_date, tables=["merged_heart_rate_activity"])["merged_heart_rate_activity"]
+        merged_data = merged_data.assign(Date=pd.to_datetime(merged_data["Date"]).dt.date)
+        user_data = merged_data.groupby(["Id", "Date"]).agg(
+            AvgHeartRate=("Value", "mean"),
+            AvgDailySteps=("TotalSteps", "mean"),
+            AvgDailyCalories=("Calories", "mean"),
+            AvgVeryActiveMinutes=("VeryActiveMinutes", "mean")
+        ).reset_index()
+        tracked_days = len(user_data)
+        user_data["TrackedDays"] = tracked_days
+
+        col1, col2, col3 = st.columns(3)
         with col1:
-            print(f"run_regression function source: {run_regression.__module__}")
-            model = run_weather_regression_(user_specific_df, y_variable=y_variable, x_variables=x_variables, selected_blocks=selected_blocks)
-            if model:
-                summarize_regression_results(model, y_variable, x_variables)
+            st.metric("Total Unique Individuals", total_users)
         with col2:
-            for x_variable in x_variables:
-                fig2 = plot_user_weather_analysis(user_specific_df, user_id=user_id, y_variable=y_variable, x_variable=x_variable, selected_blocks=selected_blocks)
-                if fig2:
-                    st.pyplot(fig2)
-
-    def main():
-        st.title("Weather Impact on Activity")
-        user_id, selected_blocks, y_variable, x_variables = load_user_selection()
-        
-        filtered_df, user_specific_df = filter_data(user_id, selected_blocks)
-        if filtered_df.empty:
-            st.warning(f"No data found in selected time blocks.")
-        else:
-            display_general_regression(filtered_df, selected_blocks, y_variable, x_variables)
-            st.markdown("---")
-            display_user_specific_analysis(user_specific_df, user_id, selected_blocks, y_variable, x_variables)
+            st.metric("Tracked Days", tracked_days)
+        with col3:
+            st.metric("Average Heart Rate", round(user_data["AvgHeartRate"].mean(), 2))
 
-    if __name__ == "__main__":
-        main()
+        col4, col5, col6 = st.columns(3)
+        with col4:
+            st.metric("Average Daily Steps", round(user_data["AvgDailySteps"].mean(), 2))
+        with col5:
+            st.metric("Average Daily Calories Burnt", round(user_data["AvgDailyCalories"].mean(), 2))
+        with col6:
+            st.metric("Average Daily Very Active Minutes", round(user_data["AvgVeryActiveMinutes"].mean(), 2))
 
+        st.subheader(f"Daily Summary for User {user_id}")
+        st.dataframe(user_data)
 
 
+        col1, col2 = st.columns(2)
+        daily_charts = [
+            ("AvgHeartRate", "Average Heart Rate", "Daily Average Heart Rate Over Time", "red"),
+            ("AvgDailySteps", "Average Daily Steps", "Average Daily Steps Over Time", "blue"),
+            ("AvgDailyCalories", "Average Daily Calories Burnt", "Average Daily Calories Burnt Over Time", "green"),
+            ("AvgVeryActiveMinutes", "Average Daily Very Active Minutes", "Average Daily Very Active Minutes Over Time", "purple"),
+        ]
+        for i, (column, label, title, color) in enumerate(daily_charts):
+            with (col1 if i % 2 == 0 else col2):
+                st.subheader(f"{label} Over Time for User {user_id}")
+                if use_altair:
+                    render_chart(daily_line_chart(user_data, "Date", column, title, y_title=label, color=color))
+                    continue
+                fig, ax = plt.subplots()
+                ax.plot(user_data["Date"], user_data[column], marker="o", linestyle="-", color=color)
+                ax.set_xlabel("Date")
+                ax.set_ylabel(label)
+                ax.set_title(title)
+                plt.xticks(rotation=45)
+                render_figure(fig)
+
+        # Resting heart rate and zone minutes per day, precomputed from the samples by heart_rate_zones.py
+        daily_heart_rate = load_user_slice(user_id, start_date, end_date, tables=["daily_heart_rate"])["daily_heart_rate"]
+        st.subheader(f"Heart Rate Zones for User {user_id}")
+        if daily_heart_rate.empty:
+            st.info("No daily heart rate data. Run scripts/heart_rate_zones.py to compute it.")
+        else:
+            daily_heart_rate = daily_heart_rate.assign(Date=pd.to_datetime(daily_heart_rate["Date"], format="%m/%d/%Y").dt.date).sort_values("Date")
+            zone_columns = [f"{zone}Minutes" for zone in ZONES]
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Average Resting Heart Rate", round(daily_heart_rate["RestingHR"].mean(), 2))
+            with col2:
+                st.metric("Highest Peak Heart Rate", round(daily_heart_rate["PeakHR"].max(), 2))
+            with col3:
+                st.metric("Average Daily Minutes in Zones", round(daily_heart_rate[zone_columns[1:]].sum(axis=1).mean(), 2))
+            st.dataframe(daily_heart_rate)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if use_altair:
+                    render_chart(daily_line_chart(daily_heart_rate, "Date", "RestingHR", "Resting Heart Rate Over Time",
+                                                  y_title="Resting Heart Rate (bpm)", color="red"))
+                else:
+                    fig, ax = plt.subplots()
+                    ax.plot(daily_heart_rate["Date"], daily_heart_rate["RestingHR"], marker="o", linestyle="-", color="red")
+                    ax.set_xlabel("Date")
+                    ax.set_ylabel("Resting Heart Rate (bpm)")
+                    ax.set_title("Resting Heart Rate Over Time")
+                    plt.xticks(rotation=45)
+                    render_figure(fig)
+            with col2:
+                if use_altair:
+                    render_chart(heart_rate_zones_chart(daily_heart_rate, ZONES, "Minutes per Heart Rate Zone"))
+                else:
+                    fig, ax = plt.subplots()
+                    daily_heart_rate.set_index("Date")[zone_columns].rename(columns=dict(zip(zone_columns, ZONES))).plot(
+                        kind="bar", stacked=True, ax=ax, color=["#cccccc", "#ffcc66", "#ff9933", "#cc3333"])
+                    ax.set_xlabel("Date")
+                    ax.set_ylabel("Minutes")
+                    ax.set_title("Minutes per Heart Rate Zone")
+                    plt.xticks(rotation=45)
+                    render_figure(fig)
+
+
+        # user_id = st.sidebar.selectbox("Select User ID", daily_activity["Id"].unique())
+
+        # user_data = daily_activity[daily_activity["Id"] == user_id]
+        # user_sleep_data = sleep_data[sleep_data["Id"] == user_id]
+        # user_heart_rate_data = heart_rate_data[heart_rate_data["Id"] == user_id]
+        # user_weight_data = weight_data[weight_data["Id"] == user_id]
+
+        # total_steps = user_data["TotalSteps"].sum()
+        # total_calories = user_data["Calories"].sum()
+        # avg_steps = user_data["TotalSteps"].mean()
+        # avg_calories = user_data["Calories"].mean()
+
+        # #avg_resting_heart_rate = user_heart_rate_data["RestingHeartRate"].mean() if not user_heart_rate_data.empty else 0
+        # avg_weight = user_weight_data["WeightKg"].mean() if not user_weight_data.empty else 0
+
+        # col1, col2, col3, col4, col5 = st.columns(5)
+
+        # with col1:
+        #     st.metric("Total Steps", round(total_steps, 2))
+        # with col2:
+        #     st.metric("Total Calories Burnt", round(total_calories, 2))
+        # with col3:
+        #     st.metric("Average Steps Per Day", round(avg_steps, 2))
+        # with col4:
+        #     st.metric("Average Calories Burnt Per Day", round(avg_calories, 2))
+
+        # if avg_weight > 0:
+        #     with col5:
+        #         st.metric("Average Weight (kg)", round(avg_weight, 2))
+
+        # col6, col7 = st.columns(2)
+        # st.subheader(f"Calories Burnt Over Time for User {user_id}")
+        # fig, ax = plt.subplots(figsize=(5,5))
+        # ax.plot(user_data["ActivityDate"], user_data["Calories"], marker="o", linestyle="-", color="red")
+        # ax.set_xlabel("Date")
+        # ax.set_ylabel("Calories Burnt")
+        # ax.set_title("Daily Calories Burnt")
+        # plt.xticks(rotation=45)
+        # with col6:
+        #     st.pyplot(fig)
+
+        # st.subheader(f"Steps Over Time for User {user_id}")
+        # fig, ax = plt.subplots(figsize=(5,5))
+        # ax.plot(user_data["ActivityDate"], user_data["TotalSteps"], marker="o", linestyle="-", color="blue")
+        # ax.set_xlabel("Date")
+        # ax.set_ylabel("Total Steps")
+        # ax.set_title("Daily Steps")
+        # plt.xticks(rotation=45)
+        # with col7:
+        #     st.pyplot(fig)
+
+
+
+
+    # =================== Time-based Analysis ===================
+    elif page == "⏳ Time-based Analysis":
+        st.title("Time-Based Activity Analysis")
+
+
+        user_id = st.sidebar.selectbox("Select User ID", load_user_list("daily_activity"))
+
+        start_date = pd.to_datetime("2016-03-12")
+        end_date = pd.to_datetime("2016-09-04")
+
+        selected_date = st.date_input(
+            "Select a Date",
+            value=start_date, 
+            min_value=start_date,
+            max_value=end_date
+        )
+        session = st.text_input("nth session")
+        date = selected_date.strftime("%#m/%#d/%Y")
+
+
+        # Only the selected user's rows for the selected day are read from the database
+        user_slice = load_user_slice(user_id, selected_date, selected_date, tables=["heart_rate", "hourly_intensity"])
+        prefetch_adjacent_days(warmup, user_id, selected_date, ["heart_rate", "hourly_intensity"])
+        heart_rate_data = user_slice["heart_rate"]
+        merged_data = user_slice["hourly_intensity"]
+
+        col8, col9 = st.columns(2)
+        if selected_date:
+            with col8:
+                if use_altair:
+                    render_chart(total_intensity_chart(merged_data, user_id, date))
+                else:
+                    fig = plot_total_intensity(merged_data, user_id, date)
+                    render_figure(fig)
+            with col9:
+                if session:
+                    if use_altair:
+                        render_chart(heart_rate_chart(heart_rate_data, user_id, date, session))
+                    else:
+                        fig = plot_heart_rate(heart_rate_data, user_id, date , session)
+                        render_figure(fig) 
+
+
+    # =================== Sleep Analysis ===================
+    elif page == "💤 Sleep Analysis":
+        st.title("📈 Sleep Duration Regression Analysis")
+        # Load & Merge (cached until minute_sleep or daily_activity change)
+        merged_df = load_sleep_activity_frame()
+
+        # === Sidebar Filters ===
+        st.sidebar.header("Filter Options")
+        user_ids = merged_df["Id"].unique()
+        selected_id = st.sidebar.selectbox("Select User ID (or view all)", options=["All"] + sorted(user_ids.tolist()))
+
+        activity_options = [
+            "TotalActiveMinutes",
+            "SedentaryMinutes",
+            "VeryActiveMinutes",
+            "FairlyActiveMinutes",
+            "LightlyActiveMinutes"
+        ]
+        selected_predictor = st.sidebar.selectbox("Select Predictor Variable", activity_options)
+
+        # Filter data
+        if selected_id != "All":
+            filtered_df = merged_df[merged_df["Id"] == selected_id]
+        else:
+            filtered_df = merged_df.copy()
 
+        if filtered_df.empty:
+            st.warning("No data available for the selected user.")
+        else:
+            # Run regression, or reuse the stored results for the same tables, user and predictor
+            X = sm.add_constant(filtered_df[selected_predictor])
+            y = filtered_df["asleep_minutes"]
+            table_versions = {table: get_table_version(table, use_modified=True) for table in ["minute_sleep", "daily_activity"]}
+            model = registered_fit(lambda: sm.OLS(y, X).fit(), "asleep_minutes", [selected_predictor],
+                                   table_versions=table_versions, filter_spec={"Id": selected_id})
+
+            # === Key Regression Metrics ===
+            st.subheader("📋 Key Regression Metrics")
+            r2 = model.rsquared
+            adj_r2 = model.rsquared_adj
+            coef_df = pd.DataFrame({
+                "Predictor": model.params.index,
+                "Coefficient": model.params.values,
+                "P-value": model.pvalues.values
+            }).reset_index(drop=True)
+
+            coef_df = coef_df[coef_df["Predictor"] != "const"]
+            significant = coef_df[coef_df["P-value"] < 0.05]
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("R-squared", f"{r2:.4f}")
+                st.metric("Adjusted R-squared", f"{adj_r2:.4f}")
+            with col2:
+                if not significant.empty:
+                    st.success("✅ Significant Predictors:")
+                    for _, row in significant.iterrows():
+                        st.write(f"- **{row['Predictor']}**: coef = `{row['Coefficient']:.2f}`, p = `{row['P-value']:.4f}`")
+                else:
+                    st.error("No significant predictors (p ≥ 0.05)")
+
+            # === Resampling-Based Inference ===
+            if st.sidebar.checkbox("Bootstrap & permutation p-values"):
+                # Resample whole users when all users are shown, otherwise whole days. The permutation
+                # test shuffles within users; a single user's days are shuffled among each other.
+                cluster_column = "Id" if selected_id == "All" else "Date"
+                strata_column = "Id" if selected_id == "All" else None
+                st.subheader(f"🔁 Cluster Bootstrap and Permutation Test (resampled by {cluster_column})")
+                st.dataframe(resampling_summary(filtered_df, "asleep_minutes", [selected_predictor], cluster_column=cluster_column,
+                                                strata_column=strata_column, n_workers=1))
+
+            # === Scatter Plot with Regression Line ===
+            st.subheader(f"📈 Sleep Duration vs {selected_predictor}")
+            if use_altair:
+                render_chart(regression_scatter_chart(filtered_df, selected_predictor, "asleep_minutes", model, f"Sleep vs {selected_predictor}"))
+            else:
+                fig1, ax1 = plt.subplots()
+                sns.scatterplot(data=filtered_df, x=selected_predictor, y="asleep_minutes", ax=ax1, alpha=0.6)
+                sorted_X = pd.DataFrame({selected_predictor: sorted(filtered_df[selected_predictor]), "const": 1})
+                y_pred = model.predict(sorted_X[["const", selected_predictor]])
+                ax1.plot(sorted_X[selected_predictor], y_pred, color="red", label="Regression Line")
+                ax1.set_xlabel(selected_predictor)
+                ax1.set_ylabel("Minutes Asleep")
+                ax1.set_title(f"Sleep vs {selected_predictor}")
+                ax1.legend()
+                render_figure(fig1)
+
+            # === Residual Diagnostics ===
+            st.subheader("🧪 Residual Diagnostics")
+            residuals = y - model.predict(X)
+            col3, col4 = st.columns(2)
+            with col3:
+                if use_altair:
+                    render_chart(residual_histogram_chart(residuals))
+                else:
+                    fig2, ax2 = plt.subplots()
+                    sns.histplot(residuals, kde=True, bins=30, ax=ax2)
+                    ax2.set_title("Histogram of Residuals")
+                    render_figure(fig2)
+            with col4:
+                if use_altair:
+                    render_chart(qq_chart(residuals))
+                else:
+                    fig3 = plt.figure()
+                    stats.probplot(residuals, dist="norm", plot=plt)
+                    plt.title("Q-Q Plot of Residuals")
+                    render_figure(fig3)
+
+            # === Per-User Regressions ===
+            with st.expander(f"👥 Per-User Regressions on {selected_predictor}"):
+                per_user = fit_grouped_ols(merged_df, "asleep_minutes", [selected_predictor], group_columns=["Id"])
+                per_user = per_user[per_user["Predictor"] != "const"].drop(columns=["Predictor"])
+                st.dataframe(per_user.sort_values("P-value"))
+
+        # === Heart Rate During Sleep ===
+        # Per sleep log, precomputed from the sleep minutes and heart rate samples by sleep_heart_rate.py
+        st.subheader("❤️ Heart Rate During Sleep")
+        if selected_id != "All":
+            episodes = load_user_slice(selected_id, tables=["sleep_episodes"])["sleep_episodes"]
+        else:
+            episodes = load_table("sleep_episodes") if "sleep_episodes" in get_table_names(use_modified=True) else pd.DataFrame()
+        if episodes.empty or not (episodes["MinutesWithHR"] > 0).any():
+            st.info("No heart rate during sleep for this selection. Run scripts/sleep_heart_rate.py to compute it.")
+        else:
+            episodes = episodes[episodes["MinutesWithHR"] > 0]
+            col5, col6, col7 = st.columns(3)
+            with col5:
+                st.metric("Average Sleeping Heart Rate", round(episodes["SleepingHR"].mean(), 2))
+            with col6:
+                st.metric("Average Lowest Heart Rate", round(episodes["LowestHR"].mean(), 2))
+            with col7:
+                st.metric("Average Heart Rate Dip", round(episodes["HRDip"].mean(), 2))
+            state_columns = ["SleepingHR", "RestlessHR", "AwakeHR"]
+            if selected_id != "All":
+                st.dataframe(episodes.sort_values("Start"), hide_index=True)
+            else:
+                st.dataframe(episodes.groupby("Id")[state_columns + ["LowestHR", "HRDip"]].mean())
+            state_means = episodes[state_columns].mean().rename(lambda column: column.removesuffix("HR").replace("Sleeping", "Asleep"))
+            if use_altair:
+                render_chart(sleep_state_heart_rate_chart(state_means))
+            else:
+                fig4, ax4 = plt.subplots()
+                ax4.bar(state_means.index, state_means.to_numpy(), color=["#3366cc", "#ff9933", "#cc3333"])
+                ax4.set_xlabel("Sleep State")
+                ax4.set_ylabel("Mean Heart Rate (bpm)")
+                ax4.set_title("Heart Rate by Sleep State")
+                render_figure(fig4)
+
+
+
+    # =================== Weather & Activity ===================
+    elif page == "🌦️ Weather & Activity":
+        # Imported here so the other pages do not wait for the weather frame, which the warm-up builds in the background
+        from scripts.weather_analysis import (
+            merged_df,
+            weather_statistics,
+            weather_cube,
+            WEATHER_PREDICTORS,
+            run_weather_regression_from_statistics,
+            bootstrap_weather_regression_from_statistics,
+            plot_general_weather_analysis,
+            plot_user_weather_analysis,
+            weather_daily_averages
+        )
 
+        #test
+        def load_user_selection():
+            st.sidebar.header("Select Data")
+            user_ids = merged_df["Id"].unique().tolist()
+            user_id = st.sidebar.selectbox("Select User ID", user_ids, index=0)
+            selected_blocks = st.sidebar.multiselect("Select Time Blocks", ["0-4", "4-8", "8-12", "12-16", "16-20", "20-24"], default=["8-12", "12-16", "16-20"])
+            y_variable = st.sidebar.selectbox("Select Target Variable", ["StepTotal", "Calories", "TotalIntensity"], index=0)
+            x_variables = st.sidebar.multiselect("Select Weather Variables", WEATHER_PREDICTORS, default=["temp"])
+            st.session_state["weather_bootstrap"] = st.sidebar.checkbox("Bootstrap confidence intervals (by user)")
+            return user_id, selected_blocks, y_variable, x_variables
+
+        def filter_data(user_id, selected_blocks):
+            return load_weather_slices(weather_cube, selected_blocks, user_id)
+
+        def summarize_regression_results(model, y_variable, x_variables):
+            if not x_variables:
+                st.error("No weather variables were selected. Please choose at least one variable for regression analysis.")
+                return
+
+            r_squared = model.rsquared
+            adj_r_squared = model.rsquared_adj
+
+            coef_df = pd.DataFrame({
+                "Predictor": model.params.index,
+                "Coefficient": model.params.values,
+                "P-value": model.pvalues.values
+            })
+            coef_df = coef_df[coef_df["Predictor"] != "const"]
+
+            significant_predictors = coef_df[coef_df["P-value"] < 0.05]
+
+            st.write(f"Weather Variables Used: {', '.join(x_variables)}")
+
+            if r_squared < 0.1:
+                st.warning(f"The model has a very low R-squared value ({r_squared:.4f}), indicating that the weather variables do not significantly explain the variance in `{y_variable}`.")
+            else:
+                st.success(f"The model has an R-squared value of {r_squared:.4f}, indicating that the weather variables moderately explain the variance in `{y_variable}`.")
 
+            if not significant_predictors.empty:
+                significant_vars = ', '.join(significant_predictors['Predictor'].values)
+                st.success(f"Significant Predictors (P-value < 0.05): {significant_vars}.")
+            else:
+                st.error("None of the selected weather variables are statistically significant (P-value ≥ 0.05).")
+
+        def display_general_regression(filtered_cube, selected_blocks, y_variable, x_variables):
+            if not x_variables:
+                st.error("No weather variables selected. Please choose at least one variable.")
+                return
+
+            st.subheader("General Regression Analysis With All Users")
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                model = run_weather_regression_from_statistics(weather_statistics, y_variable=y_variable, x_variables=x_variables, selected_blocks=selected_blocks)
+                if model:
+                    summarize_regression_results(model, y_variable, x_variables)
+                if model and st.session_state.get("weather_bootstrap"):
+                    st.write("Cluster bootstrap by user (95% percentile intervals):")
+                    st.dataframe(bootstrap_weather_regression_from_statistics(weather_statistics, y_variable=y_variable, x_variables=x_variables, selected_blocks=selected_blocks))
+            with col2:
+                for x_variable in x_variables:
+                    if use_altair:
+                        daily_avg = weather_daily_averages(filtered_cube, y_variable, x_variable, selected_blocks)
+                        title = f"Avg {y_variable} (Bar) vs. {x_variable} (Line) Across All Users (Time Blocks: {', '.join(selected_blocks)})"
+                        render_chart(weather_chart(daily_avg, y_variable, x_variable, title))
+                        continue
+                    fig1 = plot_general_weather_analysis(filtered_cube, y_variable=y_variable, x_variable=x_variable, selected_blocks=selected_blocks)
+                    if fig1:
+                        render_figure(fig1)
+
+
+        def display_user_specific_analysis(user_specific_cube, user_id, selected_blocks, y_variable, x_variables):
+            st.subheader(f"User-Specific Regression Analysis for User {user_id}")
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                model = run_weather_regression_from_statistics(weather_statistics, y_variable=y_variable, x_variables=x_variables, selected_blocks=selected_blocks, user_id=user_id)
+                if model:
+                    summarize_regression_results(model, y_variable, x_variables)
+            with col2:
+                for x_variable in x_variables:
+                    if use_altair:
+                        daily_avg = weather_daily_averages(user_specific_cube, y_variable, x_variable, selected_blocks, user_id=user_id)
+                        if not daily_avg.empty:
+                            title = f"Avg {y_variable} (Bar) vs. {x_variable} (Line) for User {user_id} (Time Blocks: {', '.join(selected_blocks)})"
+                            render_chart(weather_chart(daily_avg, y_variable, x_variable, title))
+                        continue
+                    fig2 = plot_user_weather_analysis(user_specific_cube, user_id=user_id, y_variable=y_variable, x_variable=x_variable, selected_blocks=selected_blocks)
+                    if fig2:
+                        render_figure(fig2)
+
+        def main():
+            st.title("Weather Impact on Activity")
+            user_id, selected_blocks, y_variable, x_variables = load_user_selection()
+
+            filtered_cube, user_specific_cube = filter_data(user_id, selected_blocks)
+            if filtered_cube.empty:
+                st.warning(f"No data found in selected time blocks.")
+            else:
+                display_general_regression(filtered_cube, selected_blocks, y_variable, x_variables)
+                st.markdown("---")
+                display_user_specific_analysis(user_specific_cube, user_id, selected_blocks, y_variable, x_variables)
+
+        if __name__ == "__main__":
+            main()
+finally:
+    # Also when the page raises or calls st.rerun()/st.stop(), which end the script with an
+    # exception, so the run is logged and stops tracing memory
+    perf_record = finish_run()
+
+
+# =================== Performance Panel ===================
+if show_perf_panel and perf_record is not None:
+    with st.sidebar.expander("Performance", expanded=True):
+        st.metric("Page run time (s)", round(perf_record["total_seconds"], 3))
+        if "peak_memory_kb" in perf_record:
+            st.metric("Peak traced memory (MB)", round(perf_record["peak_memory_kb"] / 1024, 1))
+        st.caption("Stages of this rerun (cached loads only show up on a cache miss)")
+        st.dataframe(stages_frame(perf_record), hide_index=True)
+        st.caption("Run time per page from the performance log")
+        st.dataframe(latency_percentiles(), hide_index=True)
+        if "profile" in perf_record:
+            st.text(perf_record["profile"])
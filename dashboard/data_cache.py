@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from scripts.database_queries import get_table_version, get_tables_version
+from scripts.storage_backends import get_backend
+from scripts.sleep_analysis_2 import get_sleep_minutes_per_day, get_daily_activity_with_active_minutes, prepare_merged_data
+from scripts.activity_cube import slice_cube
+from scripts.kpi_summary import load_kpi_summary, ACTIVITY_MINUTE_COLUMNS, SUMMARY_TABLE
+from scripts.user_slices import list_users, get_user_slice, USER_TABLES
+from scripts.arrow_store import load_frame
+
+# Streamlit reruns app.py on every widget interaction. Everything below is cached
+# across reruns and sessions and keyed on a cheap version token of the tables
+# (see get_table_version), so a write to the database invalidates the entries.
+#
+# Frames returned by load_table are shared between all sessions and memory-mapped
+# (see arrow_store): treat them as read-only.
+
+
+# =================== Shared Resources ===================
+@st.cache_resource
+def get_connection(use_modified=True):
+    # The configured storage backend (SQLite file or Parquet dataset)
+    return get_backend(use_modified)
+
+
+@st.cache_resource(max_entries=12, show_spinner="Loading table...")
+def _load_table(table_name, use_modified, version):
+    # Backed by the memory-mapped Arrow store, so the frame is a read-only view
+    return load_frame(table_name, use_modified=use_modified)
+
+
+def load_table(table_name, use_modified=True):
+    return _load_table(table_name, use_modified, get_table_version(table_name, use_modified=use_modified))
+
+
+# =================== Derived Frames ===================
+@st.cache_data(max_entries=2, show_spinner=False)
+def _kpis(version):
+    kpis = load_kpi_summary(use_modified=True)
+    if kpis is not None:
+        return kpis
+
+    # The pipeline has not built _kpi_summary yet, so compute the values from the tables
+    daily_activity = load_table("daily_activity")
+    total_active = daily_activity["VeryActiveMinutes"] + daily_activity["FairlyActiveMinutes"] + daily_activity["LightlyActiveMinutes"]
+    minute_sleep = load_table("minute_sleep")
+    sleep_datetime = pd.to_datetime(
+        minute_sleep["Date"] + " " + minute_sleep["Time"] + " " + minute_sleep["TimeOfDay"],
+        format="%m/%d/%Y %I:%M:%S %p"
+    )
+    sleep_bounds = sleep_datetime.groupby(minute_sleep["logId"]).agg(["min", "max"])
+    durations = (sleep_bounds["max"] - sleep_bounds["min"]).dt.total_seconds() / 3600
+    counts, edges = np.histogram(durations, bins=20)
+    return {
+        "total_users": daily_activity["Id"].nunique(),
+        "total_days": daily_activity["ActivityDate"].nunique(),
+        "avg_steps": daily_activity["TotalSteps"].mean(),
+        "avg_calories": daily_activity["Calories"].mean(),
+        "avg_active_minutes": total_active.mean(),
+        "total_calories": daily_activity["Calories"].sum(),
+        "total_active_minutes": total_active.sum(),
+        "activity_minutes": daily_activity[ACTIVITY_MINUTE_COLUMNS].sum(),
+        "sleep_histogram": (counts, edges),
+    }
+
+
+def load_kpis():
+    """
+    The Home page values, read from the _kpi_summary table the wrangling pipeline builds.
+    """
+    return _kpis(get_tables_version([SUMMARY_TABLE, "daily_activity", "minute_sleep"], use_modified=True))
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _sleep_activity_frame(version):
+    conn = get_connection(use_modified=True)
+    sleep_df = get_sleep_minutes_per_day(conn)
+    activity_df = get_daily_activity_with_active_minutes(conn)
+    return prepare_merged_data(sleep_df, activity_df)
+
+
+def load_sleep_activity_frame():
+    """
+    The daily sleep minutes merged with daily activity, as used by the Sleep Analysis page.
+    """
+    return _sleep_activity_frame(get_tables_version(["minute_sleep", "daily_activity"], use_modified=True))
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _user_list(table_name, min_days, version):
+    return list_users(table_name, min_days=min_days, use_modified=True)
+
+
+def load_user_list(table_name="daily_activity", min_days=None):
+    """
+    The distinct user Ids of a table, from a query on its Id index instead of the loaded table.
+    """
+    return _user_list(table_name, min_days, get_table_version(table_name, use_modified=True))
+
+
+def load_user_slice(user_id, start_date=None, end_date=None, tables=None):
+    """
+    The rows of one user (and date range) from the per-user tables, see user_slices.USER_TABLES.
+    The most recently viewed users are kept in a small LRU, so memory does not grow
+    with the number of users.
+    """
+    return get_user_slice(user_id, start_date, end_date, tables=tables,
+                          version=get_tables_version(tables or USER_TABLES, use_modified=True), use_modified=True)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _weather_slices(_cube, version, selected_blocks, user_id):
+    filtered_cube = slice_cube(_cube, selected_blocks=list(selected_blocks))
+    return filtered_cube, slice_cube(filtered_cube, user_id=user_id)
+
+
+def load_weather_slices(cube, selected_blocks, user_id):
+    """
+    The weather cube cells for the selected time blocks, for all users and for one user.
+    """
+    version = get_table_version("hourly_steps", use_modified=True)
+    return _weather_slices(cube, version, tuple(selected_blocks), user_id)
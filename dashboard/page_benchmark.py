@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts"))
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Headless benchmark of the dashboard pages with streamlit's AppTest. Every page gets a
+# cold run (Streamlit caches cleared), a warm rerun and the interactions below, each
+# timed, with the peak RSS of the process and the table loads of the rerun (the "sql:"
+# stages of any thread, see perf_probes.table_loads). The warm-up is turned off, so every
+# load happens in the run that needs it, and the cold run also reimports weather_analysis,
+# which loads its data on import. A page fails when it raises or exceeds its budget:
+#   python dashboard/page_benchmark.py
+#   python dashboard/page_benchmark.py --db data/synthetic/fitbit_10x_31d_seed0.db --budgets budgets.json
+# The app runs in this process, so FITBIT_* environment variables are set before it is imported.
+
+PAGES = ["🏠 Home", "📊 User Statistics", "⏳ Time-based Analysis", "💤 Sleep Analysis",
+         "🌦️ Weather & Activity", "🔧 Database Management"]
+
+# Limits per run: seconds, peak_rss_mb and table_loads for the cold run, the warm rerun
+# and each interaction. A page missing from a budgets file uses DEFAULT_BUDGET.
+DEFAULT_BUDGET = {
+    "cold": {"seconds": 15.0, "peak_rss_mb": 2048, "table_loads": 20},
+    "warm": {"seconds": 5.0, "peak_rss_mb": 2048, "table_loads": 2},
+    "interaction": {"seconds": 8.0, "peak_rss_mb": 2048, "table_loads": 10},
+}
+
+
+def _widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled '{label}'")
+
+
+def _next_option(at, label):
+    # Selects the option after the current one, so the interaction changes something
+    box = _widget(list(at.sidebar.selectbox) + list(at.main.selectbox), label)
+    options = list(box.options)
+    if len(options) > 1:
+        box.select_index((options.index(str(box.value)) + 1) % len(options) if str(box.value) in options else 1)
+    return box
+
+
+def _click(at, label):
+    button = _widget(at.button, label)
+    if not button.disabled:
+        button.click()
+
+
+# Typical widget interactions per page: (name, function that changes widgets on the AppTest)
+INTERACTIONS = {
+    "🏠 Home": [
+        ("altair_charts", lambda at: _widget(at.sidebar.radio, "Chart backend").set_value("Altair (interactive)")),
+        ("matplotlib_charts", lambda at: _widget(at.sidebar.radio, "Chart backend").set_value("Matplotlib")),
+    ],
+    "📊 User Statistics": [
+        ("next_user", lambda at: _next_option(at, "Select User ID")),
+    ],
+    "⏳ Time-based Analysis": [
+        ("next_user", lambda at: _next_option(at, "Select User ID")),
+    ],
+    "💤 Sleep Analysis": [
+        ("one_user", lambda at: _next_option(at, "Select User ID (or view all)")),
+        ("next_predictor", lambda at: _next_option(at, "Select Predictor Variable")),
+    ],
+    "🌦️ Weather & Activity": [
+        ("next_target", lambda at: _next_option(at, "Select Target Variable")),
+        ("next_user", lambda at: _next_option(at, "Select User ID")),
+    ],
+    "🔧 Database Management": [
+        ("next_table", lambda at: _next_option(at, "Select Table")),
+        ("next_page", lambda at: _click(at, "Next Page ➡️")),
+        ("summary", lambda at: _click(at, "Compute Summary")),
+    ],
+}
+
+
+def _run(at, page, phase):
+    from perf_probes import track_peak_rss, table_loads
+
+    loads_before = table_loads()
+    start = time.perf_counter()
+    with track_peak_rss() as memory:
+        at.run()
+    seconds = time.perf_counter() - start
+    return {
+        "page": page,
+        "phase": phase,
+        "seconds": seconds,
+        "peak_rss_mb": memory["peak"] / 2**20,
+        "table_loads": table_loads() - loads_before,
+        "exception": next((e.value for e in at.exception), None),
+    }
+
+
+def benchmark_pages(pages=None, timeout=300):
+    """
+    Runs each page cold, warm and with its INTERACTIONS.
+
+    Returns:
+        pd.DataFrame: One row per run: page, phase (cold, warm or interaction:<name>),
+        seconds, peak_rss_mb, table_loads and exception.
+    """
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    rows = []
+    for page in pages or PAGES:
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        # The first run renders the default page, the selected page then starts from empty caches
+        at.run()
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        sys.modules.pop("scripts.weather_analysis", None)
+        _widget(at.sidebar.radio, "Go to").set_value(page)
+        cold = _run(at, page, "cold")
+        rows.append(cold)
+        rows.append(_run(at, page, "warm"))
+        for name, interact in INTERACTIONS.get(page, []):
+            try:
+                interact(at)
+            except LookupError as e:
+                rows.append({"page": page, "phase": f"interaction:{name}", "exception": str(e)})
+                continue
+            rows.append(_run(at, page, f"interaction:{name}"))
+        print(f"{page}: cold run {cold['seconds']:.2f}s", file=sys.stderr)
+    return pd.DataFrame(rows, columns=["page", "phase", "seconds", "peak_rss_mb", "table_loads", "exception"])
+
+
+def check_budgets(results, budgets=None):
+    """
+    The runs that raised or exceed their page's budget.
+
+    Parameters:
+        results (pd.DataFrame): From benchmark_pages.
+        budgets (dict): Page -> {"cold"|"warm"|"interaction": {metric: limit}}, pages
+            (and phases) not in it use DEFAULT_BUDGET.
+
+    Returns:
+        list: Messages, one per violation. Empty if everything is within budget.
+    """
+    budgets = budgets or {}
+    violations = []
+    for row in results.to_dict("records"):
+        where = f"{row['page']} / {row['phase']}"
+        if isinstance(row["exception"], str):
+            violations.append(f"{where}: raised {row['exception']}")
+            continue
+        kind = row["phase"].split(":")[0]
+        limits = dict(DEFAULT_BUDGET[kind], **budgets.get(row["page"], {}).get(kind, {}))
+        for metric, limit in limits.items():
+            if pd.notna(row[metric]) and row[metric] > limit:
+                violations.append(f"{where}: {metric} {row[metric]:.2f} > budget {limit}")
+    return violations
+
+
+def _build_modified_database(env):
+    # The dashboard reads the modified database, built from the raw one by the pipeline
+    print(f"Building {env['FITBIT_MODIFIED_DB_PATH']}", file=sys.stderr)
+    subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, "part4_wrangling.py")], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard pages headlessly with AppTest.")
+    parser.add_argument("--db", help="Raw database to use (e.g. a synthetic one), defaults to data/fitbit_database.db.")
+    parser.add_argument("--pages", nargs="*", choices=PAGES, help="Only these pages.")
+    parser.add_argument("--budgets", help="JSON file with per-page budgets, see DEFAULT_BUDGET.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds a single run may take.")
+    args = parser.parse_args()
+
+    # Set before the app (and with it storage_backends and perf_probes) is imported
+    log_path = os.path.join(tempfile.mkdtemp(prefix="page_benchmark"), "perf_log.jsonl")
+    os.environ["FITBIT_PERF_LOG"] = log_path
+    os.environ["FITBIT_WARMUP"] = "0"
+    if args.db:
+        os.environ["FITBIT_DB_PATH"] = os.path.abspath(args.db)
+        os.environ["FITBIT_MODIFIED_DB_PATH"] = os.path.splitext(os.path.abspath(args.db))[0] + "_modified.db"
+        if not os.path.exists(os.environ["FITBIT_MODIFIED_DB_PATH"]):
+            _build_modified_database(os.environ)
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.path.insert(0, SCRIPTS_DIR)
+
+    budgets = {}
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+
+    results = benchmark_pages(args.pages, timeout=args.timeout)
+    print(results.round(3).to_string(index=False))
+    if args.output:
+        results.to_json(args.output, orient="records", indent=1, force_ascii=False)
+
+    violations = check_budgets(results, budgets)
+    if violations:
+        print("\nOver budget:")
+        for message in violations:
+            print(f"  {message}")
+        sys.exit(1)
+    print("\nAll pages within budget.")
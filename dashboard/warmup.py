@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+import importlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+
+from dashboard.data_cache import load_table, load_kpis, load_sleep_activity_frame, load_user_list, load_user_slice
+
+# Tables that several pages read whole
+WARMUP_TABLES = ["daily_activity", "minute_sleep"]
+WARMUP_WORKERS = 3
+MAX_PREFETCHES = 32
+# FITBIT_WARMUP=0 turns the warm-up and the prefetches off, e.g. so page_benchmark.py
+# counts every load in the run that needs it
+WARMUP_ENABLED = os.environ.get("FITBIT_WARMUP", "1") != "0"
+
+
+class WarmupStatus:
+    """
+    Runs the warm-up tasks and prefetches on a background thread pool and keeps
+    the state of every warm-up task: pending, running, done or failed.
+    Prefetches are only remembered for the last MAX_PREFETCHES, so they are not
+    repeated while still fresh.
+    """
+
+    def __init__(self, max_workers=WARMUP_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+        self._lock = threading.Lock()
+        self.tasks = {}
+        self.prefetches = OrderedDict()
+        self.started_at = time.time()
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self.tasks.setdefault(name, {}).update(fields)
+
+    def _run(self, name, function, args):
+        self._set(name, state="running", started=time.time())
+        try:
+            function(*args)
+        except Exception as e:
+            self._set(name, state="failed", error=str(e), finished=time.time())
+        else:
+            self._set(name, state="done", finished=time.time())
+
+    def submit(self, name, function, *args):
+        """
+        Runs function(*args) in the background, unless a task with this name was already submitted.
+        """
+        with self._lock:
+            if name in self.tasks:
+                return
+            self.tasks[name] = {"state": "pending", "submitted": time.time()}
+        self._executor.submit(self._run, name, function, args)
+
+    def prefetch(self, name, function, *args):
+        """
+        Runs function(*args) in the background unless it was prefetched recently.
+        """
+        with self._lock:
+            if name in self.prefetches:
+                self.prefetches.move_to_end(name)
+                return
+            self.prefetches[name] = time.time()
+            while len(self.prefetches) > MAX_PREFETCHES:
+                self.prefetches.popitem(last=False)
+        self._executor.submit(self._run_prefetch, function, args)
+
+    @staticmethod
+    def _run_prefetch(function, args):
+        try:
+            function(*args)
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+
+    def progress(self):
+        with self._lock:
+            states = [task["state"] for task in self.tasks.values()]
+        if not states:
+            return 1.0
+        return sum(state in ("done", "failed") for state in states) / len(states)
+
+    def summary(self):
+        with self._lock:
+            rows = [
+                {
+                    "Task": name,
+                    "State": task["state"],
+                    "Seconds": round(task["finished"] - task["started"], 2) if "finished" in task else None,
+                    "Error": task.get("error", ""),
+                }
+                for name, task in self.tasks.items()
+            ]
+        return pd.DataFrame(rows, columns=["Task", "State", "Seconds", "Error"])
+
+
+def _import_weather_analysis():
+    # weather_analysis builds its merged frame, sufficient statistics and cube on import
+    importlib.import_module("scripts.weather_analysis")
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    """
+    Starts the warm-up once per server process, on the first page load.
+    Returns the WarmupStatus shared by all sessions.
+    """
+    status = WarmupStatus()
+    if not WARMUP_ENABLED:
+        return status
+    status.submit("KPI summary", load_kpis)
+    status.submit("Weather frame, statistics and cube", _import_weather_analysis)
+    status.submit("Sleep/activity merge", load_sleep_activity_frame)
+    status.submit("User lists", lambda: (load_user_list("daily_activity"),
+                                         load_user_list("merged_heart_rate_activity", min_days=2)))
+    for table_name in WARMUP_TABLES:
+        status.submit(f"Table {table_name}", load_table, table_name)
+    return status
+
+
+def prefetch_adjacent_days(status, user_id, selected_date, tables, days=1):
+    """
+    Prefetches the user's slices for the days around selected_date, which are the
+    likely next selections on the Time-based Analysis page.
+    """
+    if not WARMUP_ENABLED:
+        return
+    for offset in range(-days, days + 1):
+        if offset == 0:
+            continue
+        day = pd.Timestamp(selected_date) + pd.Timedelta(days=offset)
+        status.prefetch(f"{user_id} {day.date()} {tables}", load_user_slice, user_id, day.date(), day.date(), tables)
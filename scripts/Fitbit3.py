@@ -1,12 +1,5 @@
-import sqlite3
 import pandas as pd
+from database_queries import fetch_table_data
 
-connection = sqlite3.connect("fitbit_database.db")
-
-query = "SELECT * FROM daily_activity"
-cursor = connection.cursor()
-cursor.execute(query)
-rows = cursor.fetchall()
-
-df = pd.DataFrame(rows, columns = [x[0] for x in cursor.description])
+df = fetch_table_data("daily_activity")
 print(df)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import pandas as pd
+
+from perf_probes import probed
+
+CUBE_KEYS = ["Date", "TimeBlock", "Id"]
+CUBE_MEASURES = ["StepTotal", "Calories", "TotalIntensity", "temp", "temp_squared", "precip", "humidity", "windspeed", "cloudcover"]
+
+
+def build_activity_cube(df, measures=None):
+    """
+    Pre-aggregates the hourly fitbit + weather frame into sums and counts per (Date, TimeBlock, Id).
+    Daily averages for any selection of time blocks and users can then be read
+    from the cube without going back to the hourly rows.
+
+    Parameters:
+        df (pd.DataFrame): The merged hourly frame with Date ('M/D/YYYY'), TimeBlock and Id columns.
+        measures (list): The columns to aggregate, defaults to the activity and weather columns that exist.
+
+    Returns:
+        pd.DataFrame: Indexed by (Date, TimeBlock, Id) with a '<measure>_sum' and '<measure>_count' column per measure.
+    """
+    df = df.copy()
+    if "temp_squared" not in df.columns and "temp" in df.columns:
+        df["temp_squared"] = df["temp"] ** 2
+    if measures is None:
+        measures = [col for col in CUBE_MEASURES if col in df.columns]
+
+    df["Date"] = pd.to_datetime(df["Date"], format="%m/%d/%Y")
+    grouped = df.groupby(CUBE_KEYS, observed=True)[measures]
+    sums = grouped.sum().add_suffix("_sum")
+    counts = grouped.count().add_suffix("_count")
+    return pd.concat([sums, counts], axis=1).sort_index()
+
+
+def is_activity_cube(df):
+    return list(df.index.names) == CUBE_KEYS
+
+
+@probed("pandas: slice_cube")
+def slice_cube(cube, selected_blocks=None, user_id=None, start_date=None, end_date=None):
+    """
+    Returns the cells of the cube for the given time blocks, user and date range.
+    Arguments left as None are not filtered on.
+    """
+    mask = pd.Series(True, index=cube.index)
+    if selected_blocks is not None:
+        mask &= cube.index.get_level_values("TimeBlock").isin(selected_blocks)
+    if user_id is not None:
+        mask &= cube.index.get_level_values("Id") == user_id
+    dates = cube.index.get_level_values("Date")
+    if start_date is not None:
+        mask &= dates >= pd.to_datetime(start_date)
+    if end_date is not None:
+        mask &= dates <= pd.to_datetime(end_date)
+    return cube[mask.to_numpy()]
+
+
+@probed("pandas: daily_averages")
+def daily_averages(cube, measures, selected_blocks=None, user_id=None, start_date=None, end_date=None):
+    """
+    Reads the average of each measure per day from the cube, for any time block selection and user.
+    The averages equal the mean over the underlying hourly rows.
+
+    Returns:
+        pd.DataFrame: A Date column and one column per measure.
+    """
+    measures = list(dict.fromkeys(measures))
+    cells = slice_cube(cube, selected_blocks, user_id, start_date, end_date)
+    per_day = cells.groupby(level="Date")[[f"{m}_sum" for m in measures] + [f"{m}_count" for m in measures]].sum()
+
+    daily_avg = pd.DataFrame(index=per_day.index)
+    for measure in measures:
+        daily_avg[measure] = per_day[f"{measure}_sum"] / per_day[f"{measure}_count"]
+    return daily_avg.dropna().reset_index()
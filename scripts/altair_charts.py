@@ -0,0 +1,200 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+from graphs import heart_rate_session, intensity_for_day
+from perf_probes import probed
+
+# Most points sent to the browser per series. The data is aggregated or decimated on
+# the server down to this budget, then Vega-Lite renders it and handles pan and zoom
+# client-side without a Streamlit rerun.
+POINT_BUDGET = 2000
+
+
+def decimate(df, x, y, max_points=POINT_BUDGET):
+    """
+    Reduces a series to about max_points rows by keeping the minimum and maximum of y
+    in each of max_points / 2 buckets along x, so peaks and dips stay visible.
+    """
+    if len(df) <= max_points:
+        return df
+    df = df.sort_values(x).reset_index(drop=True)
+    buckets = np.arange(len(df)) * (max_points // 2) // len(df)
+    grouped = df[y].groupby(buckets)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return df.loc[keep]
+
+
+def sample_points(df, max_points=POINT_BUDGET, seed=0):
+    """
+    A fixed random sample of at most max_points rows, for scatter plots.
+    """
+    if len(df) <= max_points:
+        return df
+    return df.sample(max_points, random_state=seed)
+
+
+@probed("plot: activity_sums_chart")
+def activity_sums_chart(activity_sums):
+    data = pd.DataFrame({"Activity": activity_sums.index, "Minutes": activity_sums.to_numpy()})
+    data["Share"] = data["Minutes"] / data["Minutes"].sum()
+    colors = ["#990000", "#cc3333", "#ff6666", "#ff9999"]
+    return alt.Chart(data, title="Distribution of Activity Minutes").mark_arc().encode(
+        theta="Minutes:Q",
+        color=alt.Color("Activity:N", sort=list(data["Activity"]), scale=alt.Scale(range=colors)),
+        tooltip=["Activity", "Minutes", alt.Tooltip("Share:Q", format=".1%")],
+    )
+
+
+@probed("plot: sleep_duration_bins_chart")
+def sleep_duration_bins_chart(counts, edges):
+    data = pd.DataFrame({"start": edges[:-1], "end": edges[1:], "Frequency": counts})
+    return alt.Chart(data, title="Distribution of Sleep Durations").mark_bar(color="skyblue", stroke="black").encode(
+        x=alt.X("start:Q", title="Sleep Duration (Hours)"),
+        x2="end:Q",
+        y="Frequency:Q",
+        tooltip=["start", "end", "Frequency"],
+    )
+
+
+@probed("plot: heart_rate_chart")
+def heart_rate_chart(df, user_id, date, nth_exercise, max_points=POINT_BUDGET):
+    df_exercise, total_sessions = heart_rate_session(df, user_id, date, nth_exercise)
+    data = decimate(df_exercise[["Time", "Value"]], "Time", "Value", max_points)
+    title = f"Heart Rate for User {user_id} on {date}, Session {nth_exercise} out of {total_sessions}"
+    return alt.Chart(data, title=title).mark_line(color="blue").encode(
+        x=alt.X("Time:T", title="Time (24-hour format)", axis=alt.Axis(format="%H:%M")),
+        y=alt.Y("Value:Q", title="Heart Rate (BPM)", scale=alt.Scale(zero=False)),
+        tooltip=[alt.Tooltip("Time:T", format="%H:%M:%S"), "Value"],
+    ).interactive(bind_y=False)
+
+
+@probed("plot: total_intensity_chart")
+def total_intensity_chart(df, user_id, date):
+    data = intensity_for_day(df, user_id, date)[["ActivityHour", "TotalIntensity"]]
+    return alt.Chart(data, title=f"Total Intensity for User {user_id} on {date}").mark_line(color="red", point=True).encode(
+        x=alt.X("ActivityHour:T", title="Time (24-hour format)", axis=alt.Axis(format="%H:%M")),
+        y=alt.Y("TotalIntensity:Q", title="Total Intensity"),
+        tooltip=[alt.Tooltip("ActivityHour:T", format="%H:%M"), "TotalIntensity"],
+    ).interactive(bind_y=False)
+
+
+@probed("plot: daily_line_chart")
+def daily_line_chart(df, x, y, title, y_title=None, color="blue", max_points=POINT_BUDGET):
+    """
+    Line chart of a daily series, e.g. a user's average steps per day.
+    """
+    data = decimate(df[[x, y]].assign(**{x: pd.to_datetime(df[x])}), x, y, max_points)
+    return alt.Chart(data, title=title).mark_line(color=color, point=True).encode(
+        x=alt.X(f"{x}:T", title="Date"),
+        y=alt.Y(f"{y}:Q", title=y_title or y),
+        tooltip=[alt.Tooltip(f"{x}:T"), alt.Tooltip(f"{y}:Q", format=".2f")],
+    ).interactive(bind_y=False)
+
+
+@probed("plot: heart_rate_zones_chart")
+def heart_rate_zones_chart(df, zones, title):
+    """
+    Stacked bars of the minutes per heart-rate zone and day, from daily_heart_rate.
+    """
+    columns = [f"{zone}Minutes" for zone in zones]
+    data = df[["Date"] + columns].assign(Date=pd.to_datetime(df["Date"])).melt("Date", var_name="Zone", value_name="Minutes")
+    data["Zone"] = data["Zone"].str.removesuffix("Minutes")
+    colors = ["#cccccc", "#ffcc66", "#ff9933", "#cc3333"]
+    return alt.Chart(data, title=title).mark_bar().encode(
+        x=alt.X("yearmonthdate(Date):O", title="Date"),
+        y=alt.Y("Minutes:Q", title="Minutes"),
+        color=alt.Color("Zone:N", sort=list(zones), scale=alt.Scale(domain=list(zones), range=colors)),
+        tooltip=[alt.Tooltip("Date:T"), "Zone", alt.Tooltip("Minutes:Q", format=".1f")],
+    )
+
+
+@probed("plot: sleep_state_heart_rate_chart")
+def sleep_state_heart_rate_chart(state_means):
+    """
+    Bars of the mean heart rate per sleep state (Asleep, Restless, Awake), from sleep_episodes.
+    """
+    data = pd.DataFrame({"State": state_means.index, "HeartRate": state_means.to_numpy()})
+    return alt.Chart(data, title="Heart Rate by Sleep State").mark_bar().encode(
+        x=alt.X("State:N", sort=list(data["State"]), title="Sleep State"),
+        y=alt.Y("HeartRate:Q", title="Mean Heart Rate (bpm)"),
+        color=alt.Color("State:N", sort=list(data["State"]), legend=None,
+                        scale=alt.Scale(range=["#3366cc", "#ff9933", "#cc3333"])),
+        tooltip=["State", alt.Tooltip("HeartRate:Q", format=".1f")],
+    )
+
+
+@probed("plot: weather_chart")
+def weather_chart(daily_avg, y_variable, x_variable, title, precip_scale=20):
+    """
+    Daily average activity as bars with the weather variable as a line on a second axis,
+    like weather_analysis._plot_daily_weather. daily_avg is already one row per day.
+    """
+    data = daily_avg.copy()
+    data["Date"] = pd.to_datetime(data["Date"])
+    bars = alt.Chart(data).mark_bar(color="blue", opacity=0.7).encode(
+        x=alt.X("Date:T", title="Date"),
+        y=alt.Y(f"{y_variable}:Q", title=f"Avg {y_variable}"),
+        tooltip=[alt.Tooltip("Date:T"), alt.Tooltip(f"{y_variable}:Q", format=".2f")],
+    )
+
+    line_columns = [x_variable]
+    if x_variable == "precip":
+        precip_scale = 100 / (data["precip"].max() + 0.1)
+        data["precip_scaled"] = data["precip"] * precip_scale
+        line_columns.append("precip_scaled")
+    lines = alt.Chart(data).transform_fold(line_columns, as_=["Series", "Value"]).mark_line(point=True, strokeDash=[4, 2]).encode(
+        x="Date:T",
+        y=alt.Y("Value:Q", title=f"{x_variable.capitalize()} (scaled for visibility)"),
+        color=alt.Color("Series:N", scale=alt.Scale(range=["red", "green"])),
+        tooltip=[alt.Tooltip("Date:T"), "Series:N", alt.Tooltip("Value:Q", format=".2f")],
+    )
+    return alt.layer(bars, lines, title=title).resolve_scale(y="independent").interactive(bind_y=False)
+
+
+@probed("plot: regression_scatter_chart")
+def regression_scatter_chart(df, x_variable, y_variable, model, title, max_points=POINT_BUDGET):
+    """
+    Scatter plot of (a sample of) the data with the fitted regression line.
+    The line is drawn from the model parameters, so it uses all rows.
+    """
+    data = sample_points(df[[x_variable, y_variable]].dropna(), max_points)
+    points = alt.Chart(data).mark_circle(opacity=0.6).encode(
+        x=alt.X(f"{x_variable}:Q", title=x_variable),
+        y=alt.Y(f"{y_variable}:Q", title="Minutes Asleep"),
+        tooltip=[x_variable, y_variable],
+    )
+    x_range = np.array([df[x_variable].min(), df[x_variable].max()])
+    line_data = pd.DataFrame({
+        x_variable: x_range,
+        y_variable: model.params["const"] + model.params[x_variable] * x_range,
+    })
+    line = alt.Chart(line_data).mark_line(color="red").encode(x=f"{x_variable}:Q", y=f"{y_variable}:Q")
+    return alt.layer(points, line, title=title).interactive()
+
+
+@probed("plot: residual_histogram_chart")
+def residual_histogram_chart(residuals, bins=30):
+    counts, edges = np.histogram(np.asarray(residuals, dtype=float), bins=bins)
+    data = pd.DataFrame({"start": edges[:-1], "end": edges[1:], "Count": counts})
+    return alt.Chart(data, title="Histogram of Residuals").mark_bar().encode(
+        x=alt.X("start:Q", title="Residual"),
+        x2="end:Q",
+        y="Count:Q",
+    )
+
+
+@probed("plot: qq_chart")
+def qq_chart(residuals, max_points=POINT_BUDGET):
+    (theoretical, ordered), (slope, intercept, _) = stats.probplot(np.asarray(residuals, dtype=float), dist="norm")
+    data = decimate(pd.DataFrame({"Theoretical": theoretical, "Ordered": ordered}), "Theoretical", "Ordered", max_points)
+    points = alt.Chart(data).mark_circle().encode(
+        x=alt.X("Theoretical:Q", title="Theoretical quantiles"),
+        y=alt.Y("Ordered:Q", title="Ordered Values"),
+    )
+    x_range = np.array([theoretical.min(), theoretical.max()])
+    line = alt.Chart(pd.DataFrame({"Theoretical": x_range, "Ordered": intercept + slope * x_range})).mark_line(color="red").encode(
+        x="Theoretical:Q", y="Ordered:Q"
+    )
+    return alt.layer(points, line, title="Q-Q Plot of Residuals")
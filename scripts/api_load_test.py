@@ -0,0 +1,90 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+from api_server import DEFAULT_PORT
+
+# Load generator for api_server.py. Start the server first:
+#   python api_server.py --port 8888
+#   python api_load_test.py --concurrency 20 --requests 2000
+
+DEFAULT_PATHS = [
+    "/api/users",
+    "/api/summary",
+    "/api/users/{user_id}/daily?start=2016-03-12&end=2016-04-12",
+    "/api/users/{user_id}/sleep?start=2016-03-12&end=2016-04-12",
+    "/api/users/{user_id}/sessions?date=2016-04-12",
+    "/api/users/{user_id}/heart_rate?start=2016-04-12&end=2016-04-13",
+    "/api/regression/sleep?predictor=TotalActiveMinutes",
+]
+
+
+async def _worker(client, base_url, paths, user_ids, n_requests, use_etags, results, seed):
+    rng = random.Random(seed)
+    etags = {}
+    for _ in range(n_requests):
+        path = rng.choice(paths)
+        url = base_url + path.format(user_id=rng.choice(user_ids))
+        headers = {"If-None-Match": etags[url]} if use_etags and url in etags else {}
+        start = time.perf_counter()
+        try:
+            response = await client.fetch(url, headers=headers, raise_error=False, request_timeout=120)
+            status = response.code
+            if status == 200 and "Etag" in response.headers:
+                etags[url] = response.headers["Etag"]
+        except (HTTPClientError, OSError) as e:
+            status = f"error: {e}"
+        results.append((path.split("?")[0], status, time.perf_counter() - start))
+
+
+async def run_load_test(base_url, concurrency=10, n_requests=1000, paths=None, use_etags=True, seed=0):
+    """
+    Sends n_requests spread over `concurrency` concurrent clients and returns the
+    latencies and status codes, one tuple (endpoint, status, seconds) per request.
+    """
+    client = AsyncHTTPClient(max_clients=concurrency)
+    users_response = await client.fetch(base_url + "/api/users")
+    user_ids = json.loads(users_response.body) or [0]
+
+    results = []
+    per_worker = [n_requests // concurrency + (i < n_requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _worker(client, base_url, paths or DEFAULT_PATHS, user_ids, n, use_etags, results, seed + i)
+        for i, n in enumerate(per_worker)
+    ])
+    return results, time.perf_counter() - start
+
+
+def print_report(results, elapsed):
+    latencies = np.array([seconds for _, _, seconds in results]) * 1000
+    statuses = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"Requests: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f} req/s)")
+    print(f"Status codes: {statuses}")
+    print(f"Latency ms: p50 {np.percentile(latencies, 50):.1f}, p95 {np.percentile(latencies, 95):.1f}, "
+          f"p99 {np.percentile(latencies, 99):.1f}, max {latencies.max():.1f}")
+
+    print("\nPer endpoint (p50 / p95 ms):")
+    for path in sorted({path for path, _, _ in results}):
+        endpoint = np.array([seconds for p, _, seconds in results if p == path]) * 1000
+        print(f"  {path}: {len(endpoint)} requests, {np.percentile(endpoint, 50):.1f} / {np.percentile(endpoint, 95):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the Fitbit JSON API.")
+    parser.add_argument("--url", default=f"http://localhost:{DEFAULT_PORT}")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--no-etags", action="store_true", help="Do not send If-None-Match, so every request is a full response.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results, elapsed = asyncio.run(run_load_test(args.url, args.concurrency, args.requests, use_etags=not args.no_etags, seed=args.seed))
+    print_report(results, elapsed)
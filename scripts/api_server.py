@@ -0,0 +1,350 @@
+import json
+import queue
+import asyncio
+import hashlib
+import argparse
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import tornado.web
+
+from database_queries import DB_PATH, MODIFIED_DB_PATH, get_table_version
+from user_slices import date_strings
+from kpi_summary import SUMMARY_TABLE, load_kpi_summary
+from batched_ols import fit_grouped_ols
+from sleep_analysis_2 import get_sleep_minutes_per_day, get_daily_activity_with_active_minutes, prepare_merged_data
+
+# JSON API over the same data and analysis functions as the dashboard.
+# Queries run on a small pool of read-only SQLite connections in worker threads, so
+# the event loop keeps serving other requests. Responses carry an ETag built from
+# the version of the tables they read.
+
+DEFAULT_PORT = 8888
+POOL_SIZE = 4
+STREAM_BATCH_ROWS = 5000
+MAX_CACHED_RESPONSES = 256
+SLEEP_PREDICTORS = ["TotalActiveMinutes", "SedentaryMinutes", "VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes", "TotalSteps", "Calories"]
+
+
+class ReadOnlyPool:
+    """
+    A fixed number of read-only SQLite connections shared by the worker threads.
+    """
+
+    def __init__(self, use_modified=True, size=POOL_SIZE):
+        db_path = MODIFIED_DB_PATH if use_modified else DB_PATH
+        self.use_modified = use_modified
+        self._connections = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get().close()
+
+
+def _to_json(payload):
+    def default(value):
+        if isinstance(value, (np.integer, np.floating)):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, pd.Series):
+            return value.to_dict()
+        if isinstance(value, pd.DataFrame):
+            return _records(value)
+        return str(value)
+    return json.dumps(payload, default=default)
+
+
+def _records(df):
+    # Missing values become null instead of NaN, which is not valid JSON
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+# === QUERIES (run in worker threads) ===
+def query_users(conn):
+    return [row[0] for row in conn.execute("SELECT DISTINCT Id FROM daily_activity ORDER BY Id;")]
+
+
+def _date_filter(column, start_date, end_date):
+    if start_date is None or end_date is None:
+        return "", []
+    dates = date_strings(start_date, end_date)
+    return f' AND "{column}" IN ({", ".join("?" * len(dates))})', dates
+
+
+def query_daily(conn, user_id, start_date=None, end_date=None):
+    condition, params = _date_filter("ActivityDate", start_date, end_date)
+    df = pd.read_sql_query(f"SELECT * FROM daily_activity WHERE Id = ?{condition};", conn, params=[user_id] + params)
+    df["TotalActiveMinutes"] = df["VeryActiveMinutes"] + df["FairlyActiveMinutes"] + df["LightlyActiveMinutes"]
+    df = df.assign(ActivityDate=pd.to_datetime(df["ActivityDate"], format="%m/%d/%Y")).sort_values("ActivityDate")
+    df["ActivityDate"] = df["ActivityDate"].dt.strftime("%Y-%m-%d")
+    return _records(df)
+
+
+def query_sessions(conn, user_id, date, gap_minutes=10):
+    """
+    Exercise sessions of a user on one day from the heart rate readings.
+    A gap of more than gap_minutes between readings starts a new session.
+    """
+    condition, params = _date_filter("Date", date, date)
+    df = pd.read_sql_query(f"SELECT Time, TimeOfDay, Value FROM heart_rate WHERE Id = ?{condition};", conn, params=[user_id] + params)
+    if df.empty:
+        return []
+    time = pd.to_datetime(df["Time"] + " " + df["TimeOfDay"], format="%I:%M:%S %p")
+    df = df.assign(Time=time).sort_values("Time")
+    df["Session"] = (df["Time"].diff().dt.total_seconds().fillna(0) > gap_minutes * 60).cumsum() + 1
+    sessions = df.groupby("Session").agg(
+        Start=("Time", "min"), End=("Time", "max"), Readings=("Value", "size"),
+        AvgHeartRate=("Value", "mean"), MaxHeartRate=("Value", "max")
+    ).reset_index()
+    sessions["Start"] = sessions["Start"].dt.strftime("%H:%M:%S")
+    sessions["End"] = sessions["End"].dt.strftime("%H:%M:%S")
+    return _records(sessions)
+
+
+def query_sleep_episodes(conn, user_id, start_date=None, end_date=None):
+    """
+    One row per sleep log: start, end, minutes in bed and minutes asleep (value = 1).
+    """
+    condition, params = _date_filter("Date", start_date, end_date)
+    df = pd.read_sql_query(f"SELECT Date, Time, TimeOfDay, value, logId FROM minute_sleep WHERE Id = ?{condition};", conn, params=[user_id] + params)
+    if df.empty:
+        return []
+    df["DateTime"] = pd.to_datetime(df["Date"] + " " + df["Time"] + " " + df["TimeOfDay"], format="%m/%d/%Y %I:%M:%S %p")
+    episodes = df.groupby("logId").agg(
+        Start=("DateTime", "min"), End=("DateTime", "max"),
+        MinutesInBed=("value", "size"), MinutesAsleep=("value", lambda v: int((v == 1).sum()))
+    ).reset_index().sort_values("Start")
+    episodes["Start"] = episodes["Start"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    episodes["End"] = episodes["End"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return _records(episodes)
+
+
+def query_sleep_regression(conn, predictor, user_id=None, per_user=False):
+    merged = prepare_merged_data(get_sleep_minutes_per_day(conn), get_daily_activity_with_active_minutes(conn))
+    if user_id is not None:
+        merged = merged[merged["Id"] == user_id]
+    results = fit_grouped_ols(merged, "asleep_minutes", [predictor], group_columns=["Id"] if per_user else None)
+    return _records(results)
+
+
+def stream_heart_rate(conn, user_id, start_date=None, end_date=None, batch_rows=STREAM_BATCH_ROWS):
+    """
+    Yields the user's heart rate readings as lists of [Date, Time, TimeOfDay, Value] rows.
+    """
+    condition, params = _date_filter("Date", start_date, end_date)
+    cursor = conn.execute(f"SELECT Date, Time, TimeOfDay, Value FROM heart_rate WHERE Id = ?{condition};", [user_id] + params)
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        yield rows
+
+
+# === HANDLERS ===
+class BaseHandler(tornado.web.RequestHandler):
+    tables = []
+
+    def initialize(self, pool, executor, cache):
+        self.pool = pool
+        self.executor = executor
+        self.cache = cache
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header("Content-Type", "application/json")
+        self.finish(_to_json({"error": self._reason}))
+
+    def compute_etag(self):
+        # The version-based ETag set in set_version_etag, not a hash of the body
+        return self._headers.get("Etag")
+
+    def set_version_etag(self):
+        version = "|".join(get_table_version(table, use_modified=self.pool.use_modified) for table in self.tables)
+        self.version = version
+        self.set_header("Etag", '"' + hashlib.sha1(f"{version}|{self.request.uri}".encode()).hexdigest() + '"')
+
+    def date_range(self):
+        start, end = self.get_query_argument("start", None), self.get_query_argument("end", None)
+        try:
+            start = pd.to_datetime(start).date() if start else None
+            end = pd.to_datetime(end).date() if end else None
+        except (ValueError, TypeError):
+            raise tornado.web.HTTPError(400, reason="start and end must be dates (YYYY-MM-DD)")
+        if (start is None) != (end is None):
+            raise tornado.web.HTTPError(400, reason="Give both start and end, or neither")
+        return start, end
+
+    async def run_query(self, function, *args):
+        def task():
+            with self.pool.connection() as conn:
+                return function(conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, task)
+
+    async def respond(self, function, *args):
+        """
+        Answers 304 if the client has the current version, otherwise serves the
+        cached body for this URL and data version, or runs the query.
+        """
+        self.set_version_etag()
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        key = (self.request.uri, self.version)
+        body = self.cache.get(key)
+        if body is None:
+            body = _to_json(await self.run_query(function, *args))
+            self.cache[key] = body
+            while len(self.cache) > MAX_CACHED_RESPONSES:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        self.set_header("Content-Type", "application/json")
+        self.write(body)
+
+
+class UsersHandler(BaseHandler):
+    tables = ["daily_activity"]
+
+    async def get(self):
+        await self.respond(query_users)
+
+
+class DailyHandler(BaseHandler):
+    tables = ["daily_activity"]
+
+    async def get(self, user_id):
+        await self.respond(query_daily, int(user_id), *self.date_range())
+
+
+class SessionsHandler(BaseHandler):
+    tables = ["heart_rate"]
+
+    async def get(self, user_id):
+        date = self.get_query_argument("date")
+        try:
+            date = pd.to_datetime(date).date()
+            gap_minutes = float(self.get_query_argument("gap_minutes", "10"))
+        except (ValueError, TypeError):
+            raise tornado.web.HTTPError(400, reason="date must be YYYY-MM-DD and gap_minutes a number")
+        await self.respond(query_sessions, int(user_id), date, gap_minutes)
+
+
+class SleepEpisodesHandler(BaseHandler):
+    tables = ["minute_sleep"]
+
+    async def get(self, user_id):
+        await self.respond(query_sleep_episodes, int(user_id), *self.date_range())
+
+
+class SleepRegressionHandler(BaseHandler):
+    tables = ["minute_sleep", "daily_activity"]
+
+    async def get(self):
+        predictor = self.get_query_argument("predictor", "TotalActiveMinutes")
+        if predictor not in SLEEP_PREDICTORS:
+            raise tornado.web.HTTPError(400, reason=f"predictor must be one of {SLEEP_PREDICTORS}")
+        user_id = self.get_query_argument("user_id", None)
+        per_user = self.get_query_argument("per_user", "0") in ("1", "true")
+        await self.respond(query_sleep_regression, predictor, int(user_id) if user_id else None, per_user)
+
+
+class SummaryHandler(BaseHandler):
+    tables = [SUMMARY_TABLE]
+
+    async def get(self):
+        await self.respond(lambda conn: load_kpi_summary(use_modified=self.pool.use_modified))
+
+
+class HeartRateHandler(BaseHandler):
+    """
+    Streams the readings as newline-delimited JSON, one flush per batch, so large
+    ranges are never held in memory as a whole response.
+    """
+    tables = ["heart_rate"]
+
+    async def get(self, user_id):
+        start, end = self.date_range()
+        self.set_version_etag()
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", "application/x-ndjson")
+
+        batches = queue.Queue(maxsize=4)
+        cancelled = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                with self.pool.connection() as conn:
+                    for rows in stream_heart_rate(conn, int(user_id), start, end):
+                        if cancelled.is_set():
+                            break
+                        batches.put(rows)
+            finally:
+                batches.put(done)
+
+        loop = asyncio.get_running_loop()
+        producer = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                rows = await loop.run_in_executor(None, batches.get)
+                if rows is done:
+                    break
+                self.write("".join(_to_json(dict(zip(["Date", "Time", "TimeOfDay", "Value"], row))) + "\n" for row in rows))
+                await self.flush()
+        finally:
+            # If the client went away, stop the producer and unblock it so its connection returns to the pool
+            cancelled.set()
+            while not producer.done():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    await asyncio.sleep(0.01)
+
+
+def make_app(use_modified=True, pool_size=POOL_SIZE):
+    pool = ReadOnlyPool(use_modified=use_modified, size=pool_size)
+    # One more worker than connections for the heart rate producers waiting on the pool
+    settings = {"pool": pool, "executor": ThreadPoolExecutor(max_workers=pool_size + 1), "cache": OrderedDict()}
+    return tornado.web.Application([
+        (r"/api/users", UsersHandler, settings),
+        (r"/api/users/(\d+)/daily", DailyHandler, settings),
+        (r"/api/users/(\d+)/sessions", SessionsHandler, settings),
+        (r"/api/users/(\d+)/sleep", SleepEpisodesHandler, settings),
+        (r"/api/users/(\d+)/heart_rate", HeartRateHandler, settings),
+        (r"/api/regression/sleep", SleepRegressionHandler, settings),
+        (r"/api/summary", SummaryHandler, settings),
+    ])
+
+
+async def main(port=DEFAULT_PORT, use_modified=True, pool_size=POOL_SIZE):
+    app = make_app(use_modified=use_modified, pool_size=pool_size)
+    app.listen(port)
+    print(f"Fitbit API listening on http://localhost:{port}/api/")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON API for the Fitbit database.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE)
+    parser.add_argument("--raw", action="store_true", help="Serve the original database instead of the modified one.")
+    args = parser.parse_args()
+    asyncio.run(main(port=args.port, use_modified=not args.raw, pool_size=args.pool_size))
@@ -0,0 +1,124 @@
+import os
+import glob
+import uuid
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from database_queries import fetch_table_data, get_table_version
+from perf_probes import probed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(BASE_DIR, "..", "data", "arrow_store")
+
+# Tables are exported once per version to an uncompressed Arrow IPC file and then
+# memory-mapped. All sessions (and all server processes on the host) read the same
+# pages from the OS page cache, and numeric columns are zero-copy, read-only views.
+
+
+def _file_prefix(table_name, use_modified):
+    return os.path.join(STORE_DIR, f"{'modified' if use_modified else 'raw'}-{table_name}-")
+
+
+def _safe_version(version):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(version))
+
+
+def _export_table(table_name, use_modified, version):
+    """
+    Writes the table to <STORE_DIR>/<db>-<table>-<version>.arrow, unless another
+    process already did. The file appears atomically through a rename.
+    """
+    path = _file_prefix(table_name, use_modified) + _safe_version(version) + ".arrow"
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    df = fetch_table_data(table_name, use_modified=use_modified)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _map_table(path):
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _remove_old_files(table_name, use_modified, keep_path):
+    # Mapped files stay readable after unlinking, so sessions holding old views are unaffected
+    for path in glob.glob(_file_prefix(table_name, use_modified) + "*.arrow"):
+        if os.path.abspath(path) != os.path.abspath(keep_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _string_dtype(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+class ArrowStore:
+    """
+    Process-wide, read-only store of memory-mapped Arrow tables.
+    get_table returns the snapshot for the current version of the table. When the
+    database changes, a single caller exports the new version while the others wait
+    for it, and the new snapshot replaces the old one in one assignment.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get_table(self, table_name, use_modified=True):
+        key = (table_name, use_modified)
+        version = get_table_version(table_name, use_modified=use_modified)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot[0] == version:
+            return snapshot[1]
+
+        with self._lock(key):
+            # Another session may have refreshed the table while this one waited
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot[0] == version:
+                return snapshot[1]
+            path = _export_table(table_name, use_modified, version)
+            table = _map_table(path)
+            self._snapshots[key] = (version, table)
+            _remove_old_files(table_name, use_modified, path)
+        return table
+
+    def status(self):
+        rows = [
+            {"table": table_name, "modified": use_modified, "version": version,
+             "rows": table.num_rows, "mapped_mb": round(table.nbytes / 2**20, 2)}
+            for (table_name, use_modified), (version, table) in list(self._snapshots.items())
+        ]
+        return pd.DataFrame(rows, columns=["table", "modified", "version", "rows", "mapped_mb"])
+
+
+store = ArrowStore()
+
+
+@probed("sql: arrow_store.load_frame")
+def load_frame(table_name, use_modified=True):
+    """
+    The table as a read-only pandas DataFrame backed by the memory-mapped Arrow data.
+    Numeric columns without nulls are zero-copy numpy views, strings are pyarrow-backed
+    string columns. Do not modify it in place.
+    """
+    table = store.get_table(table_name, use_modified=use_modified)
+    return table.to_pandas(split_blocks=True, types_mapper=_string_dtype)
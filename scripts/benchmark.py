@@ -0,0 +1,300 @@
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNTHETIC_DIR = os.path.join(BASE_DIR, "..", "data", "synthetic")
+HISTORY_PATH = os.path.join(BASE_DIR, "..", "data", "benchmark_history.jsonl")
+
+# A benchmark that got this much slower than in the previous run is flagged, unless the
+# difference is below MIN_SLOWDOWN_SECONDS (timer noise on very short benchmarks)
+SLOWDOWN_RATIO = 1.2
+MIN_SLOWDOWN_SECONDS = 0.05
+
+# Benchmarks of the wrangling pipeline, table reads, merges, plot data preparation and
+# regressions at several data sizes. Each database runs in its own process, with
+# FITBIT_DB_PATH / FITBIT_MODIFIED_DB_PATH pointing at it, so the modules pick up the
+# paths at import and the memory of one size does not carry over to the next:
+#   python scripts/benchmark.py --scales 1 10
+#   python scripts/benchmark.py --sample        # the real database in data/
+# Results are appended to data/benchmark_history.jsonl and compared with the previous
+# run of the same database.
+
+
+def synthetic_db_path(scale, days=None, seed=0):
+    from synthetic_data import SAMPLE_DAYS
+    return os.path.join(SYNTHETIC_DIR, f"fitbit_{scale:g}x_{days or SAMPLE_DAYS}d_seed{seed}.db")
+
+
+def _measure(name, function, repeat):
+    # Best and median time over the repeats, peak resident memory over all of them
+    from perf_probes import track_peak_rss
+
+    seconds, peak, start, rows = [], 0, None, None
+    for _ in range(repeat):
+        gc.collect()
+        with open(os.devnull, "w") as devnull, track_peak_rss() as memory, redirect_stdout(devnull):
+            t0 = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - t0)
+        start = memory["start"] if start is None else min(start, memory["start"])
+        peak = max(peak, memory["peak"])
+        if isinstance(result, pd.DataFrame):
+            rows = len(result)
+        del result
+    return {
+        "benchmark": name,
+        "seconds_min": min(seconds),
+        "seconds_median": float(np.median(seconds)),
+        "peak_rss_mb": peak / 2**20,
+        "rss_increase_mb": (peak - start) / 2**20,
+        "rows": rows,
+    }
+
+
+def _cases():
+    # (name, function) in the order they run; imported here so the database paths
+    # from the environment are used
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    import graphs
+    import part4_wrangling
+    import sleep_analysis_2
+    from batched_ols import fit_grouped_ols
+    from database_queries import fetch_table_data, get_table_names
+    from storage_backends import get_backend
+
+    cases = [("wrangling_pipeline", lambda: part4_wrangling.main(workers=1))]
+    for table_name in get_table_names():
+        cases.append((f"fetch_table_data:{table_name}", lambda table_name=table_name: fetch_table_data(table_name)))
+
+    frames = {}
+
+    def modified(table_name):
+        if table_name not in frames:
+            frames[table_name] = fetch_table_data(table_name, use_modified=True)
+        return frames[table_name]
+
+    cases += [
+        ("merge_hourly_activity_frames", lambda: part4_wrangling.merge_hourly_activity_frames(
+            modified("hourly_steps"), modified("hourly_calories"), modified("hourly_intensity"))),
+        ("merge_daily_frames:minute_sleep", lambda: part4_wrangling.merge_daily_frames(
+            modified("minute_sleep"), modified("daily_activity"))),
+        ("merge_daily_frames:heart_rate", lambda: part4_wrangling.merge_daily_frames(
+            modified("heart_rate"), modified("daily_activity"))),
+    ]
+
+    def first_row(table_name):
+        row = modified(table_name).iloc[0]
+        return row["Id"], row["Date"]
+
+    def sleep_histogram():
+        plt.close(graphs.plot_sleep_duration_histogram(modified("minute_sleep")))
+
+    cases += [
+        ("plot_prep:heart_rate_session", lambda: graphs.heart_rate_session(modified("heart_rate"), *first_row("heart_rate"), 1)[0]),
+        ("plot_prep:intensity_for_day", lambda: graphs.intensity_for_day(modified("hourly_intensity"), *first_row("hourly_intensity"))),
+        ("plot_prep:sleep_duration_histogram", sleep_histogram),
+        ("plot_prep:activity_distribution", lambda: plt.close(graphs.plot_activity_distribution(modified("daily_activity")))),
+    ]
+
+    def sleep_regression_data():
+        backend = get_backend(use_modified=True)
+        return sleep_analysis_2.prepare_merged_data(
+            sleep_analysis_2.get_sleep_minutes_per_day(backend),
+            sleep_analysis_2.get_daily_activity_with_active_minutes(backend),
+        )
+
+    cases += [
+        ("regression:sleep_data", sleep_regression_data),
+        ("regression:sleep_vs_activity", lambda: sleep_analysis_2.run_regression(frames.setdefault("sleep", sleep_regression_data()))),
+        ("regression:multi_activity", lambda: sleep_analysis_2.run_multi_activity_regression(frames.setdefault("sleep", sleep_regression_data()))),
+        ("regression:grouped_ols_hourly", lambda: fit_grouped_ols(modified("merged_hourly_activity"), "Calories",
+                                                                  ["StepTotal", "TotalIntensity"], group_columns=("Id",))),
+    ]
+    return cases
+
+
+def run_benchmarks(repeat=3, only=None):
+    """
+    Runs the benchmarks against the databases in FITBIT_DB_PATH / FITBIT_MODIFIED_DB_PATH
+    in this process. The wrangling pipeline runs first and builds the modified database
+    the other benchmarks read.
+
+    Parameters:
+        repeat (int): Runs per benchmark (the pipeline runs once).
+        only (list): Only benchmarks whose name starts with one of these.
+
+    Returns:
+        list: One dict per benchmark with seconds_min, seconds_median, peak_rss_mb,
+        rss_increase_mb and rows.
+    """
+    results = []
+    for name, function in _cases():
+        if only and name != "wrangling_pipeline" and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results.append(_measure(name, function, 1 if name == "wrangling_pipeline" else repeat))
+        print(f"{name}: {results[-1]['seconds_min']:.3f}s, peak RSS {results[-1]['peak_rss_mb']:.0f} MB", file=sys.stderr)
+    return results
+
+
+def _table_rows(db_path):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        return {table_name: conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0] for table_name in tables}
+    finally:
+        conn.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def benchmark_database(db_path, label, repeat=3, only=None):
+    """
+    Runs the benchmarks on a raw database in a child process and returns the history record.
+    The modified database is built next to it (<name>_modified.db).
+    """
+    modified_path = os.path.splitext(db_path)[0] + "_modified.db"
+    env = dict(os.environ, FITBIT_DB_PATH=os.path.abspath(db_path), FITBIT_MODIFIED_DB_PATH=os.path.abspath(modified_path),
+               FITBIT_STORAGE_BACKEND="sqlite", MPLBACKEND="Agg")
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--repeat", str(repeat)]
+    if only:
+        command += ["--only", *only]
+    child = subprocess.run(command, env=env, cwd=BASE_DIR, stdout=subprocess.PIPE, text=True)
+    if child.returncode != 0:
+        raise RuntimeError(f"Benchmarks on {db_path} failed with exit code {child.returncode}")
+
+    return {
+        "label": label,
+        "database": os.path.basename(db_path),
+        "timestamp": time.time(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "table_rows": _table_rows(db_path),
+        "results": json.loads(child.stdout.strip().splitlines()[-1]),
+    }
+
+
+def append_history(record, history_path=HISTORY_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(history_path)), exist_ok=True)
+    with open(history_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def read_history(history_path=HISTORY_PATH, label=None):
+    """
+    The benchmark results as a DataFrame, one row per run and benchmark, oldest first.
+    """
+    rows = []
+    try:
+        with open(history_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if label is not None and record["label"] != label:
+                    continue
+                for result in record["results"]:
+                    rows.append(dict(result, label=record["label"], timestamp=record["timestamp"], commit=record["commit"]))
+    except OSError:
+        pass
+    columns = ["label", "timestamp", "commit", "benchmark", "seconds_min", "seconds_median", "peak_rss_mb",
+               "rss_increase_mb", "rows"]
+    return pd.DataFrame(rows, columns=columns).sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def compare_with_previous(label, history_path=HISTORY_PATH):
+    """
+    The latest run of a database next to the one before it.
+
+    Returns:
+        pd.DataFrame: Per benchmark the previous and latest best time and peak RSS, the
+        time ratio and whether it exceeds SLOWDOWN_RATIO. None if there is no earlier run.
+    """
+    history = read_history(history_path, label)
+    runs = history["timestamp"].drop_duplicates().sort_values()
+    if len(runs) < 2:
+        return None
+    previous = history[history["timestamp"] == runs.iloc[-2]].set_index("benchmark")
+    latest = history[history["timestamp"] == runs.iloc[-1]].set_index("benchmark")
+    comparison = pd.DataFrame({
+        "previous_s": previous["seconds_min"],
+        "latest_s": latest["seconds_min"],
+        "previous_rss_mb": previous["peak_rss_mb"],
+        "latest_rss_mb": latest["peak_rss_mb"],
+    }).dropna(subset=["latest_s"])
+    comparison["ratio"] = comparison["latest_s"] / comparison["previous_s"]
+    comparison["slower"] = (comparison["ratio"] > SLOWDOWN_RATIO) & (
+        comparison["latest_s"] - comparison["previous_s"] > MIN_SLOWDOWN_SECONDS)
+    return comparison.loc[latest.index.intersection(comparison.index)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Fitbit scripts on synthetic databases of several sizes.")
+    parser.add_argument("--scales", type=float, nargs="*", default=[1.0], help="Users as multiples of the sample, e.g. 1 10 100.")
+    parser.add_argument("--days", type=int, default=None, help="Days of the synthetic data, defaults to the sample's 31.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample", action="store_true", help="Benchmark data/fitbit_database.db instead of synthetic data.")
+    parser.add_argument("--regenerate", action="store_true", help="Generate the synthetic databases even if they exist.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="Only benchmarks whose name starts with one of these (the pipeline always runs).")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Progress goes to stderr, the results are the last line of stdout
+        print(json.dumps(run_benchmarks(args.repeat, args.only)))
+        sys.exit(0)
+
+    if args.sample:
+        from storage_backends import DB_PATH
+        databases = [(DB_PATH, "sample")]
+    else:
+        from synthetic_data import generate_database
+        databases = []
+        for scale in args.scales:
+            db_path = synthetic_db_path(scale, args.days, args.seed)
+            if args.regenerate or not os.path.exists(db_path):
+                print(f"Generating {db_path}")
+                generate_database(db_path, scale=scale, days=args.days, seed=args.seed)
+            databases.append((db_path, os.path.splitext(os.path.basename(db_path))[0]))
+
+    for db_path, label in databases:
+        print(f"\nBenchmarking {label}")
+        record = benchmark_database(db_path, label, repeat=args.repeat, only=args.only)
+        append_history(record, args.history)
+        results = pd.DataFrame(record["results"]).set_index("benchmark")
+        print(results.round(3).to_string())
+
+        comparison = compare_with_previous(label, args.history)
+        if comparison is not None:
+            print(f"\nCompared with the previous run of {label}:")
+            print(comparison.round(3).to_string())
+            slower = comparison.index[comparison["slower"]]
+            if len(slower):
+                print(f"Slower by more than {SLOWDOWN_RATIO - 1:.0%}: {', '.join(slower)}")
@@ -1,44 +1,105 @@
-import sqlite3
+import sys
 import pandas as pd
-import os
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "..", "data", "fitbit_database.db")
-MODIFIED_DB_PATH = os.path.join(BASE_DIR, "..", "data", "fitbit_database_modified.db")
+from perf_probes import probed
+from storage_backends import get_backend, DB_PATH, MODIFIED_DB_PATH
+from table_lineage import record_table_version, version_token, lineage_token, stale_inputs
+
+# All reads and writes go through the storage backend chosen with FITBIT_STORAGE_BACKEND
+# (see storage_backends.py). DB_PATH and MODIFIED_DB_PATH are the SQLite files.
+
+# Tables the KPI summary adds up (see kpi_summary.py); rows appended to them are added to it
+KPI_SOURCE_TABLES = {"daily_activity": "daily_df", "minute_sleep": "sleep_df"}
 
 def get_table_names(use_modified=False):  
-    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH  
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-    conn.close()
-    
-    return [table[0] for table in tables]
+    # Tables starting with "_" are bookkeeping, like _table_versions
+    return [name for name in get_backend(use_modified).list_tables() if not name.startswith("_")]
 
 def get_column_names(table_name, use_modified=False):  
-    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = cursor.fetchall()
-    conn.close()
-    
-    return [col[1] for col in columns]
+    return list(get_backend(use_modified).schema(table_name))
 
+@probed("sql: fetch_table_data")
 def fetch_table_data(table_name, use_modified=False):
-    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH  
     try:
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        conn.close()
+        df = get_backend(use_modified).scan(table_name)
     except Exception as e:
         print(f"Error fetching data from {table_name}: {e}")
         return pd.DataFrame() 
     return df
 
-def save_table_data(df, table_name, use_modified=False): 
-    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH 
-    conn = sqlite3.connect(db_path)
-    df.to_sql(table_name, conn, if_exists='replace', index=False) 
-    conn.close()
+@probed("sql: scan_table")
+def scan_table(table_name, columns=None, filters=None, use_modified=False):
+    """
+    Reads only some columns and/or rows of a table.
+
+    Parameters:
+        table_name (str): The table.
+        columns (list): Columns to read, None for all.
+        filters (list): (column, op, value) tuples the rows must all satisfy, e.g. [("Id", "=", user_id)].
+
+    Returns:
+        pd.DataFrame: The matching rows, empty if the table cannot be read.
+    """
+    try:
+        df = get_backend(use_modified).scan(table_name, columns=columns, filters=filters)
+    except Exception as e:
+        print(f"Error fetching data from {table_name}: {e}")
+        return pd.DataFrame(columns=columns)
+    return df
+
+def save_table_data(df, table_name, use_modified=False, step=None, inputs=None): 
+    """
+    Replaces a table and records the new version in _table_versions.
+
+    Parameters:
+        step (str): What wrote the table, defaults to the calling function's name.
+        inputs (list): For derived tables, the tables the data was computed from.
+    """
+    get_backend(use_modified).write(df, table_name)
+    record_table_version(table_name, df, step or sys._getframe(1).f_code.co_name, inputs=inputs, use_modified=use_modified)
+
+def append_table_data(df, table_name, use_modified=False, step=None, inputs=None):
+    """
+    Adds rows to a table. Rows whose natural key is already in the table are skipped
+    if it has a UNIQUE index (see dedup.py).
+    Rows of daily_activity and minute_sleep are also added to the KPI summary, and
+    rows of the rolling_features sources update the days of daily_features they
+    affect, if those were current before, so they do not have to be rebuilt.
+
+    Returns:
+        int: The number of rows added.
+    """
+    # Imported here, both modules import this one
+    from kpi_summary import SUMMARY_TABLE as KPI_TABLE, update_kpi_summary
+    from rolling_features import FEATURE_TABLE, SOURCE_TABLES as FEATURE_SOURCE_TABLES, update_features
+
+    backend = get_backend(use_modified)
+    update_kpis = (table_name in KPI_SOURCE_TABLES and backend.name == "sqlite"
+                   and stale_inputs(KPI_TABLE, use_modified) == [])
+    update_daily_features = table_name in FEATURE_SOURCE_TABLES and stale_inputs(FEATURE_TABLE, use_modified) == []
+    added = backend.append(df, table_name)
+    record_table_version(table_name, df, step or sys._getframe(1).f_code.co_name, inputs=inputs,
+                         use_modified=use_modified, appended=True, row_count=added)
+    if update_kpis:
+        update_kpi_summary(use_modified=use_modified, **{KPI_SOURCE_TABLES[table_name]: df})
+    if update_daily_features:
+        update_features({table_name: df}, use_modified=use_modified)
+    return added
+
+def get_data_version(use_modified=False):
+    """
+    Cheap version token for the whole database. It changes whenever anything is written.
+    """
+    return get_backend(use_modified).version()
+
+def get_table_version(table_name, use_modified=False):
+    """
+    Version token of one table from _table_versions, so writes to other tables do not change it.
+    """
+    return version_token(table_name, use_modified=use_modified)
+
+def get_tables_version(table_names, use_modified=False):
+    """
+    Version token of a dataset derived from several tables.
+    """
+    return lineage_token(table_names, use_modified=use_modified)
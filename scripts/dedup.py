@@ -0,0 +1,193 @@
+import sqlite3
+import hashlib
+import argparse
+
+from storage_backends import get_backend
+from table_lineage import current_version, record_table_version
+
+# The columns that identify a row of each table. A table can have several candidate keys
+# (the raw tables keep the full 'M/D/YYYY h:mm:ss AM' timestamp in one column, the
+# modified ones split it into Date, Time and TimeOfDay); the first one whose columns all
+# exist is used. Column names match case-insensitively, like SQLite's.
+NATURAL_KEYS = {
+    "daily_activity": [("Id", "ActivityDate")],
+    "heart_rate": [("Id", "Date", "Time", "TimeOfDay"), ("Id", "Time")],
+    "hourly_calories": [("Id", "Date", "ActivityHour", "TimeOfDay"), ("Id", "ActivityHour")],
+    "hourly_intensity": [("Id", "Date", "ActivityHour", "TimeOfDay"), ("Id", "ActivityHour")],
+    "hourly_steps": [("Id", "Date", "ActivityHour", "TimeOfDay"), ("Id", "ActivityHour")],
+    "minute_sleep": [("Id", "logId", "Date", "Time", "TimeOfDay"), ("Id", "logId", "Date")],
+    "weight_log": [("Id", "LogId")],
+    "merged_hourly_activity": [("Id", "Date", "ActivityHour", "TimeOfDay")],
+    "merged_sleep_activity": [("Id", "Date")],
+    "merged_heart_rate_activity": [("Id", "Date")],
+    "daily_features": [("Id", "Date")],
+    "weekday_profiles": [("Id", "Weekday")],
+    "daily_heart_rate": [("Id", "Date")],
+    "sleep_episodes": [("Id", "logId")],
+}
+
+
+def natural_key(table_name, use_modified=False):
+    """
+    The natural key columns of a table, as named in the table.
+
+    Returns:
+        list: The column names, None if the table has no declared key or none of its
+        candidate keys matches the table's columns.
+    """
+    columns = {name.lower(): name for name in get_backend(use_modified).schema(table_name)}
+    for candidate in NATURAL_KEYS.get(table_name, []):
+        if all(column.lower() in columns for column in candidate):
+            return [columns[column.lower()] for column in candidate]
+    return None
+
+
+def _quoted(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def _index_name(table_name):
+    return f"uq_{table_name}_natural_key"
+
+
+def count_rows(table_name, use_modified=False):
+    """
+    The number of rows of a table, with a COUNT(*) on SQLite.
+    """
+    backend = get_backend(use_modified)
+    if backend.name != "sqlite":
+        return len(backend.scan(table_name, columns=list(backend.schema(table_name))[:1]))
+    conn = sqlite3.connect(backend.db_path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def count_duplicates(table_name, columns=None, use_modified=False):
+    """
+    The number of rows that repeat an earlier row, compared on the given columns
+    (all columns if None). On SQLite the count is one query, the rows are not read.
+    """
+    backend = get_backend(use_modified)
+    if backend.name != "sqlite":
+        return int(backend.scan(table_name, columns=columns).duplicated().sum())
+
+    select = _quoted(columns) if columns else "*"
+    conn = sqlite3.connect(backend.db_path)
+    try:
+        return conn.execute(
+            f'SELECT (SELECT COUNT(*) FROM "{table_name}") - (SELECT COUNT(*) FROM (SELECT DISTINCT {select} FROM "{table_name}"))'
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _record_dedup(table_name, columns, removed, row_count, use_modified):
+    # The rows are never read, so the new hash chains the previous one with the change
+    previous = current_version(table_name, use_modified)
+    digest = hashlib.sha1(
+        f"{previous['content_hash'] if previous else ''}|dedupe {','.join(columns)} -{removed}".encode()
+    ).hexdigest()
+    record_table_version(table_name, None, "dedupe_table", inputs=list(previous["inputs"]) if previous else None,
+                         use_modified=use_modified, row_count=row_count, digest=digest)
+
+
+def dedupe_table(table_name, columns=None, use_modified=False):
+    """
+    Removes the rows whose key repeats an earlier row, keeping the first one, like
+    DataFrame.drop_duplicates(subset=columns). On SQLite this is a single DELETE and
+    the table is not read into Python; other backends rewrite the table.
+
+    Parameters:
+        table_name (str): The table.
+        columns (list): The key, defaults to the table's natural key, or all columns
+            if it has none.
+
+    Returns:
+        int: The number of rows removed.
+    """
+    backend = get_backend(use_modified)
+    columns = columns or natural_key(table_name, use_modified) or list(backend.schema(table_name))
+
+    if backend.name != "sqlite":
+        df = backend.scan(table_name)
+        deduped = df.drop_duplicates(subset=columns)
+        removed = len(df) - len(deduped)
+        if removed:
+            backend.write(deduped, table_name)
+            _record_dedup(table_name, columns, removed, len(deduped), use_modified)
+        return removed
+
+    conn = sqlite3.connect(backend.db_path)
+    try:
+        with conn:
+            # GROUP BY puts NULLs in one group, so rows that only differ by a NULL and
+            # a NULL count as duplicates, as in pandas
+            removed = conn.execute(
+                f'DELETE FROM "{table_name}" WHERE rowid NOT IN '
+                f'(SELECT MIN(rowid) FROM "{table_name}" GROUP BY {_quoted(columns)})'
+            ).rowcount
+    finally:
+        conn.close()
+    if removed:
+        _record_dedup(table_name, columns, removed, count_rows(table_name, use_modified), use_modified)
+    return removed
+
+
+def create_unique_index(table_name, columns=None, use_modified=False):
+    """
+    Adds a UNIQUE index on the natural key, so appends through the SQLite backend skip
+    rows that are already in the table (INSERT OR IGNORE). The table must not contain
+    duplicates, run dedupe_table first. Rewriting the table with save_table_data drops
+    the index.
+
+    Returns:
+        bool: True if the index exists afterwards.
+    """
+    backend = get_backend(use_modified)
+    columns = columns or natural_key(table_name, use_modified)
+    if backend.name != "sqlite" or not columns:
+        return False
+    conn = sqlite3.connect(backend.db_path)
+    try:
+        with conn:
+            conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{_index_name(table_name)}" '
+                         f'ON "{table_name}" ({_quoted(columns)})')
+    except sqlite3.IntegrityError as e:
+        print(f"Could not create the unique index on '{table_name}', it still has duplicates: {e}")
+        return False
+    finally:
+        conn.close()
+    return True
+
+
+def enforce_natural_keys(tables=None, use_modified=False):
+    """
+    Removes duplicate rows by natural key and adds the UNIQUE indexes, for the given
+    tables (default: every table with a declared key). Prints the removed rows per table.
+
+    Returns:
+        dict: Table name -> number of rows removed.
+    """
+    existing = set(get_backend(use_modified).list_tables())
+    removed = {}
+    for table_name in tables or NATURAL_KEYS:
+        if table_name not in existing:
+            continue
+        columns = natural_key(table_name, use_modified)
+        if columns is None:
+            print(f"No natural key of '{table_name}' matches its columns, skipped.")
+            continue
+        removed[table_name] = dedupe_table(table_name, columns, use_modified=use_modified)
+        create_unique_index(table_name, columns, use_modified=use_modified)
+        print(f"Removed {removed[table_name]} duplicate rows from '{table_name}' (key: {', '.join(columns)}).")
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove duplicate rows by natural key and add UNIQUE indexes.")
+    parser.add_argument("--raw", action="store_true", help="Use the raw database instead of the modified one.")
+    parser.add_argument("--tables", nargs="*", choices=sorted(NATURAL_KEYS), help="Only these tables.")
+    args = parser.parse_args()
+    enforce_natural_keys(args.tables, use_modified=not args.raw)
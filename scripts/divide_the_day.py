@@ -1,23 +1,17 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
 import os
 import sys
+from database_queries import scan_table
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def load_data_from_database(db_path, query): 
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
-    connection.close()
-
-    return df
+def load_data_from_database(table_name, columns=None, filters=None, use_modified=True):
+    # Reads through the configured storage backend, only the given columns and matching rows
+    return scan_table(table_name, columns=columns, filters=filters, use_modified=use_modified)
 
 def convert_time_to_twentyfour_hours(df, time_column):
     df['Hour'] = df[time_column].str.split(':').str[0].astype(int)
@@ -55,21 +49,16 @@ def plot_bar_chart(df, value_column, title, ylabel, color):
     plt.show()
 
 def main():
-    db_path = os.path.join(BASE_DIR, "..", "data", "fitbit_database_modified.db")
-
-    query_steps_by_pm = "SELECT ActivityHour, StepTotal, TimeOfDay FROM hourly_steps WHERE TimeOfDay = 'PM'"
-    query_steps_by_am = "SELECT ActivityHour, StepTotal, TimeOfDay FROM hourly_steps WHERE TimeOfDay = 'AM'"
-    query_calories_pm = "SELECT ActivityHour, Calories, TimeOfDay FROM hourly_calories WHERE TimeOfDay = 'PM'"
-    query_calories_am = "SELECT ActivityHour, Calories, TimeOfDay FROM hourly_calories WHERE TimeOfDay = 'AM'"
-    query_sleep_pm = "SELECT Value AS MinutesAsleep, Time, TimeOfDay FROM minute_sleep WHERE TimeOfDay = 'PM'"
-    query_sleep_am = "SELECT Value AS MinutesAsleep, Time, TimeOfDay FROM minute_sleep WHERE TimeOfDay = 'AM'"
- 
-    steps_pm = load_data_from_database(db_path, query_steps_by_pm)
-    steps_am = load_data_from_database(db_path, query_steps_by_am)
-    calories_pm = load_data_from_database(db_path, query_calories_pm)
-    calories_am = load_data_from_database(db_path, query_calories_am)
-    sleep_pm = load_data_from_database(db_path, query_sleep_pm)
-    sleep_am = load_data_from_database(db_path, query_sleep_am)
+    steps_columns = ["ActivityHour", "StepTotal", "TimeOfDay"]
+    calories_columns = ["ActivityHour", "Calories", "TimeOfDay"]
+    sleep_columns = ["value", "Time", "TimeOfDay"]
+
+    steps_pm = load_data_from_database("hourly_steps", steps_columns, [("TimeOfDay", "=", "PM")])
+    steps_am = load_data_from_database("hourly_steps", steps_columns, [("TimeOfDay", "=", "AM")])
+    calories_pm = load_data_from_database("hourly_calories", calories_columns, [("TimeOfDay", "=", "PM")])
+    calories_am = load_data_from_database("hourly_calories", calories_columns, [("TimeOfDay", "=", "AM")])
+    sleep_pm = load_data_from_database("minute_sleep", sleep_columns, [("TimeOfDay", "=", "PM")]).rename(columns={"value": "MinutesAsleep"})
+    sleep_am = load_data_from_database("minute_sleep", sleep_columns, [("TimeOfDay", "=", "AM")]).rename(columns={"value": "MinutesAsleep"})
 
     average_steps = compute_average_per_time_block(assign_time_blocks(convert_time_to_twentyfour_hours(pd.concat([steps_pm, steps_am]), 'ActivityHour')), 'StepTotal')
     average_calories = compute_average_per_time_block(assign_time_blocks(convert_time_to_twentyfour_hours(pd.concat([calories_pm, calories_am]), 'ActivityHour')), 'Calories')
@@ -1,15 +1,23 @@
-import sqlite3
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from perf_probes import probed
+
 def plot_activity_distribution(daily_activity_df):
     activity_sums = daily_activity_df[["VeryActiveMinutes", "FairlyActiveMinutes", 
                                        "LightlyActiveMinutes", "SedentaryMinutes"]].sum()
+    return plot_activity_sums(activity_sums)
 
+@probed("plot: plot_activity_sums")
+def plot_activity_sums(activity_sums):
+    """
+    Pie chart of precomputed activity-minute totals (a Series indexed by the column names).
+    """
     # Define color scheme (progressively darker shades of red)
     colors = ["#990000", "#cc3333", "#ff6666", "#ff9999"]
 
@@ -27,18 +35,27 @@ def plot_sleep_duration_histogram(minute_sleep_df):
     for use in Streamlit.
     """
     # Combine date, time, and TimeOfDay into a single datetime column
-    minute_sleep_df["datetime"] = pd.to_datetime(
+    # (kept outside the DataFrame so a shared, cached frame is not modified)
+    sleep_datetime = pd.to_datetime(
         minute_sleep_df["Date"] + " " + minute_sleep_df["Time"] + " " + minute_sleep_df["TimeOfDay"], 
         format="%m/%d/%Y %I:%M:%S %p"
     )
 
     # Calculate sleep duration per logId
-    sleep_durations = minute_sleep_df.groupby("logId")["datetime"].agg(["min", "max"])
+    sleep_durations = sleep_datetime.groupby(minute_sleep_df["logId"]).agg(["min", "max"])
     sleep_durations["duration"] = (sleep_durations["max"] - sleep_durations["min"]).dt.total_seconds() / 3600  
 
+    counts, edges = np.histogram(sleep_durations["duration"], bins=20)
+    return plot_sleep_duration_bins(counts, edges)
+
+@probed("plot: plot_sleep_duration_bins")
+def plot_sleep_duration_bins(counts, edges):
+    """
+    Histogram figure of sleep durations from precomputed bin counts and edges.
+    """
     # Create the histogram figure
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.hist(sleep_durations["duration"], bins=20, color="skyblue", edgecolor="black", alpha=0.7)
+    ax.stairs(counts, edges, fill=True, color="skyblue", edgecolor="black", alpha=0.7)
     ax.set_xlabel("Sleep Duration (Hours)")
     ax.set_ylabel("Frequency")
     ax.set_title("Distribution of Sleep Durations")
@@ -47,18 +64,14 @@ def plot_sleep_duration_histogram(minute_sleep_df):
     return fig 
 
 
-def plot_heart_rate(df, user_id, date, nth_exercise):
+def heart_rate_session(df, user_id, date, nth_exercise):
     """
-    Plots the heart rate for a specific user, date, and nth exercise session.
-
-    Parameters:
-        df (pd.DataFrame): The heart rate DataFrame containing columns ['Id', 'date', 'time', 'TimeOfDay', 'Value'].
-        user_id (int): The user ID.
-        date (str): The date in 'MM/DD/YYYY' format.
-        nth_exercise (int): The exercise session number of the day.
+    Selects the nth exercise session of a user on a date from the heart rate data.
+    A gap of more than 10 minutes between readings starts a new session.
 
     Returns:
-        fig (matplotlib.figure.Figure): The figure containing the heart rate plot.
+        df_exercise (pd.DataFrame): The readings of the session, with Time as datetime.
+        total_sessions (int): The number of sessions on that day.
     """
     nth_exercise = int(nth_exercise)
     # Filter the DataFrame for the specific user and date
@@ -83,6 +96,24 @@ def plot_heart_rate(df, user_id, date, nth_exercise):
 
     # Select the nth exercise session
     df_exercise = user_df[user_df["Session"] == nth_exercise]
+    return df_exercise, total_sessions
+
+
+@probed("plot: plot_heart_rate")
+def plot_heart_rate(df, user_id, date, nth_exercise):
+    """
+    Plots the heart rate for a specific user, date, and nth exercise session.
+
+    Parameters:
+        df (pd.DataFrame): The heart rate DataFrame containing columns ['Id', 'date', 'time', 'TimeOfDay', 'Value'].
+        user_id (int): The user ID.
+        date (str): The date in 'MM/DD/YYYY' format.
+        nth_exercise (int): The exercise session number of the day.
+
+    Returns:
+        fig (matplotlib.figure.Figure): The figure containing the heart rate plot.
+    """
+    df_exercise, total_sessions = heart_rate_session(df, user_id, date, nth_exercise)
 
     # Create figure
     fig, ax = plt.subplots(figsize=(10, 5))
@@ -99,17 +130,10 @@ def plot_heart_rate(df, user_id, date, nth_exercise):
 
     return fig  # Return the figure for use in Streamlit
 
-def plot_total_intensity(df, user_id, date):
-    """
-    Plots the total intensity for a specific user and date using a DataFrame.
-
-    Parameters:
-        df (pd.DataFrame): The DataFrame containing hourly intensity data.
-        user_id (int or float): The user ID (Id column in DataFrame).
-        date (str): The date in 'MM/DD/YYYY' format.
 
-    Returns:
-        fig (matplotlib.figure.Figure): The figure containing the total intensity plot.
+def intensity_for_day(df, user_id, date):
+    """
+    The hourly intensity rows of a user on a date, with ActivityHour as datetime and sorted by it.
     """
     # Filter the DataFrame for the specific user and date
     user_df = df[(df["Id"] == user_id) & (df["Date"] == date)].copy()
@@ -121,6 +145,23 @@ def plot_total_intensity(df, user_id, date):
 
     # Sort by corrected time
     user_df = user_df.sort_values(by='ActivityHour').reset_index(drop=True)
+    return user_df
+
+
+@probed("plot: plot_total_intensity")
+def plot_total_intensity(df, user_id, date):
+    """
+    Plots the total intensity for a specific user and date using a DataFrame.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame containing hourly intensity data.
+        user_id (int or float): The user ID (Id column in DataFrame).
+        date (str): The date in 'MM/DD/YYYY' format.
+
+    Returns:
+        fig (matplotlib.figure.Figure): The figure containing the total intensity plot.
+    """
+    user_df = intensity_for_day(df, user_id, date)
 
     # Create figure
     fig, ax = plt.subplots(figsize=(10, 5))
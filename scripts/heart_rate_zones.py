@@ -0,0 +1,201 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from database_queries import scan_table, save_table_data
+from storage_backends import get_backend
+from perf_probes import probed
+from dedup import enforce_natural_keys
+
+# Resting heart rate, time in each heart-rate zone and peak heart rate per user and day,
+# from every heart_rate sample. The samples of a batch of users are sorted by (Id, time)
+# once; a user-day is then a contiguous segment and every statistic is a segment
+# reduction (np.add.reduceat, np.maximum.reduceat, np.bincount) instead of a groupby.
+DAILY_TABLE = "daily_heart_rate"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ZONES_PATH = os.path.join(BASE_DIR, "..", "data", "heart_rate_zones.json")
+
+ZONES = ["OutOfRange", "FatBurn", "Cardio", "Peak"]
+# Fitbit's default zones start at 50%, 70% and 85% of the maximum heart rate (220 - age).
+# The dataset has no ages, so users without their own boundaries get those of a 30-year-old.
+DEFAULT_MAX_HR = 190
+ZONE_FRACTIONS = (0.5, 0.7, 0.85)
+
+# A sample stands for the time since the previous sample of the same user, at most this
+# long: a longer gap means the tracker was off, not that the heart rate held still
+MAX_GAP_SECONDS = 60
+# Resting heart rate: the time-weighted 10th percentile of the day, for days with at
+# least an hour of samples
+RESTING_QUANTILE = 0.1
+MIN_RESTING_MINUTES = 60
+
+# Users per batch, so only a part of the samples is in memory at a time
+BATCH_USERS = 50
+
+DAILY_COLUMNS = (["Id", "Date", "Samples", "MonitoredMinutes", "RestingHR", "MeanHR", "PeakHR"]
+                 + [f"{zone}Minutes" for zone in ZONES])
+
+
+def zone_boundaries(max_hr=DEFAULT_MAX_HR):
+    """
+    The lower bounds (bpm) of the FatBurn, Cardio and Peak zones for a maximum heart rate.
+    """
+    return tuple(int(round(max_hr * fraction)) for fraction in ZONE_FRACTIONS)
+
+
+def load_zone_boundaries(path=ZONES_PATH):
+    """
+    Per-user zone boundaries from a JSON file: {"<Id>": <max HR>} or
+    {"<Id>": [<FatBurn>, <Cardio>, <Peak> lower bounds]}.
+
+    Returns:
+        dict: User Id -> (FatBurn, Cardio, Peak) lower bounds, empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        settings = json.load(f)
+    boundaries = {}
+    for user_id, value in settings.items():
+        bounds = zone_boundaries(value) if isinstance(value, (int, float)) else tuple(value)
+        if len(bounds) != len(ZONES) - 1 or list(bounds) != sorted(bounds):
+            print(f"Ignored the zone boundaries of user {user_id}: expected a maximum heart rate or "
+                  f"{len(ZONES) - 1} increasing lower bounds, got {value}.")
+            continue
+        boundaries[int(user_id)] = bounds
+    return boundaries
+
+
+def timestamp_seconds(samples):
+    """
+    Seconds since the epoch of the 'M/D/YYYY' Date and 'h:mm:ss' Time + AM/PM TimeOfDay
+    columns of the modified tables (heart_rate, minute_sleep). Both are parsed through
+    to_datetime's cache of unique values, a few hundred days and at most 86400 times of
+    day, instead of one timestamp string per row.
+
+    Returns:
+        np.ndarray: int64 seconds, one per row.
+    """
+    days = pd.to_datetime(samples["Date"], format="%m/%d/%Y").to_numpy().astype("datetime64[s]").astype(np.int64)
+    clock = pd.to_datetime(samples["Time"] + " " + samples["TimeOfDay"], format="%I:%M:%S %p")
+    return days + (clock - pd.Timestamp("1900-01-01")).dt.total_seconds().to_numpy().astype(np.int64)
+
+
+@probed("numpy: compute_daily_heart_rate")
+def compute_daily_heart_rate(samples, boundaries=None):
+    """
+    The daily heart-rate statistics of a set of samples.
+
+    Parameters:
+        samples (pd.DataFrame): heart_rate rows (Id, Date, Time, TimeOfDay, Value) of
+            complete users, in any order.
+        boundaries (dict): User Id -> (FatBurn, Cardio, Peak) lower bounds, users not in
+            it use zone_boundaries().
+
+    Returns:
+        pd.DataFrame: DAILY_COLUMNS per user and day: the number of samples, the
+        minutes covered (each sample weighted by the time since the previous one, at most
+        MAX_GAP_SECONDS), RestingHR, the time-weighted MeanHR, PeakHR and the minutes
+        in each of the ZONES.
+    """
+    if samples.empty:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+    boundaries = boundaries or {}
+
+    seconds = timestamp_seconds(samples)
+    ids = samples["Id"].to_numpy(dtype=np.int64)
+    order = np.lexsort((seconds, ids))
+    seconds, ids = seconds[order], ids[order]
+    values = samples["Value"].to_numpy(dtype=float)[order]
+    dates = samples["Date"].to_numpy()[order]
+    n = len(values)
+
+    new_user = np.r_[True, ids[1:] != ids[:-1]]
+    gaps = np.diff(seconds, prepend=seconds[0])
+    gaps[new_user] = 0
+    weights = np.minimum(gaps, MAX_GAP_SECONDS) / 60.0
+
+    days = seconds // 86400
+    new_day = new_user | np.r_[True, days[1:] != days[:-1]]
+    starts = np.flatnonzero(new_day)
+    ends = np.r_[starts[1:], n]
+    segment = np.cumsum(new_day) - 1
+
+    minutes = np.add.reduceat(weights, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(minutes > 0, np.add.reduceat(weights * values, starts) / minutes, np.nan)
+    peak = np.maximum.reduceat(values, starts)
+
+    # Zone of every sample against its user's boundaries, then the minutes per (day, zone)
+    users, user_index = np.unique(ids, return_inverse=True)
+    bounds = np.array([boundaries.get(int(user_id), zone_boundaries()) for user_id in users], dtype=float)
+    zone = (values[:, None] >= bounds[user_index]).sum(axis=1)
+    zone_minutes = np.bincount(segment * len(ZONES) + zone, weights=weights,
+                               minlength=len(starts) * len(ZONES)).reshape(len(starts), len(ZONES))
+
+    # Weighted quantile per day: sorted by (day, value) the segments keep their start
+    # positions, and the global cumulative weight reaches start + q * minutes inside the day
+    by_value = np.lexsort((values, segment))
+    sorted_weights = weights[by_value]
+    cumulative = np.cumsum(sorted_weights)
+    before = cumulative[starts] - sorted_weights[starts]
+    position = np.searchsorted(cumulative, before + RESTING_QUANTILE * minutes, side="left")
+    position = np.clip(position, starts, ends - 1)
+    resting = np.where(minutes >= MIN_RESTING_MINUTES, values[by_value][position], np.nan)
+
+    daily = pd.DataFrame({
+        "Id": ids[starts],
+        "Date": dates[starts],
+        "Samples": ends - starts,
+        "MonitoredMinutes": minutes,
+        "RestingHR": resting,
+        "MeanHR": mean,
+        "PeakHR": peak,
+    })
+    for j, zone_name in enumerate(ZONES):
+        daily[f"{zone_name}Minutes"] = zone_minutes[:, j]
+    return daily
+
+
+def build_daily_heart_rate(use_modified=True, boundaries=None, batch_users=BATCH_USERS):
+    """
+    Computes daily_heart_rate from the whole heart_rate table, BATCH_USERS users at a time.
+
+    Parameters:
+        boundaries (dict): User Id -> zone lower bounds, defaults to load_zone_boundaries().
+        batch_users (int): Users per batch.
+
+    Returns:
+        pd.DataFrame: The stored table.
+    """
+    if boundaries is None:
+        boundaries = load_zone_boundaries()
+    backend = get_backend(use_modified)
+    if "heart_rate" not in backend.list_tables():
+        print("The heart_rate table does not exist, daily_heart_rate was not built.")
+        return None
+
+    users = sorted(int(user_id) for user_id in backend.distinct("heart_rate", ["Id"])["Id"])
+    frames = []
+    for i in range(0, len(users), batch_users):
+        samples = scan_table("heart_rate", columns=["Id", "Date", "Time", "TimeOfDay", "Value"],
+                             filters=[("Id", "in", users[i:i + batch_users])], use_modified=use_modified)
+        frames.append(compute_daily_heart_rate(samples, boundaries))
+    daily = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=DAILY_COLUMNS)
+
+    save_table_data(daily, DAILY_TABLE, use_modified=use_modified, inputs=["heart_rate"])
+    enforce_natural_keys([DAILY_TABLE], use_modified=use_modified)
+    print(f"Built {DAILY_TABLE}: {len(daily)} user-days of {len(users)} users.")
+    return daily
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute daily resting heart rate, zone minutes and peak heart rate.")
+    parser.add_argument("--zones", default=ZONES_PATH,
+                        help="JSON file with per-user zone boundaries, see load_zone_boundaries.")
+    parser.add_argument("--batch-users", type=int, default=BATCH_USERS, help="Users per batch.")
+    args = parser.parse_args()
+    build_daily_heart_rate(use_modified=True, boundaries=load_zone_boundaries(args.zones), batch_users=args.batch_users)
@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import uuid
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from storage_backends import get_backend
+from database_queries import save_table_data, append_table_data
+from dedup import enforce_natural_keys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(BASE_DIR, "..", "data", "ingest_state.json")
+
+BLOCK_SIZE = 16 * 2**20
+MAX_WORKERS = 4
+# Parsed blocks waiting to be written, so memory stays bounded on large exports
+MAX_PENDING_BLOCKS = 8
+
+# Raw table -> (lower-case file name prefix in a Fitbit export, columns and types).
+# The columns are those part4_wrangling.py expects in the raw database. Dates stay text
+# in the export's 'M/D/YYYY h:mm:ss AM' format, the wrangling step splits them.
+EXPORT_TABLES = {
+    "daily_activity": ("dailyactivity", [
+        ("Id", pa.int64()), ("ActivityDate", pa.string()), ("TotalSteps", pa.int64()),
+        ("TotalDistance", pa.float64()), ("TrackerDistance", pa.float64()),
+        ("LoggedActivitiesDistance", pa.float64()), ("VeryActiveDistance", pa.float64()),
+        ("ModeratelyActiveDistance", pa.float64()), ("LightActiveDistance", pa.float64()),
+        ("SedentaryActiveDistance", pa.float64()), ("VeryActiveMinutes", pa.int64()),
+        ("FairlyActiveMinutes", pa.int64()), ("LightlyActiveMinutes", pa.int64()),
+        ("SedentaryMinutes", pa.int64()), ("Calories", pa.int64()),
+    ]),
+    "heart_rate": ("heartrate_seconds", [("Id", pa.int64()), ("Time", pa.string()), ("Value", pa.int64())]),
+    "hourly_calories": ("hourlycalories", [("Id", pa.int64()), ("ActivityHour", pa.string()), ("Calories", pa.int64())]),
+    "hourly_intensity": ("hourlyintensities", [
+        ("Id", pa.int64()), ("ActivityHour", pa.string()),
+        ("TotalIntensity", pa.int64()), ("AverageIntensity", pa.float64()),
+    ]),
+    "hourly_steps": ("hourlysteps", [("Id", pa.int64()), ("ActivityHour", pa.string()), ("StepTotal", pa.int64())]),
+    "minute_sleep": ("minutesleep", [("Id", pa.int64()), ("date", pa.string()), ("value", pa.int64()), ("logId", pa.int64())]),
+    "weight_log": ("weightloginfo", [
+        ("Id", pa.int64()), ("Date", pa.string()), ("WeightKg", pa.float64()), ("WeightPounds", pa.float64()),
+        ("Fat", pa.float64()), ("BMI", pa.float64()), ("IsManualReport", pa.int64()), ("LogId", pa.int64()),
+    ]),
+}
+
+# Columns parsed with another type than they are stored with: weightLogInfo writes
+# IsManualReport as True/False, the table keeps it as 0/1 (normalize_batch casts it)
+PARSE_TYPES = {("weight_log", "IsManualReport"): pa.bool_()}
+
+
+def _table_for_file(file_name):
+    name = file_name.lower()
+    if not name.endswith(".csv"):
+        return None
+    for table_name, (prefix, _) in EXPORT_TABLES.items():
+        if name.startswith(prefix):
+            return table_name
+    return None
+
+
+def discover_export_files(export_dir, tables=None):
+    """
+    Finds the CSV files of a Fitbit export, e.g. dailyActivity_merged.csv in each
+    "Fitabase Data <period>" folder.
+
+    Parameters:
+        export_dir (str): The export folder, searched recursively.
+        tables (list): Only files of these raw tables, None for all of EXPORT_TABLES.
+
+    Returns:
+        list: (table name, file path) tuples, sorted by path.
+    """
+    files = []
+    for dirpath, _, filenames in os.walk(export_dir):
+        for file_name in filenames:
+            table_name = _table_for_file(file_name)
+            if table_name is not None and (tables is None or table_name in tables):
+                files.append((table_name, os.path.join(dirpath, file_name)))
+    return sorted(files, key=lambda item: item[1])
+
+
+def _file_key(path, target):
+    # A file that changes size or mtime counts as a new file
+    stat = os.stat(path)
+    return f"{target}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def _header(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [name.strip() for name in f.readline().rstrip("\r\n").split(",")]
+
+
+def _open_reader(path, table_name, block_size=BLOCK_SIZE):
+    """
+    A streaming, multithreaded pyarrow CSV reader that yields the file in blocks,
+    with the export's column names matched case-insensitively to EXPORT_TABLES.
+    """
+    columns = EXPORT_TABLES[table_name][1]
+    by_lower = {name.lower(): (name, dtype) for name, dtype in columns}
+    header = _header(path)
+    column_types = {name: PARSE_TYPES.get((table_name, by_lower[name.lower()][0]), by_lower[name.lower()][1])
+                    for name in header if name.lower() in by_lower}
+    return pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=block_size, encoding="utf8"),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            include_columns=list(column_types),
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def normalize_batch(batch, table_name):
+    """
+    Renames the columns of a parsed block to the raw table's names and types, adding
+    missing columns as nulls (e.g. Fat, which older exports leave out).
+
+    Returns:
+        pd.DataFrame: The block with the columns of EXPORT_TABLES[table_name], in order.
+    """
+    by_lower = {name.lower(): i for i, name in enumerate(batch.schema.names)}
+    arrays = []
+    for name, dtype in EXPORT_TABLES[table_name][1]:
+        i = by_lower.get(name.lower())
+        arrays.append(batch.column(i).cast(dtype) if i is not None else pa.nulls(batch.num_rows, dtype))
+    table = pa.Table.from_arrays(arrays, names=[name for name, _ in EXPORT_TABLES[table_name][1]])
+    # Nullable integers stay integers instead of turning into floats
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+
+def _empty_frame(table_name):
+    columns = EXPORT_TABLES[table_name][1]
+    batch = pa.RecordBatch.from_arrays([pa.array([], dtype) for _, dtype in columns], names=[name for name, _ in columns])
+    return normalize_batch(batch, table_name)
+
+
+def read_export_csv(path, table_name, block_size=BLOCK_SIZE):
+    """
+    Reads a whole export CSV with the pyarrow reader and the normalized columns.
+    """
+    reader = _open_reader(path, table_name, block_size)
+    return normalize_batch(pa.Table.from_batches(list(reader), schema=reader.schema), table_name)
+
+
+def load_state(state_path=STATE_PATH):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state, state_path=STATE_PATH):
+    # Replaced in one rename, so an interrupted run never leaves a half-written file
+    tmp_path = f"{state_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, state_path)
+
+
+def _put(blocks, item, stop):
+    while not stop.is_set():
+        try:
+            blocks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _parse_file(table_name, path, skip_blocks, block_size, blocks, stop):
+    # Runs in a worker thread: parses one file and hands its blocks to the writer
+    try:
+        reader = _open_reader(path, table_name, block_size)
+        for i, batch in enumerate(reader):
+            if i >= skip_blocks and not _put(blocks, (path, i, normalize_batch(batch, table_name)), stop):
+                return
+    except Exception as e:
+        _put(blocks, (path, None, e), stop)
+        return
+    _put(blocks, (path, None, None), stop)
+
+
+def ingest_export(export_dir, tables=None, use_modified=False, replace=False,
+                  max_workers=MAX_WORKERS, block_size=BLOCK_SIZE, state_path=STATE_PATH):
+    """
+    Loads the CSV files of a Fitbit export into the raw database tables.
+
+    Files are parsed in parallel and in blocks, and the blocks are appended to the
+    tables through database_queries by this thread, which records their versions. After every block the state file
+    records how far each file got, so an interrupted run continues where it stopped and
+    files that were fully loaded are skipped. On SQLite the tables get a UNIQUE index on
+    their natural key first (see dedup.py), so rows that are already loaded, e.g. a block
+    loaded again after a crash or overlapping exports, are skipped.
+
+    Parameters:
+        export_dir (str): The export folder.
+        tables (list): Only load these tables, None for all.
+        use_modified (bool): Load into the modified database instead of the raw one.
+        replace (bool): Empty the tables and forget earlier progress first.
+        max_workers (int): Files parsed at the same time.
+        block_size (int): Bytes per parsed block.
+
+    Returns:
+        dict: Table name -> rows added in this run.
+    """
+    backend = get_backend(use_modified)
+    files = discover_export_files(export_dir, tables)
+    if not files:
+        print(f"No Fitbit export CSV files found in {export_dir}")
+        return {}
+
+    target = f"{backend.name}:{'modified' if use_modified else 'raw'}"
+    state = load_state(state_path)
+    if replace:
+        state = {key: entry for key, entry in state.items() if not key.startswith(target + "|")}
+    existing = set(backend.list_tables())
+    file_tables = sorted({table_name for table_name, _ in files})
+    for table_name in file_tables:
+        if replace or table_name not in existing:
+            save_table_data(_empty_frame(table_name), table_name, use_modified=use_modified, step="ingest_csv")
+    enforce_natural_keys(file_tables, use_modified=use_modified)
+
+    pending = []
+    for table_name, path in files:
+        key = _file_key(path, target)
+        entry = state.setdefault(key, {"table": table_name, "blocks": 0, "block_size": block_size,
+                                       "rows": 0, "done": False})
+        if not entry["done"] and entry["blocks"] and entry.get("block_size") != block_size:
+            # The blocks already loaded were cut at another size, so skipping that many
+            # blocks now would skip or repeat rows: the file starts over and the unique
+            # index skips the rows it already loaded
+            print(f"Restarting {path}: it was loaded in blocks of {entry.get('block_size')} bytes, "
+                  f"now {block_size}.")
+            entry["blocks"] = 0
+        entry["block_size"] = block_size
+        if entry["done"]:
+            print(f"Skipping {path}, already loaded ({entry['rows']} rows).")
+        else:
+            pending.append((table_name, path, key))
+
+    total_bytes = sum(os.path.getsize(path) for _, path, _ in pending) or 1
+    loaded_bytes = sum(min(state[key]["blocks"] * block_size, os.path.getsize(path)) for _, path, key in pending)
+    keys = {path: key for _, path, key in pending}
+    rows_loaded = {}
+
+    blocks = queue.Queue(maxsize=MAX_PENDING_BLOCKS)
+    stop = threading.Event()
+    open_files = len(pending)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest") as executor:
+        for table_name, path, key in pending:
+            executor.submit(_parse_file, table_name, path, state[key]["blocks"], block_size, blocks, stop)
+        try:
+            while open_files:
+                path, block_index, df = blocks.get()
+                entry = state[keys[path]]
+                if block_index is None:
+                    open_files -= 1
+                    if isinstance(df, Exception):
+                        print(f"Error reading {path}: {df}")
+                        continue
+                    entry["done"] = True
+                    save_state(state, state_path)
+                    print(f"Loaded {path}: {entry['rows']} rows into '{entry['table']}'.")
+                    continue
+
+                added = append_table_data(df, entry["table"], use_modified=use_modified, step="ingest_csv")
+                entry["blocks"] = block_index + 1
+                entry["rows"] += added
+                save_state(state, state_path)
+                if added < len(df):
+                    print(f"Skipped {len(df) - added} rows of {os.path.basename(path)} already in '{entry['table']}'.")
+
+                rows_loaded[entry["table"]] = rows_loaded.get(entry["table"], 0) + added
+                loaded_bytes = min(loaded_bytes + block_size, total_bytes)
+                print(f"[{100 * loaded_bytes / total_bytes:5.1f}%] {os.path.basename(path)}: {entry['rows']} rows")
+        finally:
+            # Stops the parsers if writing failed or the run was interrupted
+            stop.set()
+    return rows_loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the CSV files of a Fitbit export into the raw database.")
+    parser.add_argument("export_dir", help="Folder with the export's CSV files (searched recursively).")
+    parser.add_argument("--tables", nargs="*", choices=sorted(EXPORT_TABLES), help="Only load these tables.")
+    parser.add_argument("--replace", action="store_true", help="Empty the tables and start over instead of resuming.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Files parsed in parallel.")
+    parser.add_argument("--block-mb", type=float, default=BLOCK_SIZE / 2**20, help="Size of the parsed blocks in MB.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.export_dir):
+        sys.exit(f"Export folder not found: {args.export_dir}")
+    loaded = ingest_export(args.export_dir, tables=args.tables, replace=args.replace,
+                           max_workers=args.workers, block_size=int(args.block_mb * 2**20))
+    for table_name, rows in loaded.items():
+        print(f"{table_name}: {rows} rows loaded")
@@ -0,0 +1,195 @@
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from database_queries import DB_PATH, MODIFIED_DB_PATH, fetch_table_data
+from perf_probes import probed
+from storage_backends import get_backend
+from table_lineage import record_table_version, stale_inputs
+
+ACTIVITY_MINUTE_COLUMNS = ["VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes", "SedentaryMinutes"]
+SUM_COLUMNS = ["TotalSteps", "Calories", "TotalActiveMinutes"] + ACTIVITY_MINUTE_COLUMNS
+SLEEP_HISTOGRAM_BINS = 20
+
+# _kpi_summary holds one value per metric. Running sums and counts are stored next to
+# the averages so new rows can be added without rereading the source tables.
+# _kpi_seen_keys and _kpi_sleep_logs keep the distinct users/days and the start and end
+# of every sleep log, which the distinct counts and the sleep histogram need.
+# _kpi_seen_keys also holds the (Id, date) key of every daily_activity row that was
+# summed, so rows that are added again (a reloaded block, an overlapping export) are
+# not counted twice.
+# The tables are bookkeeping, so their names start with "_" like _table_versions.
+# The summary relies on SQLite upserts, so it only exists with the SQLite backend.
+SUMMARY_TABLE = "_kpi_summary"
+SEEN_KEYS_TABLE = "_kpi_seen_keys"
+SLEEP_LOGS_TABLE = "_kpi_sleep_logs"
+# The names before they were bookkeeping tables, dropped by build_kpi_summary
+OLD_TABLES = ["kpi_summary", "kpi_seen_keys", "kpi_sleep_logs"]
+
+
+def _connect(use_modified=True):
+    conn = sqlite3.connect(MODIFIED_DB_PATH if use_modified else DB_PATH)
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (metric TEXT PRIMARY KEY, value);
+    CREATE TABLE IF NOT EXISTS {SEEN_KEYS_TABLE} (kind TEXT, key TEXT, PRIMARY KEY (kind, key));
+    CREATE TABLE IF NOT EXISTS {SLEEP_LOGS_TABLE} (logId INTEGER PRIMARY KEY, start_time TEXT, end_time TEXT);
+    """)
+    return conn
+
+
+def _add_daily_activity(conn, daily_df):
+    daily_df = daily_df.copy()
+    if "TotalActiveMinutes" not in daily_df.columns:
+        daily_df["TotalActiveMinutes"] = (
+            daily_df["VeryActiveMinutes"] + daily_df["FairlyActiveMinutes"] + daily_df["LightlyActiveMinutes"]
+        )
+    date_column = "ActivityDate" if "ActivityDate" in daily_df.columns else "Date"
+
+    # Only the rows whose user-day was not summed before: the primary key ignores the
+    # insert of a key that is already there (or earlier in the batch)
+    row_keys = daily_df["Id"].astype(str) + "|" + daily_df[date_column].astype(str)
+    insert_key = f"INSERT OR IGNORE INTO {SEEN_KEYS_TABLE} (kind, key) VALUES ('daily', ?)"
+    new_rows = np.array([conn.execute(insert_key, (key,)).rowcount == 1 for key in row_keys], dtype=bool)
+    daily_df = daily_df[new_rows]
+    if daily_df.empty:
+        return
+
+    increments = [(f"sum_{col}", float(daily_df[col].sum())) for col in SUM_COLUMNS]
+    increments.append(("daily_rows", float(len(daily_df))))
+    conn.executemany(f"""
+    INSERT INTO {SUMMARY_TABLE} (metric, value) VALUES (?, ?)
+    ON CONFLICT(metric) DO UPDATE SET value = value + excluded.value;
+    """, increments)
+
+    keys = [("user", str(key)) for key in daily_df["Id"].unique()]
+    keys += [("day", str(key)) for key in daily_df[date_column].unique()]
+    conn.executemany(f"INSERT OR IGNORE INTO {SEEN_KEYS_TABLE} (kind, key) VALUES (?, ?)", keys)
+
+
+def _add_minute_sleep(conn, sleep_df):
+    # The modified table splits the timestamp into Date, Time and TimeOfDay, the raw one keeps it in Date
+    timestamps = sleep_df["Date"]
+    if "Time" in sleep_df.columns:
+        timestamps = timestamps + " " + sleep_df["Time"] + " " + sleep_df["TimeOfDay"]
+    sleep_datetime = pd.to_datetime(timestamps, format="%m/%d/%Y %I:%M:%S %p")
+    bounds = sleep_datetime.groupby(sleep_df["logId"]).agg(["min", "max"]).reset_index()
+    rows = [
+        (int(log_id), start.isoformat(), end.isoformat())
+        for log_id, start, end in bounds.itertuples(index=False)
+    ]
+    # A log that continues in the new rows keeps its earliest start and latest end
+    conn.executemany(f"""
+    INSERT INTO {SLEEP_LOGS_TABLE} (logId, start_time, end_time) VALUES (?, ?, ?)
+    ON CONFLICT(logId) DO UPDATE SET
+        start_time = MIN(start_time, excluded.start_time),
+        end_time = MAX(end_time, excluded.end_time);
+    """, rows)
+
+
+def _refresh_derived_values(conn):
+    values = dict(conn.execute(f"SELECT metric, value FROM {SUMMARY_TABLE}").fetchall())
+    rows = values.get("daily_rows") or 0
+    derived = {
+        "total_users": conn.execute(f"SELECT COUNT(*) FROM {SEEN_KEYS_TABLE} WHERE kind = 'user'").fetchone()[0],
+        "total_days": conn.execute(f"SELECT COUNT(*) FROM {SEEN_KEYS_TABLE} WHERE kind = 'day'").fetchone()[0],
+        "avg_steps": values.get("sum_TotalSteps", 0) / rows if rows else None,
+        "avg_calories": values.get("sum_Calories", 0) / rows if rows else None,
+        "avg_active_minutes": values.get("sum_TotalActiveMinutes", 0) / rows if rows else None,
+        "total_calories": values.get("sum_Calories", 0),
+        "total_active_minutes": values.get("sum_TotalActiveMinutes", 0),
+    }
+
+    logs = pd.read_sql_query(f"SELECT start_time, end_time FROM {SLEEP_LOGS_TABLE}", conn)
+    hours = (pd.to_datetime(logs["end_time"]) - pd.to_datetime(logs["start_time"])).dt.total_seconds() / 3600
+    if len(hours):
+        counts, edges = np.histogram(hours, bins=SLEEP_HISTOGRAM_BINS)
+    else:
+        counts, edges = np.array([]), np.array([])
+    derived["sleep_histogram_counts"] = json.dumps(counts.tolist())
+    derived["sleep_histogram_edges"] = json.dumps(edges.tolist())
+
+    conn.executemany(f"INSERT OR REPLACE INTO {SUMMARY_TABLE} (metric, value) VALUES (?, ?)", list(derived.items()))
+
+
+def update_kpi_summary(daily_df=None, sleep_df=None, use_modified=True):
+    """
+    Adds new rows of daily_activity and/or minute_sleep to the KPI summary.
+    Only the new rows are read. Adding rows again does not change the summary:
+    daily_activity rows whose (Id, date) was already summed are skipped and a sleep log
+    only widens to its earliest start and latest end.
+    database_queries.append_table_data calls it with the rows appended to either table.
+
+    Parameters:
+        daily_df (pd.DataFrame): New daily_activity rows.
+        sleep_df (pd.DataFrame): New minute_sleep rows, of the modified (Date, Time and
+            TimeOfDay) or the raw table (full timestamp in Date).
+    """
+    conn = _connect(use_modified)
+    with conn:
+        if daily_df is not None and not daily_df.empty:
+            _add_daily_activity(conn, daily_df)
+        if sleep_df is not None and not sleep_df.empty:
+            _add_minute_sleep(conn, sleep_df)
+        _refresh_derived_values(conn)
+    summary = pd.read_sql_query(f"SELECT metric, value FROM {SUMMARY_TABLE} ORDER BY metric", conn)
+    conn.close()
+    record_table_version(SUMMARY_TABLE, summary, "update_kpi_summary", inputs=["daily_activity", "minute_sleep"],
+                         use_modified=use_modified)
+
+
+def build_kpi_summary(use_modified=True):
+    """
+    Rebuilds the KPI summary from the full daily_activity and minute_sleep tables.
+    """
+    conn = _connect(use_modified)
+    with conn:
+        conn.executescript("".join(f"DELETE FROM {table_name};"
+                                   for table_name in [SUMMARY_TABLE, SEEN_KEYS_TABLE, SLEEP_LOGS_TABLE]))
+        conn.executescript("".join(f"DROP TABLE IF EXISTS {table_name};" for table_name in OLD_TABLES))
+    conn.close()
+
+    update_kpi_summary(
+        daily_df=fetch_table_data("daily_activity", use_modified=use_modified),
+        sleep_df=fetch_table_data("minute_sleep", use_modified=use_modified),
+        use_modified=use_modified,
+    )
+    print(f"KPI summary table '{SUMMARY_TABLE}' has been built.")
+
+
+@probed("sql: load_kpi_summary")
+def load_kpi_summary(use_modified=True):
+    """
+    Reads the precomputed KPI values for the Home page.
+
+    Returns:
+        dict with total_users, total_days, avg_steps, avg_calories, avg_active_minutes,
+        total_calories, total_active_minutes, activity_minutes (pd.Series of the four
+        activity-minute sums) and sleep_histogram (counts, edges).
+        None if the summary has not been built yet, is older than daily_activity or
+        minute_sleep, or the backend is not SQLite.
+    """
+    if get_backend(use_modified).name != "sqlite" or stale_inputs(SUMMARY_TABLE, use_modified):
+        return None
+    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        values = dict(conn.execute(f"SELECT metric, value FROM {SUMMARY_TABLE}").fetchall())
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    if not values.get("daily_rows"):
+        return None
+
+    kpis = {key: values[key] for key in [
+        "total_users", "total_days", "avg_steps", "avg_calories", "avg_active_minutes",
+        "total_calories", "total_active_minutes",
+    ]}
+    kpis["activity_minutes"] = pd.Series({col: values[f"sum_{col}"] for col in ACTIVITY_MINUTE_COLUMNS})
+    kpis["sleep_histogram"] = (
+        np.array(json.loads(values["sleep_histogram_counts"])),
+        np.array(json.loads(values["sleep_histogram_edges"])),
+    )
+    return kpis
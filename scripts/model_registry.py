@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from perf_probes import probed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_PATH = os.path.join(BASE_DIR, "..", "data", "model_registry.db")
+
+MAX_MEMORY_ENTRIES = 128
+MAX_STORED_ENTRIES = 1000
+MAX_AGE_SECONDS = 30 * 24 * 3600
+
+# In-process LRU in front of the SQLite store, so repeat lookups never leave Python
+_memory_cache = OrderedDict()
+
+
+class RegisteredModel:
+    """
+    The stored results of a fitted OLS model. It has the attributes of a statsmodels
+    results object that the scripts and the dashboard use (params, bse, pvalues,
+    rsquared, rsquared_adj, nobs, summary() and predict()), but not the raw residuals.
+    """
+
+    def __init__(self, record):
+        self.key = record["key"]
+        self.params = pd.Series(record["params"])
+        self.bse = pd.Series(record["bse"])
+        self.pvalues = pd.Series(record["pvalues"])
+        self.rsquared = record["rsquared"]
+        self.rsquared_adj = record["rsquared_adj"]
+        self.nobs = record["nobs"]
+        self.resid_summary = record["resid_summary"]
+        self.resampling = pd.DataFrame(record["resampling"]) if record.get("resampling") else None
+        self._summary_text = record["summary_text"]
+
+    def summary(self):
+        return self._summary_text
+
+    def predict(self, X):
+        X = pd.DataFrame(X)
+        return X[self.params.index].to_numpy(dtype=float) @ self.params.to_numpy()
+
+
+def _connect():
+    conn = sqlite3.connect(REGISTRY_PATH)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS models (
+        key TEXT PRIMARY KEY,
+        spec TEXT,
+        result TEXT,
+        created_at REAL,
+        last_used REAL
+    );
+    """)
+    return conn
+
+
+def frame_version(df, columns=None):
+    """
+    Content hash of (some columns of) a DataFrame, for callers that only have the frame.
+    """
+    if columns is not None:
+        df = df[list(columns)]
+    return f"{len(df)}-{int(pd.util.hash_pandas_object(df, index=False).sum()) & 0xFFFFFFFFFFFFFFFF:x}"
+
+
+def make_model_key(table_versions, filter_spec, target, predictors):
+    """
+    Builds the registry key from the versions of the input tables, the filters applied
+    to them, the target and the predictors.
+    """
+    spec = {
+        "tables": table_versions,
+        "filters": filter_spec,
+        "target": target,
+        "predictors": list(predictors),
+    }
+    spec_json = json.dumps(spec, sort_keys=True, default=str)
+    return hashlib.sha256(spec_json.encode()).hexdigest(), spec_json
+
+
+def summarize_model(model):
+    resid = np.asarray(model.resid, dtype=float)
+    resid_summary = {
+        "mean": float(resid.mean()),
+        "std": float(resid.std(ddof=1)) if len(resid) > 1 else float("nan"),
+        "min": float(resid.min()),
+        "q25": float(np.percentile(resid, 25)),
+        "median": float(np.median(resid)),
+        "q75": float(np.percentile(resid, 75)),
+        "max": float(resid.max()),
+        "skew": float(pd.Series(resid).skew()),
+        "kurtosis": float(pd.Series(resid).kurt()),
+    }
+    resampling = getattr(model, "resampling", None)
+    return {
+        "params": model.params.to_dict(),
+        "bse": model.bse.to_dict(),
+        "pvalues": model.pvalues.to_dict(),
+        "rsquared": float(model.rsquared),
+        "rsquared_adj": float(model.rsquared_adj),
+        "nobs": float(model.nobs),
+        "resid_summary": resid_summary,
+        "resampling": resampling.to_dict(orient="list") if resampling is not None else None,
+        "summary_text": str(model.summary()),
+    }
+
+
+def _remember(key, model):
+    _memory_cache[key] = model
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > MAX_MEMORY_ENTRIES:
+        _memory_cache.popitem(last=False)
+
+
+def load_model(key):
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key]
+
+    conn = _connect()
+    row = conn.execute("SELECT result FROM models WHERE key = ?", (key,)).fetchone()
+    if row is not None:
+        conn.execute("UPDATE models SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+    conn.close()
+    if row is None:
+        return None
+
+    record = json.loads(row[0])
+    record["key"] = key
+    model = RegisteredModel(record)
+    _remember(key, model)
+    return model
+
+
+def store_model(key, spec_json, record):
+    now = time.time()
+    conn = _connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO models (key, spec, result, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+        (key, spec_json, json.dumps(record), now, now)
+    )
+    conn.commit()
+    conn.close()
+    evict_models()
+
+    record = dict(record, key=key)
+    model = RegisteredModel(record)
+    _remember(key, model)
+    return model
+
+
+def evict_models(max_entries=MAX_STORED_ENTRIES, max_age_seconds=MAX_AGE_SECONDS):
+    """
+    Removes models that were not used for max_age_seconds, then the least recently
+    used ones above max_entries. Returns the number of removed models.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM models WHERE last_used < ?", (time.time() - max_age_seconds,))
+    removed = cursor.rowcount
+    cursor.execute("""
+    DELETE FROM models WHERE key IN (
+        SELECT key FROM models ORDER BY last_used DESC LIMIT -1 OFFSET ?
+    );
+    """, (max_entries,))
+    removed += cursor.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+
+@probed("model: registered_fit")
+def registered_fit(fit_function, target, predictors, table_versions=None, filter_spec=None, df=None):
+    """
+    Returns the stored results for this model spec, or fits and stores them.
+
+    Parameters:
+        fit_function (callable): Called without arguments on a miss, must return a fitted statsmodels model.
+        target (str): The target column.
+        predictors (list): The predictor columns.
+        table_versions (dict): Version token per input table, e.g. {'daily_activity': get_table_version(...)}.
+            When None, a content hash of df is used instead.
+        filter_spec (dict): The filters applied to the tables, e.g. {'Id': 1503960366}.
+        df (pd.DataFrame): The regression data, only needed without table_versions.
+
+    Returns:
+        RegisteredModel
+    """
+    if table_versions is None:
+        table_versions = {"frame": frame_version(df)}
+    key, spec_json = make_model_key(table_versions, filter_spec, target, predictors)
+
+    model = load_model(key)
+    if model is None:
+        model = store_model(key, spec_json, summarize_model(fit_function()))
+    return model
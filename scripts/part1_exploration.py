@@ -5,9 +5,12 @@ from datetime import datetime
 
 import statsmodels.api as sm
 
+from ingest_csv import read_export_csv
+
 
 def load_data(file_path = "dailyactivity.csv"):
-    df = pd.read_csv(file_path)
+    # Parsed with the multithreaded pyarrow reader and the daily_activity column types
+    df = read_export_csv(file_path, "daily_activity")
     df["ActivityDate"] = pd.to_datetime(df["ActivityDate"])
     return df
 
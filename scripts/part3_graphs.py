@@ -1,7 +1,6 @@
-import sqlite3
 import matplotlib.pyplot as plt
 import pandas as pd
-from pathlib import Path
+from database_queries import scan_table
 
 def plot_heart_rate(user_id, date, nth_exercise):
     """
@@ -12,25 +11,13 @@ def plot_heart_rate(user_id, date, nth_exercise):
         date (str): The date in 'MM/DD/YYYY' format.
         nth_exercise (int): The exercise session number of the day.
     """
-    # Define the database path
-    db_path = Path(__file__).resolve().parent.parent / "data" / "fitbit_database_modified.db"
-
-    # Connect to the database
-    conn = sqlite3.connect(str(db_path))
-    cursor = conn.cursor()
-
     # Fetch heart rate data for the specific user and date
-    query = """
-    SELECT Time, TimeOfDay, Value
-    FROM heart_rate
-    WHERE Id = ? AND Date = ?;
-    """
-    cursor.execute(query, (user_id, date))
-    rows = cursor.fetchall()
-    conn.close()
-
-    # Convert to DataFrame
-    df = pd.DataFrame(rows, columns=['Time', 'TimeOfDay', 'HeartRate'])
+    df = scan_table(
+        "heart_rate",
+        columns=['Time', 'TimeOfDay', 'Value'],
+        filters=[('Id', '=', user_id), ('Date', '=', date)],
+        use_modified=True,
+    ).rename(columns={'Value': 'HeartRate'})
 
     # Combine Time and TimeOfDay, then convert to 24-hour format
     df['Time'] = pd.to_datetime(df['Time'] + " " + df['TimeOfDay'], format='%I:%M:%S %p')
@@ -74,25 +61,13 @@ def plot_total_intensity(user_id, date):
         user_id (int or float): The user ID (Id column in database).
         date (str): The date in 'MM/DD/YYYY' format.
     """
-    # Define the database path
-    db_path = Path(__file__).resolve().parent.parent / "data" / "fitbit_database_modified.db"
-
-    # Connect to the database
-    conn = sqlite3.connect(str(db_path))
-    cursor = conn.cursor()
-
-    # Fetch intensity data for the specific user and date (no sorting in SQL)
-    query = """
-    SELECT ActivityHour, TimeOfDay, TotalIntensity
-    FROM hourly_intensity
-    WHERE Id = ? AND Date = ?;
-    """
-    cursor.execute(query, (user_id, date))
-    rows = cursor.fetchall()
-    conn.close()
-
-    # Convert to DataFrame
-    df = pd.DataFrame(rows, columns=['ActivityHour', 'TimeOfDay', 'TotalIntensity'])
+    # Fetch intensity data for the specific user and date (sorted below)
+    df = scan_table(
+        "hourly_intensity",
+        columns=['ActivityHour', 'TimeOfDay', 'TotalIntensity'],
+        filters=[('Id', '=', user_id), ('Date', '=', date)],
+        use_modified=True,
+    )
 
     # Combine ActivityHour and TimeOfDay, then convert to 24-hour format
     df['ActivityHour'] = pd.to_datetime(df['ActivityHour'] + " " + df['TimeOfDay'], format='%I:%M:%S %p')
@@ -1,8 +1,7 @@
 # %%
-import sqlite3
 import pandas as pd
 import statsmodels.api as sm
-conn = sqlite3.connect("/Users/andrew/Documents/VU_2025_1/Fitbit3/Fitbit3/fitbit_database_modified.db")
+from database_queries import scan_table
 
 # %%
 # check each column
@@ -15,40 +14,26 @@ conn = sqlite3.connect("/Users/andrew/Documents/VU_2025_1/Fitbit3/Fitbit3/fitbit
 
 # %%
 # activity data in daily_activity
-activity_query = """
-SELECT 
-    Id, 
-    ActivityDate, 
-    VeryActiveMinutes, 
-    FairlyActiveMinutes, 
-    LightlyActiveMinutes 
-FROM 
-    daily_activity;
-"""
-
-activity_data = pd.read_sql_query(activity_query, conn)
+activity_data = scan_table(
+    "daily_activity",
+    columns=["Id", "ActivityDate", "VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes"],
+    use_modified=True,
+)
 
 # sleep data in minute_sleep
-sleep_query = """
-SELECT 
-    Id, 
-    date as SleepDate, 
-    logId, 
-    SUM(value) as TotalMinutesAsleep 
-FROM 
-    minute_sleep
-GROUP BY 
-    Id, logId, SleepDate;
-"""
-
-sleep_data = pd.read_sql_query(sleep_query, conn)
+sleep_data = scan_table("minute_sleep", columns=["Id", "Date", "logId", "value"], use_modified=True)
+sleep_data = (
+    sleep_data.rename(columns={"Date": "SleepDate"})
+    .groupby(["Id", "logId", "SleepDate"], as_index=False)["value"].sum()
+    .rename(columns={"value": "TotalMinutesAsleep"})
+)
 
 sleep_data
 
 # %%
 # format
 activity_data['ActivityDate'] = pd.to_datetime(activity_data['ActivityDate'], format='%m/%d/%Y')
-sleep_data['SleepDate'] = pd.to_datetime(sleep_data['SleepDate'], format='%m/%d/%Y %I:%M:%S %p')
+sleep_data['SleepDate'] = pd.to_datetime(sleep_data['SleepDate'], format='%m/%d/%Y')
 
 # total active time
 activity_data['TotalActiveMinutes'] = (
@@ -1,10 +1,17 @@
+import argparse
 import pandas as pd
 import shutil
 import matplotlib.pyplot as plt
 from database_queries import get_table_names, fetch_table_data, save_table_data
-
-DB_PATH = "data/fitbit_database.db"
-MODIFIED_DB_PATH = "data/fitbit_database_modified.db"
+from storage_backends import DB_PATH, MODIFIED_DB_PATH, get_backend, copy_tables
+from table_lineage import track_tables
+from pipeline_scheduler import Step, run_steps
+from dedup import count_rows, count_duplicates, dedupe_table, enforce_natural_keys
+from kpi_summary import build_kpi_summary
+from rolling_features import build_features
+from heart_rate_zones import build_daily_heart_rate, timestamp_seconds
+from sleep_heart_rate import build_sleep_episodes
+from user_slices import create_user_indexes
 
 def check_missing_values(use_modified=False):
     tables = get_table_names()
@@ -28,12 +35,11 @@ def check_duplicates(use_modified=False):
     tables = get_table_names()
     
     for table in tables:
-        df = fetch_table_data(table, use_modified=use_modified) 
-        duplicates = df[df.duplicated()]
-        total_duplicates = len(duplicates)
+        # Counted in SQL, the table is not loaded
+        total_duplicates = count_duplicates(table, use_modified=use_modified)
         
         if total_duplicates > 0:
-            total_rows = len(df)
+            total_rows = count_rows(table, use_modified=use_modified)
             print(f"Found {total_duplicates}/{total_rows} duplicate rows in table '{table}'.")
         else:
             print(f"No duplicates found in table '{table}'.")
@@ -64,65 +70,67 @@ def check_outliers(use_modified=False):
 
 def create_modified_database():
     try:
-        shutil.copy(DB_PATH, MODIFIED_DB_PATH)
+        if get_backend().name != "sqlite":
+            copy_tables(get_backend(), get_backend(use_modified=True))
+        else:
+            shutil.copy(DB_PATH, MODIFIED_DB_PATH)
+        track_tables("create_modified_database", use_modified=True)
         print(f"Modified database created: {MODIFIED_DB_PATH}")
     except Exception as e:
         print(f"Error creating modified database: {e}")
 
-def fill_missing_weight(use_modified=False):
-    df = fetch_table_data("weight_log", use_modified=use_modified)
-    
+def fill_missing_weight_frame(df):
     if "WeightKg" in df.columns:
         median_weight = df["WeightKg"].median()
-        df["WeightKg"].fillna(median_weight, inplace=True)
-        
+        df["WeightKg"] = df["WeightKg"].fillna(median_weight)
+
         print(f"Filled missing WeightKg values with median: {median_weight:.2f}")
+    return df
+
+def fill_missing_weight(use_modified=False):
+    df = fill_missing_weight_frame(fetch_table_data("weight_log", use_modified=use_modified))
     save_table_data(df, "weight_log", use_modified=use_modified)
     return df
 
-def remove_fat_column(use_modified=False):
-    df = fetch_table_data("weight_log", use_modified=use_modified)
-    
+def remove_fat_column_frame(df):
     if "Fat" in df.columns:
         df.drop(columns=["Fat"], inplace=True)
         print("Removed 'Fat' column from weight_log table.")
+    return df
 
+def remove_fat_column(use_modified=False):
+    df = remove_fat_column_frame(fetch_table_data("weight_log", use_modified=use_modified))
     save_table_data(df, "weight_log", use_modified=use_modified)
     return df
 
 
 def remove_minute_sleep_duplicates(use_modified=False):
-    df = fetch_table_data("minute_sleep", use_modified=use_modified)
+    # One DELETE on the natural key (Id, logId, date and time), see dedup.py
+    removed_duplicates = dedupe_table("minute_sleep", use_modified=use_modified)
+    print(f"Removed {removed_duplicates} duplicate rows from 'minute_sleep' table.")
+    return removed_duplicates
 
-    if "value" in df.columns:
-        initial_count = len(df)
-        df = df.drop_duplicates()
-        final_count = len(df)
-        removed_duplicates = initial_count - final_count
 
-        print(f"Removed {removed_duplicates} duplicate rows from 'minute_sleep' table.")
-
-    save_table_data(df, "minute_sleep", use_modified=use_modified)
-    return df
-
-
-def rename_date_column(table_name):
-    df = fetch_table_data(table_name)
+def rename_date_column_frame(df, table_name):
+    # None when there is nothing to rename, so the table is not rewritten
     if 'date' in df.columns:
         df.rename(columns={'date': 'Date'}, inplace=True)
-        save_table_data(df, table_name)
-
         print(f"Renamed 'date' column to 'Date' in table: {table_name}")
-    else:
-        print(f"No 'date' column found in table: {table_name}")
+        return df
+    print(f"No 'date' column found in table: {table_name}")
+    return None
 
 
-def split_time_column(table_name, time_column_name):
-    df = fetch_table_data(table_name)
+def rename_date_column(table_name):
+    df = rename_date_column_frame(fetch_table_data(table_name), table_name)
+    if df is not None:
+        save_table_data(df, table_name)
+
 
+def split_time_column_frame(df, table_name, time_column_name):
     if time_column_name not in df.columns:
         print(f"Column '{time_column_name}' not found in table '{table_name}'")
-        return
+        return None
 
     if time_column_name == 'Date':
         df[['Date', 'Time', 'TimeOfDay']] = df[time_column_name].str.extract(r'(\d{1,2}/\d{1,2}/\d{4})\s(\d{1,2}:\d{2}:\d{2})\s(AM|PM)')
@@ -134,69 +142,79 @@ def split_time_column(table_name, time_column_name):
 
     print(f"Processed table: {table_name}")
     print(df.head())
+    return df
+
+
+def split_time_column(table_name, time_column_name):
+    df = split_time_column_frame(fetch_table_data(table_name), table_name, time_column_name)
+    if df is None:
+        return
 
     save_table_data(df, table_name, use_modified=True)
     print(f"Table '{table_name}' has been saved to the modified database.")
 
 
 
-def merge_hourly_activity_data(use_modified=False):
-    steps_df = fetch_table_data("hourly_steps", use_modified=use_modified)
-    calories_df = fetch_table_data("hourly_calories", use_modified=use_modified)
-    intensity_df = fetch_table_data("hourly_intensity", use_modified=use_modified)
+# The hour of a row: ActivityHour is the 'h:mm:ss' clock time, TimeOfDay tells 1 AM from 1 PM
+HOURLY_KEY = ["Id", "Date", "ActivityHour", "TimeOfDay"]
 
-    steps_df = steps_df.drop_duplicates(subset=["Id", "ActivityHour", "Date"])
-    calories_df = calories_df.drop_duplicates(subset=["Id", "ActivityHour", "Date"])
-    intensity_df = intensity_df.drop_duplicates(subset=["Id", "ActivityHour", "Date"])
 
-    merged_df = steps_df.merge(calories_df, on=["Id", "ActivityHour", "Date"], how="inner")
-    merged_df = merged_df.merge(intensity_df, on=["Id", "ActivityHour", "Date"], how="inner")
-    merged_df = merged_df.drop_duplicates()
+def merge_hourly_activity_frames(steps_df, calories_df, intensity_df):
+    # The hourly tables are unique on HOURLY_KEY (dedup.enforce_natural_keys runs before
+    # the merges), so the joins add no duplicate rows
+    merged_df = steps_df.merge(calories_df, on=HOURLY_KEY, how="inner")
+    return merged_df.merge(intensity_df, on=HOURLY_KEY, how="inner")
 
-    save_table_data(merged_df, "merged_hourly_activity", use_modified=use_modified)
-    return merged_df
 
+def merge_hourly_activity_data(use_modified=False):
+    merged_df = merge_hourly_activity_frames(
+        fetch_table_data("hourly_steps", use_modified=use_modified),
+        fetch_table_data("hourly_calories", use_modified=use_modified),
+        fetch_table_data("hourly_intensity", use_modified=use_modified),
+    )
+    save_table_data(merged_df, "merged_hourly_activity", use_modified=use_modified,
+                    inputs=["hourly_steps", "hourly_calories", "hourly_intensity"])
+    return merged_df
 
-def merge_sleep_activity_data(use_modified=False):
-    sleep_df = fetch_table_data("minute_sleep", use_modified=use_modified)
-    activity_df = fetch_table_data("daily_activity", use_modified=use_modified)
 
+def merge_daily_frames(df, activity_df):
+    # One row per (Id, Date) of df joined with that day's daily_activity row
     if 'ActivityDate' in activity_df.columns:
-        activity_df.rename(columns={'ActivityDate': 'Date'}, inplace=True)
+        activity_df = activity_df.rename(columns={'ActivityDate': 'Date'})
 
-    sleep_df = sleep_df.drop_duplicates(subset=["Id", "Date"])
-    activity_df = activity_df.drop_duplicates(subset=["Id", "Date"])
+    # daily_activity is unique on (Id, Date) by its natural key; df keeps its earliest row
+    # per day, which selects a row rather than removing duplicates. Sorting on the time
+    # first makes that row independent of the order the rows were read in (a chunked
+    # scan through the Id index returns them in index order, not table order).
+    if {"Time", "TimeOfDay"} <= set(df.columns):
+        df = df.assign(_seconds=timestamp_seconds(df)).sort_values(["Id", "_seconds"], kind="stable").drop(columns="_seconds")
+    df = df.drop_duplicates(subset=["Id", "Date"])
+    return df.merge(activity_df, on=["Id", "Date"], how="inner")
 
-    merged_df = sleep_df.merge(activity_df, on=["Id", "Date"], how="inner")
-    merged_df = merged_df.drop_duplicates()
 
-    save_table_data(merged_df, "merged_sleep_activity", use_modified=use_modified)
+def merge_sleep_activity_data(use_modified=False):
+    merged_df = merge_daily_frames(
+        fetch_table_data("minute_sleep", use_modified=use_modified),
+        fetch_table_data("daily_activity", use_modified=use_modified),
+    )
+    save_table_data(merged_df, "merged_sleep_activity", use_modified=use_modified, inputs=["minute_sleep", "daily_activity"])
     return merged_df
 
 
 
 def merge_heart_rate_activity_data(use_modified=False):
-    heart_rate_df = fetch_table_data("heart_rate", use_modified=use_modified)
-    activity_df = fetch_table_data("daily_activity", use_modified=use_modified)
-
-    if 'ActivityDate' in activity_df.columns:
-        activity_df.rename(columns={'ActivityDate': 'Date'}, inplace=True)
-
-    heart_rate_df = heart_rate_df.drop_duplicates(subset=["Id", "Date"])
-    activity_df = activity_df.drop_duplicates(subset=["Id", "Date"])
-
-    merged_df = heart_rate_df.merge(activity_df, on=["Id", "Date"], how="inner")
-
-    merged_df = merged_df.drop_duplicates()
-    
-    save_table_data(merged_df, "merged_heart_rate_activity", use_modified=use_modified)
+    merged_df = merge_daily_frames(
+        fetch_table_data("heart_rate", use_modified=use_modified),
+        fetch_table_data("daily_activity", use_modified=use_modified),
+    )
+    save_table_data(merged_df, "merged_heart_rate_activity", use_modified=use_modified, inputs=["heart_rate", "daily_activity"])
     return merged_df
 
 
-def check_merged_data(merge_function, data_label, use_modified=False):
+def check_merged_data(table_name, data_label, use_modified=False):
     print(f"\nChecking {data_label}...")
 
-    merged_df = merge_function(use_modified=use_modified)
+    merged_df = fetch_table_data(table_name, use_modified=use_modified)
     merged_df = merged_df.drop_duplicates()
     total_rows, total_columns = merged_df.shape
     print(f"Total Rows: {total_rows}, Total Columns: {total_columns}")
@@ -214,29 +232,88 @@ def check_merged_data(merge_function, data_label, use_modified=False):
     return merged_df
 
 
-create_modified_database()
-fill_missing_weight(use_modified=True)
-remove_fat_column(use_modified=True)
-remove_minute_sleep_duplicates(use_modified=True)
-rename_date_column("minute_sleep")
-
-split_time_column("heart_rate", "Time")  
-split_time_column("hourly_calories", "ActivityHour")  
-split_time_column("hourly_intensity", "ActivityHour")  
-split_time_column("hourly_steps", "ActivityHour")  
-split_time_column("minute_sleep", "Date")  
-split_time_column("weight_log", "Date")  
-
-check_missing_values(use_modified=True)
-check_duplicates(use_modified=True)
-check_outliers(use_modified=True)
-
-merge_hourly_activity_data(use_modified=True)
-merge_sleep_activity_data(use_modified=True)
-merge_heart_rate_activity_data(use_modified=True)
-
-check_merged_data(merge_hourly_activity_data, "Hourly Activity Data", use_modified=True)
-check_merged_data(merge_sleep_activity_data, "Sleep Activity Data", use_modified=True)
-check_merged_data(merge_heart_rate_activity_data, "Heart Rate Activity Data", use_modified=True)
-
-
+# The cleaning and merge steps with the tables they read and write, in the order they
+# ran as a script. (table, True) is the modified database, (table, False) the raw one.
+# Note that split_time_column reads the raw table.
+SPLIT_TIME_COLUMNS = [
+    ("heart_rate", "Time"),
+    ("hourly_calories", "ActivityHour"),
+    ("hourly_intensity", "ActivityHour"),
+    ("hourly_steps", "ActivityHour"),
+    ("minute_sleep", "Date"),
+    ("weight_log", "Date"),
+]
+
+CLEANING_STEPS = [
+    Step("fill_missing_weight", fill_missing_weight_frame, [("weight_log", True)], [("weight_log", True)]),
+    Step("remove_fat_column", remove_fat_column_frame, [("weight_log", True)], [("weight_log", True)]),
+    # Renames and time splits only look at one row at a time, so they can run per user in memory-budget mode
+    Step("rename_date_column", rename_date_column_frame, [("minute_sleep", False)], [("minute_sleep", False)],
+         kwargs={"table_name": "minute_sleep"}, partition_column="Id"),
+] + [
+    Step("split_time_column", split_time_column_frame, [(table_name, False)], [(table_name, True)],
+         kwargs={"table_name": table_name, "time_column_name": time_column_name}, partition_column="Id")
+    for table_name, time_column_name in SPLIT_TIME_COLUMNS
+]
+
+# The merges join on Id, so each chunk of users joins on its own
+MERGE_STEPS = [
+    Step("merge_hourly_activity_data", merge_hourly_activity_frames,
+         [("hourly_steps", True), ("hourly_calories", True), ("hourly_intensity", True)], [("merged_hourly_activity", True)],
+         partition_column="Id"),
+    Step("merge_sleep_activity_data", merge_daily_frames,
+         [("minute_sleep", True), ("daily_activity", True)], [("merged_sleep_activity", True)], partition_column="Id"),
+    Step("merge_heart_rate_activity_data", merge_daily_frames,
+         [("heart_rate", True), ("daily_activity", True)], [("merged_heart_rate_activity", True)], partition_column="Id"),
+]
+
+
+def parse_memory_size(text):
+    """
+    '512M', '2G' or a number of MB -> bytes.
+    """
+    text = str(text).strip().upper().removesuffix("B")
+    units = {"K": 2**10, "M": 2**20, "G": 2**30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text) * 2**20)
+
+
+def main(workers=None, memory_budget=None):
+    create_modified_database()
+    timings = [run_steps(CLEANING_STEPS, max_workers=workers, memory_budget=memory_budget)]
+    # Duplicates are removed in SQL once the cleaned tables are written (this replaces
+    # the pandas drop_duplicates on minute_sleep), and the UNIQUE indexes keep later
+    # appends free of them
+    enforce_natural_keys([table_name for table_name, _ in SPLIT_TIME_COLUMNS] + ["daily_activity"], use_modified=True)
+
+    check_missing_values(use_modified=True)
+    check_duplicates(use_modified=True)
+    check_outliers(use_modified=True)
+
+    timings.append(run_steps(MERGE_STEPS, max_workers=workers, memory_budget=memory_budget))
+    enforce_natural_keys([step.outputs[0][0] for step in MERGE_STEPS], use_modified=True)
+
+    check_merged_data("merged_hourly_activity", "Hourly Activity Data", use_modified=True)
+    check_merged_data("merged_sleep_activity", "Sleep Activity Data", use_modified=True)
+    check_merged_data("merged_heart_rate_activity", "Heart Rate Activity Data", use_modified=True)
+
+    if get_backend(use_modified=True).name == "sqlite":
+        build_kpi_summary(use_modified=True)
+    build_features(use_modified=True)
+    build_daily_heart_rate(use_modified=True)
+    build_sleep_episodes(use_modified=True)
+    create_user_indexes(use_modified=True)
+
+    print("\nStep timings (seconds):" if not memory_budget else "\nStep timings (seconds) and peak memory (MB):")
+    print(pd.concat(timings, ignore_index=True).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the modified database from the raw one.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the independent steps, defaults to the number of cores. 1 runs serially.")
+    parser.add_argument("--memory-budget", default=None,
+                        help="Keep resident memory under this size (e.g. 512M, 2G): steps run one at a time, per chunk of users.")
+    args = parser.parse_args()
+    main(workers=args.workers, memory_budget=parse_memory_size(args.memory_budget) if args.memory_budget else None)
@@ -0,0 +1,263 @@
+import os
+import io
+import json
+import time
+import pstats
+import threading
+import cProfile
+import tracemalloc
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PERF_LOG_PATH = os.environ.get("FITBIT_PERF_LOG", os.path.join(BASE_DIR, "..", "data", "perf_log.jsonl"))
+
+# The run being recorded in this thread (one Streamlit rerun, or one script call)
+_current_run = contextvars.ContextVar("perf_run", default=None)
+
+# tracemalloc is process-wide, the runs are per session: it runs while any run tracks memory
+_memory_runs = [0]
+_memory_runs_lock = threading.Lock()
+
+# Table loads of the whole process: "sql:" stages that are not inside another one, in
+# any thread and whether or not a run is being recorded, so loads of background threads
+# (warm-up, prefetches) and of module imports are counted too
+_table_loads = [0]
+_table_loads_lock = threading.Lock()
+_sql_depth = threading.local()
+
+
+def start_run(name, track_memory=False, profile=False):
+    """
+    Starts recording the stages of one run (e.g. one rerun of a dashboard page).
+
+    Parameters:
+        name (str): The page or script being run.
+        track_memory (bool): Record memory per stage with tracemalloc (slows the run down).
+        profile (bool): Run cProfile over the whole run.
+    """
+    if _current_run.get() is not None:
+        # A run of this thread that never finished, so it stops tracking memory
+        finish_run(log_path=None)
+    if track_memory:
+        with _memory_runs_lock:
+            _memory_runs[0] += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+    run = {
+        "name": name,
+        "started_at": time.time(),
+        "start": time.perf_counter(),
+        "stages": [],
+        "depth": 0,
+        "track_memory": track_memory,
+        "profiler": None,
+    }
+    if profile:
+        run["profiler"] = cProfile.Profile()
+        run["profiler"].enable()
+    _current_run.set(run)
+    return run
+
+
+def finish_run(log_path=PERF_LOG_PATH, top_functions=20):
+    """
+    Stops the current run, appends it to the JSON log and returns the record.
+    Returns None if no run was started.
+    """
+    run = _current_run.get()
+    if run is None:
+        return None
+    _current_run.set(None)
+
+    record = {
+        "name": run["name"],
+        "timestamp": run["started_at"],
+        "total_seconds": time.perf_counter() - run["start"],
+        "stages": run["stages"],
+    }
+    if run["track_memory"]:
+        record["peak_memory_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        with _memory_runs_lock:
+            _memory_runs[0] -= 1
+            # Other sessions may still be tracking
+            if _memory_runs[0] == 0:
+                tracemalloc.stop()
+    if run["profiler"] is not None:
+        run["profiler"].disable()
+        stream = io.StringIO()
+        pstats.Stats(run["profiler"], stream=stream).sort_stats("cumulative").print_stats(top_functions)
+        record["profile"] = stream.getvalue()
+
+    if log_path:
+        try:
+            with open(log_path, "a") as f:
+                f.write(json.dumps({k: v for k, v in record.items() if k != "profile"}) + "\n")
+        except OSError as e:
+            print(f"Error writing performance log: {e}")
+    return record
+
+
+def table_loads():
+    """
+    The number of table loads ("sql:" stages not inside another one) in this process so far.
+    """
+    with _table_loads_lock:
+        return _table_loads[0]
+
+
+@contextmanager
+def _count_table_load(stage):
+    if not stage.startswith("sql:"):
+        yield
+        return
+    depth = getattr(_sql_depth, "value", 0)
+    if depth == 0:
+        with _table_loads_lock:
+            _table_loads[0] += 1
+    _sql_depth.value = depth + 1
+    try:
+        yield
+    finally:
+        _sql_depth.value = depth
+
+
+@contextmanager
+def probe(stage):
+    """
+    Times the enclosed block as one stage of the current run. Outside a run it only
+    counts table loads (see table_loads).
+    """
+    run = _current_run.get()
+    if run is None:
+        with _count_table_load(stage):
+            yield
+        return
+
+    memory_before = tracemalloc.get_traced_memory()[0] if run["track_memory"] else None
+    run["depth"] += 1
+    start = time.perf_counter()
+    try:
+        with _count_table_load(stage):
+            yield
+    finally:
+        entry = {
+            "stage": stage,
+            "depth": run["depth"],
+            "offset": start - run["start"],
+            "seconds": time.perf_counter() - start,
+        }
+        run["depth"] -= 1
+        if memory_before is not None:
+            entry["memory_kb"] = (tracemalloc.get_traced_memory()[0] - memory_before) / 1024
+        run["stages"].append(entry)
+
+
+def probed(stage=None):
+    """
+    Decorator version of probe, the stage defaults to the function name.
+    """
+    def decorator(function):
+        name = stage or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with probe(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def rss_bytes():
+    """
+    Resident memory of this process in bytes (Linux), or the peak so far elsewhere.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return _max_rss_bytes()
+
+
+def _max_rss_bytes():
+    # ru_maxrss is in KB on Linux
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def track_peak_rss(interval=0.01):
+    """
+    Measures the peak resident memory of the enclosed block. Yields a dict whose
+    "start" and "peak" (bytes) are filled in when the block ends.
+    """
+    result = {"start": rss_bytes(), "peak": 0}
+    max_rss_before = _max_rss_bytes()
+    peak = [result["start"]]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            peak[0] = max(peak[0], rss_bytes())
+
+    thread = threading.Thread(target=sample, name="rss_sampler", daemon=True)
+    thread.start()
+    try:
+        yield result
+    finally:
+        stop.set()
+        thread.join()
+        # A new process-wide maximum must have been reached in this block, and is exact
+        max_rss_after = _max_rss_bytes()
+        result["peak"] = max_rss_after if max_rss_after > max_rss_before else max(peak[0], rss_bytes())
+
+
+def stages_frame(record):
+    """
+    The stages of a run record as a DataFrame in the order they started, nested stages are indented.
+    """
+    stages = pd.DataFrame(record["stages"], columns=["stage", "depth", "offset", "seconds", "memory_kb"])
+    stages = stages.sort_values(["offset", "depth"]).reset_index(drop=True)
+    stages["stage"] = ["  " * (depth - 1) + stage for stage, depth in zip(stages["stage"], stages["depth"])]
+    return stages.drop(columns=["depth"]).dropna(axis=1, how="all")
+
+
+def read_perf_log(log_path=PERF_LOG_PATH, since=None):
+    """
+    Reads the JSON log into a DataFrame with one row per run (name, timestamp, total_seconds).
+    """
+    rows = []
+    try:
+        with open(log_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if since is None or record["timestamp"] >= since:
+                    rows.append({k: record[k] for k in ["name", "timestamp", "total_seconds"]})
+    except OSError:
+        pass
+    return pd.DataFrame(rows, columns=["name", "timestamp", "total_seconds"])
+
+
+def latency_percentiles(log_path=PERF_LOG_PATH, since=None):
+    """
+    p50 and p95 run time per page from the JSON log.
+    """
+    runs = read_perf_log(log_path, since=since)
+    return runs.groupby("name")["total_seconds"].agg(
+        runs="count",
+        p50=lambda x: np.percentile(x, 50),
+        p95=lambda x: np.percentile(x, 95),
+    ).reset_index()
@@ -0,0 +1,237 @@
+import io
+import os
+import time
+from contextlib import redirect_stdout, nullcontext
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+from database_queries import fetch_table_data, save_table_data
+from storage_backends import get_backend
+from table_lineage import content_hash, record_table_version
+from perf_probes import rss_bytes, track_peak_rss
+
+# In memory-budget mode a chunk is sized so its input rows take at most 1 / MEMORY_OVERHEAD
+# of the memory left under the budget, leaving room for the step's intermediate copies
+MEMORY_OVERHEAD = 4
+
+
+class Step:
+    """
+    One step of a pipeline. The function gets the input tables as DataFrames, in the
+    order of inputs, and returns one DataFrame per output (a tuple for several outputs,
+    None to leave an output unchanged). It runs in a worker process and must not write
+    to the database itself.
+
+    Parameters:
+        name (str): Name of the step, recorded as the writer in _table_versions.
+        function (callable): A module-level function, so it can be sent to a worker process.
+        inputs (list): (table name, use_modified) tuples that are read.
+        outputs (list): (table name, use_modified) tuples that are written.
+        kwargs (dict): Extra keyword arguments for the function.
+        partition_column (str): Set if the function can run on the rows of a few values
+            of this column at a time (e.g. "Id" for per-user dedup and joins), so the
+            step can run chunked in memory-budget mode.
+    """
+
+    def __init__(self, name, function, inputs, outputs, kwargs=None, partition_column=None):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.kwargs = kwargs or {}
+        self.partition_column = partition_column
+
+    def __repr__(self):
+        return f"Step({self.name!r})"
+
+
+def _dependencies(steps):
+    """
+    For each step, the earlier steps it has to wait for: those that write a table it
+    reads or writes, and those that read a table it writes. The result is the same as
+    running the steps one after another in the given order.
+    """
+    dependencies = []
+    for j, step in enumerate(steps):
+        reads, writes = set(step.inputs), set(step.outputs)
+        dependencies.append({
+            i for i, earlier in enumerate(steps[:j])
+            if set(earlier.outputs) & (reads | writes) or set(earlier.inputs) & writes
+        })
+    return dependencies
+
+
+def _run_step(step):
+    # Runs in a worker process: reads the inputs, computes, and returns the outputs to the writer
+    start = time.perf_counter()
+    frames = [fetch_table_data(table_name, use_modified=use_modified) for table_name, use_modified in step.inputs]
+    result = step.function(*frames, **step.kwargs)
+    if len(step.outputs) == 1:
+        result = (result,)
+    return list(result), time.perf_counter() - start
+
+
+def _lineage_inputs(step, table_name, use_modified):
+    return [name for name, modified in step.inputs if modified == use_modified and name != table_name]
+
+
+def _write_outputs(step, results):
+    # The only place the pipeline writes, so SQLite sees one writer at a time
+    for (table_name, use_modified), df in zip(step.outputs, results):
+        if df is None:
+            continue
+        save_table_data(df, table_name, use_modified=use_modified, step=step.name,
+                        inputs=_lineage_inputs(step, table_name, use_modified))
+
+
+def _plan_chunks(step, memory_budget):
+    """
+    Groups the partition values of the step's first input into chunks whose rows fit the
+    memory left under the budget, estimated from the rows of the first value.
+    """
+    column = step.partition_column
+    table_name, use_modified = step.inputs[0]
+    backend = get_backend(use_modified)
+    counts = backend.scan(table_name, columns=[column])[column].dropna().value_counts(sort=False)
+    if counts.empty:
+        return []
+
+    values = [value.item() if hasattr(value, "item") else value for value in counts.index]
+    sample = backend.scan(table_name, filters=[(column, "=", values[0])])
+    bytes_per_row = max(1, sample.memory_usage(deep=True).sum() / max(1, len(sample)))
+    available = memory_budget - rss_bytes()
+    if available <= 0:
+        print(f"Memory budget is below the current usage ({rss_bytes() / 2**20:.0f} MB), running '{step.name}' one {column} at a time.")
+    rows_per_chunk = max(1, int(available / (MEMORY_OVERHEAD * bytes_per_row)))
+
+    chunks, current, rows = [], [], 0
+    for value, count in zip(values, counts.to_numpy()):
+        if current and rows + count > rows_per_chunk:
+            chunks.append(current)
+            current, rows = [], 0
+        current.append(value)
+        rows += count
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _run_chunked(step, memory_budget):
+    """
+    Runs a step on the rows of a few partition values at a time and writes each chunk's
+    output before reading the next. An output that is also an input is spilled to a
+    temporary _spill_ table and copied over the original at the end, so the remaining
+    chunks still read the original rows. Returns the number of chunks.
+    """
+    chunks = _plan_chunks(step, memory_budget)
+    if len(chunks) <= 1:
+        _write_outputs(step, _run_step(step)[0])
+        return 1
+
+    column = step.partition_column
+    targets = [(f"_spill_{table_name}" if (table_name, use_modified) in step.inputs else table_name, use_modified)
+               for table_name, use_modified in step.outputs]
+    digests, row_counts = [None] * len(targets), [0] * len(targets)
+    written = [False] * len(targets)
+    for n, values in enumerate(chunks):
+        frames = [get_backend(use_modified).scan(table_name, filters=[(column, "in", values)])
+                  for table_name, use_modified in step.inputs]
+        # Only the first chunk's messages are shown, the rest would repeat them
+        with redirect_stdout(io.StringIO()) if n else nullcontext():
+            result = step.function(*frames, **step.kwargs)
+        results = (result,) if len(step.outputs) == 1 else result
+        for k, df in enumerate(results):
+            if df is None:
+                continue
+            target, use_modified = targets[k]
+            backend = get_backend(use_modified)
+            if written[k]:
+                backend.append(df, target)
+            else:
+                backend.write(df, target)
+                written[k] = True
+            digests[k] = content_hash(df, digests[k])
+            row_counts[k] += len(df)
+        del frames, result, results
+
+    for k, (table_name, use_modified) in enumerate(step.outputs):
+        if not written[k]:
+            continue
+        backend = get_backend(use_modified)
+        target = targets[k][0]
+        if target != table_name:
+            for n, values in enumerate(chunks):
+                df = backend.scan(target, filters=[(column, "in", values)])
+                (backend.append if n else backend.write)(df, table_name)
+            backend.drop(target)
+        record_table_version(table_name, None, step.name, inputs=_lineage_inputs(step, table_name, use_modified),
+                             use_modified=use_modified, row_count=row_counts[k], digest=digests[k])
+    return len(chunks)
+
+
+def _run_with_budget(steps, memory_budget):
+    timings = []
+    for step in steps:
+        start = time.perf_counter()
+        with track_peak_rss() as memory:
+            if step.partition_column:
+                n_chunks = _run_chunked(step, memory_budget)
+            else:
+                _write_outputs(step, _run_step(step)[0])
+                n_chunks = 1
+        timings.append({"step": step.name, "outputs": ", ".join(table_name for table_name, _ in step.outputs),
+                        "chunks": n_chunks, "seconds": time.perf_counter() - start,
+                        "peak_rss_mb": memory["peak"] / 2**20})
+        print(f"{step.name} ({timings[-1]['outputs']}): {n_chunks} chunk(s), peak RSS {memory['peak'] / 2**20:.0f} MB")
+    return pd.DataFrame(timings)
+
+
+def run_steps(steps, max_workers=None, memory_budget=None):
+    """
+    Runs the steps on a process pool, each as soon as the steps it depends on have
+    finished, and writes their outputs from this process.
+
+    Parameters:
+        steps (list): Steps in the order they would run serially.
+        max_workers (int): Worker processes, defaults to the number of cores. 1 runs
+            everything in this process.
+        memory_budget (int): Bytes of resident memory to stay under. The steps then run
+            one at a time in this process, steps with a partition_column in chunks,
+            and the peak memory of each step is reported.
+
+    Returns:
+        pd.DataFrame: One row per step with its outputs and the compute and write time in
+        seconds (with a budget: the chunks, the total time and the peak RSS in MB).
+    """
+    if memory_budget:
+        return _run_with_budget(steps, memory_budget)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    dependencies = _dependencies(steps)
+    timings = []
+
+    def finish(i, results, seconds):
+        write_start = time.perf_counter()
+        _write_outputs(steps[i], results)
+        timings.append({"step": steps[i].name, "outputs": ", ".join(table_name for table_name, _ in steps[i].outputs),
+                        "compute_seconds": seconds,
+                        "write_seconds": time.perf_counter() - write_start})
+
+    if max_workers == 1:
+        for i, step in enumerate(steps):
+            finish(i, *_run_step(step))
+        return pd.DataFrame(timings)
+
+    done, running = set(), {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while len(done) < len(steps):
+            for i, step in enumerate(steps):
+                if i not in done and i not in running.values() and dependencies[i] <= done:
+                    running[executor.submit(_run_step, step)] = i
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                finish(i, *future.result())
+                done.add(i)
+    return pd.DataFrame(timings)
@@ -0,0 +1,216 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batched_ols import group_cross_products, solve_cross_products
+
+# Data shared with the worker processes, set once per worker by _init_worker
+_WORKER_DATA = {}
+
+
+def _init_worker(data):
+    _WORKER_DATA.clear()
+    _WORKER_DATA.update(data)
+
+
+# === WORKERS ===
+def _bootstrap_chunk(seed, size):
+    """
+    Draws `size` cluster bootstrap replicates. A replicate samples the clusters
+    with replacement, so its X'X is the count-weighted sum of the per-cluster X'X.
+    """
+    cross = _WORKER_DATA["cross"]
+    rng = np.random.default_rng(seed)
+    n_clusters = cross.shape[0]
+    counts = rng.multinomial(n_clusters, np.full(n_clusters, 1 / n_clusters), size=size)
+    summed = np.tensordot(counts, cross, axes=1)
+    results = solve_cross_products(summed, _WORKER_DATA["x_indices"], _WORKER_DATA["y_index"])
+    return results["params"]
+
+
+def _permutation_chunk(seed, size):
+    """
+    Refits the model on `size` permutations of y. With strata, y is only shuffled
+    within each stratum (e.g. within a user).
+    """
+    X_pinv = _WORKER_DATA["X_pinv"]
+    y_sorted = _WORKER_DATA["y_sorted"]
+    order = _WORKER_DATA["order"]
+    strata_sorted = _WORKER_DATA["strata_sorted"]
+    rng = np.random.default_rng(seed)
+
+    # Sorting stratum code + uniform noise shuffles rows inside each stratum block only
+    shuffled = np.argsort(strata_sorted[None, :] + rng.random((size, len(y_sorted))), axis=1)
+    Y = np.empty((len(y_sorted), size))
+    Y[order] = y_sorted[shuffled].T
+    return (X_pinv @ Y).T
+
+
+# === DRIVER ===
+def _run_in_rounds(worker, data, n_resamples, seed, n_workers, chunk_size, check_every, converged):
+    """
+    Runs `worker` over chunks of resamples, stopping early once `converged` returns True.
+    Every chunk gets its own child of SeedSequence(seed), and convergence is only
+    checked after fixed blocks of `check_every` resamples, so the result does not
+    depend on the number of workers.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    n_chunks = -(-n_resamples // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    sizes = [min(chunk_size, n_resamples - i * chunk_size) for i in range(n_chunks)]
+    chunks_per_round = max(1, check_every // chunk_size)
+
+    draws = []
+    executor = None
+    if n_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(data,))
+    else:
+        _init_worker(data)
+
+    try:
+        for start in range(0, n_chunks, chunks_per_round):
+            batch = range(start, min(start + chunks_per_round, n_chunks))
+            if executor is not None:
+                draws.extend(executor.map(worker, [seeds[i] for i in batch], [sizes[i] for i in batch]))
+            else:
+                draws.extend(worker(seeds[i], sizes[i]) for i in batch)
+            if converged(np.concatenate(draws)):
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return np.concatenate(draws)
+
+
+def _percentile_interval(draws, confidence):
+    alpha = (1 - confidence) / 2
+    return np.nanpercentile(draws, [100 * alpha, 100 * (1 - alpha)], axis=0)
+
+
+def cluster_bootstrap_from_cross(cross, x_indices, y_index, predictors, n_resamples=10000, confidence=0.95,
+                                 seed=0, n_workers=None, chunk_size=1000, check_every=2000, tol=0.01):
+    """
+    Cluster bootstrap of an OLS model from per-cluster cross products.
+
+    Parameters:
+        cross (np.ndarray): Z'Z per cluster, as returned by batched_ols.group_cross_products.
+        x_indices (list): Indices of the constant and the predictors in Z.
+        y_index (int): Index of the target in Z.
+        predictors (list): Names for the coefficients, starting with 'const'.
+        n_resamples (int): Maximum number of bootstrap replicates.
+        confidence (float): Coverage of the percentile interval.
+        seed (int): Seed for the SeedSequence, the same seed gives the same draws.
+        n_workers (int): Number of worker processes, 1 runs in this process.
+        chunk_size (int): Replicates per task sent to a worker.
+        check_every (int): Replicates between convergence checks.
+        tol (float): Stop when no interval bound moved more than tol * bootstrap SE since the last check.
+
+    Returns:
+        pd.DataFrame: One row per predictor with Coefficient, Bootstrap SE, CI Lower, CI Upper,
+        Bootstrap P-value and Resamples.
+    """
+    x_indices = list(x_indices)
+    full = solve_cross_products(cross.sum(axis=0, keepdims=True), x_indices, y_index)["params"][0]
+    previous = {}
+
+    def converged(draws):
+        interval = _percentile_interval(draws, confidence)
+        spread = np.nanstd(draws, axis=0)
+        done = "interval" in previous and np.all(np.abs(interval - previous["interval"]) <= tol * spread)
+        previous["interval"] = interval
+        return bool(done)
+
+    data = {"cross": cross, "x_indices": x_indices, "y_index": y_index}
+    draws = _run_in_rounds(_bootstrap_chunk, data, n_resamples, seed, n_workers, chunk_size, check_every, converged)
+    lower, upper = _percentile_interval(draws, confidence)
+
+    # Two-sided p-value from the share of replicates on the other side of zero
+    share_above = np.nanmean(draws > 0, axis=0)
+    p_values = np.clip(2 * np.minimum(share_above, 1 - share_above), 1 / len(draws), 1)
+
+    return pd.DataFrame({
+        "Predictor": predictors,
+        "Coefficient": full,
+        "Bootstrap SE": np.nanstd(draws, axis=0, ddof=1),
+        "CI Lower": lower,
+        "CI Upper": upper,
+        "Bootstrap P-value": p_values,
+        "Resamples": len(draws),
+    })
+
+
+def cluster_bootstrap(df, y_variable, x_variables, cluster_column="Id", **kwargs):
+    """
+    Cluster bootstrap of y ~ const + x_variables, resampling whole users (or other clusters).
+    Keyword arguments are passed on to cluster_bootstrap_from_cross.
+    """
+    x_variables = list(x_variables)
+    _, cross = group_cross_products(df, x_variables + [y_variable], [cluster_column])
+    y_index = len(x_variables) + 1
+    return cluster_bootstrap_from_cross(cross, range(y_index), y_index, ["const"] + x_variables, **kwargs)
+
+
+def permutation_test(df, y_variable, x_variables, strata_column=None, n_resamples=10000, seed=0,
+                     n_workers=None, chunk_size=None, check_every=2000, tol=0.005):
+    """
+    Permutation test for the coefficients of y ~ const + x_variables.
+    y is shuffled against X (within strata_column if given, e.g. within each user) and the
+    model is refitted for every permutation with one matrix product.
+
+    Stops early once the Monte Carlo standard error of every p-value is below tol.
+
+    Returns:
+        pd.DataFrame: One row per predictor with Coefficient, Permutation P-value and Resamples.
+        Shuffling y does not test the intercept, so its p-value is NaN.
+    """
+    x_variables = list(x_variables)
+    columns = x_variables + [y_variable] + ([strata_column] if strata_column else [])
+    df = df.dropna(subset=columns)
+
+    X = np.column_stack([np.ones(len(df))] + [df[col].to_numpy(dtype=float) for col in x_variables])
+    y = df[y_variable].to_numpy(dtype=float)
+    X_pinv = np.linalg.pinv(X)
+    observed = X_pinv @ y
+
+    if strata_column:
+        strata = pd.factorize(df[strata_column])[0].astype(float)
+    else:
+        strata = np.zeros(len(df))
+    order = np.argsort(strata, kind="stable")
+
+    # Keep each chunk's (rows x permutations) matrix around 40 MB
+    if chunk_size is None:
+        chunk_size = int(np.clip(5_000_000 // max(len(df), 1), 1, 1000))
+
+    def converged(draws):
+        p = (1 + np.sum(np.abs(draws[:, 1:]) >= np.abs(observed[1:]), axis=0)) / (1 + len(draws))
+        return bool(np.all(np.sqrt(p * (1 - p) / len(draws)) < tol))
+
+    data = {"X_pinv": X_pinv, "y_sorted": y[order], "order": order, "strata_sorted": strata[order]}
+    draws = _run_in_rounds(_permutation_chunk, data, n_resamples, seed, n_workers, chunk_size, check_every, converged)
+
+    p_values = (1 + np.sum(np.abs(draws) >= np.abs(observed), axis=0)) / (1 + len(draws))
+    p_values[0] = np.nan
+    return pd.DataFrame({
+        "Predictor": ["const"] + x_variables,
+        "Coefficient": observed,
+        "Permutation P-value": p_values,
+        "Resamples": len(draws),
+    })
+
+
+def resampling_summary(df, y_variable, x_variables, cluster_column="Id", strata_column="Id", n_resamples=10000,
+                       seed=0, n_workers=None):
+    """
+    Combines the cluster bootstrap intervals with a permutation test within strata_column
+    (None shuffles across all rows). A stratum must hold several rows, otherwise the
+    shuffle changes nothing and every p-value is 1: for one user, pass strata_column=None.
+    """
+    bootstrap = cluster_bootstrap(df, y_variable, x_variables, cluster_column=cluster_column,
+                                  n_resamples=n_resamples, seed=seed, n_workers=n_workers)
+    permutation = permutation_test(df, y_variable, x_variables, strata_column=strata_column,
+                                   n_resamples=n_resamples, seed=seed, n_workers=n_workers)
+    return bootstrap.merge(permutation[["Predictor", "Permutation P-value"]], on="Predictor")
@@ -0,0 +1,322 @@
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from database_queries import scan_table, save_table_data
+from storage_backends import get_backend
+from table_lineage import content_hash, current_version, record_table_version, stale_inputs
+from perf_probes import probed
+from dedup import enforce_natural_keys, count_rows
+from user_slices import date_strings
+
+# Rolling and calendar features per user and day, for all users at once.
+# The daily metrics of daily_activity, the minutes asleep per day (minute_sleep) and
+# the active hours per day (hourly_steps) are laid out on a complete calendar
+# per user (days without data are NaN), sorted by (Id, Date). Every window sum is then
+# a difference of two cumulative sums, so all users and windows are computed with a few
+# numpy operations instead of a groupby().rolling() per user.
+FEATURE_TABLE = "daily_features"
+PROFILE_TABLE = "weekday_profiles"
+SOURCE_TABLES = ["daily_activity", "minute_sleep", "hourly_steps"]
+
+METRICS = ["TotalSteps", "Calories", "TotalActiveMinutes", "SedentaryMinutes", "AsleepMinutes", "ActiveHours"]
+WINDOWS = (7, 14, 28)
+# A window mean needs data on at least this share of its days, a trend at least 3 days
+MIN_COVERAGE = 0.5
+# An hour with at least this many steps counts as active (Fitbit's hourly goal)
+ACTIVE_HOUR_STEPS = 250
+
+# A changed day affects the features of this many days from it on (the longest window,
+# and the week-over-week delta reaches back 13 days)
+AFFECTED_DAYS = max(max(WINDOWS), 14)
+# The column with the 'M/D/YYYY' date of each source table
+DATE_COLUMNS = {"daily_activity": "ActivityDate", "minute_sleep": "Date", "hourly_steps": "Date"}
+
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _parse_dates(dates):
+    return pd.to_datetime(dates, format="%m/%d/%Y")
+
+
+@probed("pandas: load_daily_base")
+def load_daily_base(use_modified=True, user_ids=None, start_date=None, end_date=None, spans=None):
+    """
+    The daily metrics per user on a complete calendar, from the first to the last day
+    the user has any data.
+
+    Parameters:
+        user_ids (list): Only these users, None for all.
+        start_date, end_date (datetime): Only read these days (both needed), None for all.
+        spans (pd.DataFrame): Per Id the first and last day ("min", "max") of the
+            calendar, instead of the days read.
+
+    Returns:
+        pd.DataFrame: Id, Date (datetime) and METRICS, sorted by Id and Date.
+    """
+    filters = [("Id", "in", list(user_ids))] if user_ids is not None else []
+    dates = date_strings(start_date, end_date) if start_date is not None and end_date is not None else None
+
+    def date_filter(table_name):
+        return filters + ([(DATE_COLUMNS[table_name], "in", dates)] if dates is not None else [])
+
+    daily = scan_table("daily_activity", columns=["Id", "ActivityDate", "TotalSteps", "Calories", "VeryActiveMinutes",
+                                                  "FairlyActiveMinutes", "LightlyActiveMinutes", "SedentaryMinutes"],
+                       filters=date_filter("daily_activity") or None, use_modified=use_modified)
+    daily["Date"] = _parse_dates(daily["ActivityDate"])
+    daily["TotalActiveMinutes"] = daily["VeryActiveMinutes"] + daily["FairlyActiveMinutes"] + daily["LightlyActiveMinutes"]
+    daily = daily.groupby(["Id", "Date"])[["TotalSteps", "Calories", "TotalActiveMinutes", "SedentaryMinutes"]].first()
+
+    sleep = scan_table("minute_sleep", columns=["Id", "Date"], filters=[("value", "=", 1)] + date_filter("minute_sleep"),
+                       use_modified=use_modified)
+    sleep = sleep.groupby(["Id", _parse_dates(sleep["Date"]).rename("Date")]).size().rename("AsleepMinutes")
+
+    # Every hour of the day, AM and PM; hourly_steps has them all, the merged table only the hours in all three sources
+    hourly = scan_table("hourly_steps", columns=["Id", "Date", "StepTotal"], filters=date_filter("hourly_steps") or None,
+                        use_modified=use_modified)
+    active = (hourly["StepTotal"] >= ACTIVE_HOUR_STEPS).groupby([hourly["Id"], _parse_dates(hourly["Date"]).rename("Date")]).sum()
+
+    base = pd.concat([daily, sleep, active.rename("ActiveHours")], axis=1)
+    if base.empty:
+        return pd.DataFrame(columns=["Id", "Date"] + METRICS)
+    base = base.reset_index()
+
+    # Complete calendar per user, so a 7-day window is 7 days and not 7 rows
+    span = base.groupby("Id")["Date"].agg(["min", "max"]) if spans is None else spans[spans["max"] >= spans["min"]]
+    lengths = ((span["max"] - span["min"]).dt.days + 1).to_numpy()
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    grid = pd.DataFrame({
+        "Id": np.repeat(span.index.to_numpy(), lengths),
+        "Date": np.repeat(span["min"].to_numpy(), lengths) + pd.to_timedelta(offsets, unit="D"),
+    })
+    base = grid.merge(base, on=["Id", "Date"], how="left")
+    return base[["Id", "Date"] + METRICS].astype({metric: float for metric in METRICS})
+
+
+def _window_sums(cumulative, group_start, window, end):
+    # Sum over the rows (end - window, end] that belong to the same user, per column
+    low = np.maximum(end - window, group_start)
+    return cumulative[end] - cumulative[np.minimum(low, end)]
+
+
+@probed("pandas: compute_rolling_features")
+def compute_rolling_features(base, windows=WINDOWS, since=None):
+    """
+    Rolling means and trends, week-over-week deltas and calendar features.
+
+    Parameters:
+        base (pd.DataFrame): From load_daily_base (complete calendar, sorted).
+        windows (tuple): Window lengths in days.
+        since (dict): User Id -> first date to return; the earlier days of base are
+            only used as window history. None returns every day.
+
+    Returns:
+        pd.DataFrame: Per user and day: Id, Date ('YYYY-MM-DD'), Weekday (0 = Monday),
+        IsWeekend, the METRICS and per metric and window <metric>_mean_<w>d (mean over
+        the days with data) and <metric>_trend_<w>d (least squares slope per day), plus
+        <metric>_wow (this 7-day mean minus the previous 7-day mean).
+    """
+    base = base.reset_index(drop=True)
+    n = len(base)
+    ids = base["Id"].to_numpy()
+    new_user = np.r_[True, ids[1:] != ids[:-1]] if n else np.zeros(0, dtype=bool)
+    group_start = np.maximum.accumulate(np.where(new_user, np.arange(n), 0)) if n else np.zeros(0, dtype=int)
+    day = (np.arange(n) - group_start).astype(float)[:, None]
+
+    values = base[METRICS].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    y = np.where(valid, values, 0.0)
+    t = np.where(valid, day, 0.0)
+
+    # One row of zeros in front, so a window sum is cumulative[end] - cumulative[start]
+    def cumulative(a):
+        return np.vstack([np.zeros((1, a.shape[1])), np.cumsum(a, axis=0)])
+
+    sums = {name: cumulative(a) for name, a in
+            [("n", valid.astype(float)), ("y", y), ("t", t), ("tt", t * t), ("ty", t * y)]}
+    end = np.arange(1, n + 1)
+
+    features = {
+        "Id": ids,
+        "Date": base["Date"].dt.strftime("%Y-%m-%d").to_numpy(),
+        "Weekday": base["Date"].dt.dayofweek.to_numpy(),
+        "IsWeekend": (base["Date"].dt.dayofweek >= 5).astype(int).to_numpy(),
+    }
+    for j, metric in enumerate(METRICS):
+        features[metric] = values[:, j]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = {}
+        for window in windows:
+            s = {name: _window_sums(c, group_start, window, end) for name, c in sums.items()}
+            count = s["n"]
+            mean = np.where(count >= np.ceil(window * MIN_COVERAGE), s["y"] / count, np.nan)
+            denominator = count * s["tt"] - s["t"] ** 2
+            trend = np.where((count >= 3) & (denominator > 0), (count * s["ty"] - s["t"] * s["y"]) / denominator, np.nan)
+            means[window] = mean
+            for j, metric in enumerate(METRICS):
+                features[f"{metric}_mean_{window}d"] = mean[:, j]
+                features[f"{metric}_trend_{window}d"] = trend[:, j]
+
+        # Week over week: the 7-day mean against the one ending 7 days earlier, same user
+        week = means.get(7)
+        if week is None:
+            s = {name: _window_sums(sums[name], group_start, 7, end) for name in ("n", "y")}
+            week = np.where(s["n"] >= np.ceil(7 * MIN_COVERAGE), s["y"] / s["n"], np.nan)
+        previous = np.full_like(week, np.nan)
+        shifted = np.arange(n) - 7
+        has_previous = shifted >= group_start
+        previous[has_previous] = week[shifted[has_previous]]
+        for j, metric in enumerate(METRICS):
+            features[f"{metric}_wow"] = week[:, j] - previous[:, j]
+
+    result = pd.DataFrame(features)
+    if since is not None:
+        first = base["Id"].map(since)
+        result = result[(base["Date"] >= first).to_numpy()]
+    return result.reset_index(drop=True)
+
+
+def compute_weekday_profiles(base):
+    """
+    Per user and day of the week: the number of days with activity data and the mean of
+    every metric, like part1_exploration.plot_workout_frequency does for all users.
+    """
+    base = base[base["TotalSteps"].notna()]
+    grouped = base.groupby(["Id", base["Date"].dt.dayofweek.rename("Weekday")])
+    profiles = grouped[METRICS].mean().add_suffix("_mean")
+    profiles.insert(0, "Days", grouped.size())
+    profiles = profiles.reset_index()
+    profiles.insert(2, "DayOfWeek", [DAY_ORDER[day] for day in profiles["Weekday"]])
+    return profiles
+
+
+def _changed_days(appended):
+    # Per user, the first and last day of the appended rows ({table name: rows})
+    frames = [pd.DataFrame({"Id": df["Id"].astype("int64"), "Date": _parse_dates(df[DATE_COLUMNS[table_name]].str.split(" ").str[0])})
+              for table_name, df in appended.items() if table_name in DATE_COLUMNS and len(df)]
+    if not frames:
+        return pd.DataFrame(columns=["min", "max"])
+    return pd.concat(frames).groupby("Id")["Date"].agg(["min", "max"])
+
+
+def _stored_spans(user_ids, use_modified):
+    # First and last day of the users' stored calendars
+    stored = scan_table(FEATURE_TABLE, columns=["Id", "Date"], filters=[("Id", "in", list(user_ids))],
+                        use_modified=use_modified)
+    return pd.to_datetime(stored["Date"], format="%Y-%m-%d").groupby(stored["Id"]).agg(["min", "max"])
+
+
+def _replace_rows(df, table_name, ranges, use_modified):
+    # Removes the stored rows of each user between its two dates ('YYYY-MM-DD', or all
+    # of them if the range is None), then appends df
+    backend = get_backend(use_modified)
+    if backend.name == "sqlite":
+        conn = sqlite3.connect(backend.db_path)
+        try:
+            with conn:
+                for user_id, date_range in ranges.items():
+                    if date_range is None:
+                        conn.execute(f'DELETE FROM "{table_name}" WHERE Id = ?', (int(user_id),))
+                    else:
+                        conn.execute(f'DELETE FROM "{table_name}" WHERE Id = ? AND Date BETWEEN ? AND ?',
+                                     (int(user_id), *date_range))
+        finally:
+            conn.close()
+        backend.append(df, table_name)
+    else:
+        stored = backend.scan(table_name)
+        remove = np.zeros(len(stored), dtype=bool)
+        for user_id, date_range in ranges.items():
+            rows = (stored["Id"] == user_id).to_numpy()
+            if date_range is not None:
+                rows &= stored["Date"].between(*date_range).to_numpy()
+            remove |= rows
+        backend.write(pd.concat([stored[~remove], df], ignore_index=True), table_name)
+
+
+def build_features(use_modified=True):
+    """
+    Recomputes daily_features and weekday_profiles for all users.
+    """
+    base = load_daily_base(use_modified)
+    features = compute_rolling_features(base)
+    save_table_data(features, FEATURE_TABLE, use_modified=use_modified, inputs=SOURCE_TABLES)
+    save_table_data(compute_weekday_profiles(base), PROFILE_TABLE, use_modified=use_modified, inputs=SOURCE_TABLES)
+    # The (Id, Date) index makes the deletes of update_features cheap
+    enforce_natural_keys([FEATURE_TABLE, PROFILE_TABLE], use_modified=use_modified)
+    print(f"Built {FEATURE_TABLE}: {len(features)} user-days of {base['Id'].nunique()} users.")
+    return features
+
+
+def update_features(appended=None, use_modified=True):
+    """
+    Brings daily_features and weekday_profiles up to date after rows were appended to the
+    source tables. Only the users in the appended rows are read, and only from
+    AFFECTED_DAYS before their first new day to AFFECTED_DAYS after their last one: a day
+    only changes the windows that contain it. Without the appended rows the changed days
+    are unknown, so changed sources (see table_lineage) rebuild both tables.
+
+    Parameters:
+        appended (dict): Source table name -> the rows appended to it (e.g. the frames
+            given to append_table_data), with the 'M/D/YYYY' dates of the modified tables.
+
+    Returns:
+        int: The number of user-days recomputed.
+    """
+    if FEATURE_TABLE not in get_backend(use_modified).list_tables():
+        return len(build_features(use_modified))
+    if appended is None:
+        if stale_inputs(FEATURE_TABLE, use_modified) == []:
+            print(f"{FEATURE_TABLE} is up to date.")
+            return 0
+        return len(build_features(use_modified))
+
+    changed = _changed_days(appended)
+    if changed.empty:
+        print(f"{FEATURE_TABLE} is up to date.")
+        return 0
+    affected = pd.Timedelta(days=AFFECTED_DAYS - 1)
+    stored = _stored_spans(changed.index, use_modified)
+    first = pd.concat([changed["min"], stored["min"]], axis=1).min(axis=1)
+    last = pd.concat([changed["max"], stored["max"]], axis=1).max(axis=1)
+
+    # Calendar of the days read: the history before the first new day, up to the last day the new days affect
+    start_date, end_date = changed["min"].min() - affected, changed["max"].max() + affected
+    spans = pd.DataFrame({"min": first.clip(lower=start_date), "max": last.clip(upper=end_date)})
+    base = load_daily_base(use_modified, user_ids=changed.index, start_date=start_date, end_date=end_date, spans=spans)
+    features = compute_rolling_features(base, since=changed["min"].to_dict())
+
+    ranges = {user_id: (changed.loc[user_id, "min"].strftime("%Y-%m-%d"), spans.loc[user_id, "max"].strftime("%Y-%m-%d"))
+              for user_id in changed.index}
+    _replace_rows(features, FEATURE_TABLE, ranges, use_modified)
+    # The table was changed in place, so the new hash chains the old one with the new rows
+    previous = current_version(FEATURE_TABLE, use_modified)
+    record_table_version(FEATURE_TABLE, None, "update_features", inputs=SOURCE_TABLES, use_modified=use_modified,
+                         row_count=count_rows(FEATURE_TABLE, use_modified),
+                         digest=content_hash(features, previous["content_hash"] if previous else None))
+
+    # The profiles of the changed users, from their stored daily metrics
+    stored_days = scan_table(FEATURE_TABLE, columns=["Id", "Date"] + METRICS,
+                             filters=[("Id", "in", list(changed.index))], use_modified=use_modified)
+    stored_days["Date"] = pd.to_datetime(stored_days["Date"], format="%Y-%m-%d")
+    profiles = compute_weekday_profiles(stored_days)
+    _replace_rows(profiles, PROFILE_TABLE, {user_id: None for user_id in changed.index}, use_modified)
+    previous = current_version(PROFILE_TABLE, use_modified)
+    record_table_version(PROFILE_TABLE, None, "update_features", inputs=SOURCE_TABLES, use_modified=use_modified,
+                         row_count=count_rows(PROFILE_TABLE, use_modified),
+                         digest=content_hash(profiles, previous["content_hash"] if previous else None))
+    print(f"Updated {FEATURE_TABLE}: {len(features)} user-days of {len(changed)} users recomputed.")
+    return len(features)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the rolling daily features of every user.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute everything, even if the sources have not changed.")
+    args = parser.parse_args()
+    if args.rebuild:
+        build_features(use_modified=True)
+    else:
+        update_features(use_modified=True)
@@ -1,38 +1,35 @@
-import sqlite3
 import pandas as pd
 import statsmodels.api as sm
 import matplotlib.pyplot as plt
 import seaborn as sns
 import scipy.stats as stats
 
+from resampling import resampling_summary
+from model_registry import registered_fit
+from perf_probes import probed
+from storage_backends import SQLiteBackend, as_backend, get_backend
+
 
 # === DATABASE CONNECTION ===
 def connect_to_db(db_path):
-    return sqlite3.connect(db_path)
+    # The getters below take any storage backend (or an open sqlite3 connection)
+    return SQLiteBackend(db_path)
 
 # === SLEEP ANALYSIS ===
 def get_asleep_minutes_by_logid(conn):
-    query = """
-    SELECT logId, COUNT(*) AS asleep_minutes
-    FROM minute_sleep
-    WHERE value = 1
-    GROUP BY logId
-    ORDER BY asleep_minutes DESC;
-    """
-    return pd.read_sql_query(query, conn)
+    df = as_backend(conn).scan("minute_sleep", columns=["logId"], filters=[("value", "=", 1)])
+    counts = df.groupby("logId", dropna=False).size().reset_index(name="asleep_minutes")
+    return counts.sort_values("asleep_minutes", ascending=False, kind="stable").reset_index(drop=True)
 
+@probed("sql: get_sleep_minutes_per_day")
 def get_sleep_minutes_per_day(conn):
-    query = """
-    SELECT Id, Date, COUNT(*) AS asleep_minutes
-    FROM minute_sleep
-    WHERE value = 1
-    GROUP BY Id, Date;
-    """
-    return pd.read_sql_query(query, conn)
+    df = as_backend(conn).scan("minute_sleep", columns=["Id", "Date"], filters=[("value", "=", 1)])
+    return df.groupby(["Id", "Date"], dropna=False).size().reset_index(name="asleep_minutes")
 
 # === ACTIVITY ANALYSIS ===
+@probed("sql: get_daily_activity_with_active_minutes")
 def get_daily_activity_with_active_minutes(conn):
-    df = pd.read_sql_query("SELECT * FROM daily_activity;", conn)
+    df = as_backend(conn).scan("daily_activity")
     df["TotalActiveMinutes"] = (
         df["VeryActiveMinutes"] +
         df["FairlyActiveMinutes"] +
@@ -41,6 +38,7 @@ def get_daily_activity_with_active_minutes(conn):
     return df
 
 # === MERGING & REGRESSION ===
+@probed("pandas: prepare_merged_data")
 def prepare_merged_data(sleep_df, activity_df):
     sleep_df["Date"] = pd.to_datetime(sleep_df["Date"])
     activity_df["ActivityDate"] = pd.to_datetime(activity_df["ActivityDate"])
@@ -61,12 +59,23 @@ def prepare_merged_data(sleep_df, activity_df):
 ]]
 
 
-def run_regression(df):
+@probed("model: run_regression")
+def run_regression(df, n_resamples=0, use_registry=False):
+    # With use_registry the stored results are returned when this exact data was fitted before
+    if use_registry:
+        return registered_fit(lambda: run_regression(df, n_resamples), "asleep_minutes", ["TotalActiveMinutes"],
+                              filter_spec={"n_resamples": n_resamples}, df=df)
+
     X = sm.add_constant(df["TotalActiveMinutes"])
     y = df["asleep_minutes"]
     model = sm.OLS(y, X).fit()
+
+    # The residuals are far from normal, so optionally add user-level bootstrap and permutation results
+    if n_resamples:
+        model.resampling = resampling_summary(df, "asleep_minutes", ["TotalActiveMinutes"], cluster_column="Id", n_resamples=n_resamples)
     return model
 
+@probed("plot: plot_sleep_vs_activity")
 def plot_sleep_vs_activity(df, model):
     plt.figure(figsize=(10, 6))
     sns.scatterplot(x="TotalActiveMinutes", y="asleep_minutes", data=df, alpha=0.6)
@@ -87,12 +96,17 @@ def plot_sleep_vs_activity(df, model):
     plt.tight_layout()
     plt.show()
 
-def run_sedentary_regression(df):
+@probed("model: run_sedentary_regression")
+def run_sedentary_regression(df, use_registry=False):
+    if use_registry:
+        return registered_fit(lambda: run_sedentary_regression(df), "asleep_minutes", ["SedentaryMinutes"], df=df)
+
     X = sm.add_constant(df["SedentaryMinutes"])
     y = df["asleep_minutes"]
     model = sm.OLS(y, X).fit()
     return model
 
+@probed("plot: plot_residual_diagnostics")
 def plot_residual_diagnostics(model):
     residuals = model.resid
 
@@ -111,6 +125,7 @@ def plot_residual_diagnostics(model):
     plt.tight_layout()
     plt.show()
 
+@probed("plot: plot_sleep_vs_sedentary")
 def plot_sleep_vs_sedentary(df, model):
     plt.figure(figsize=(10, 6))
     sns.scatterplot(x="SedentaryMinutes", y="asleep_minutes", data=df, alpha=0.6)
@@ -131,7 +146,11 @@ def plot_sleep_vs_sedentary(df, model):
     plt.tight_layout()
     plt.show()
 
-def run_multi_activity_regression(df):
+def run_multi_activity_regression(df, use_registry=False):
+    if use_registry:
+        return registered_fit(lambda: run_multi_activity_regression(df), "asleep_minutes",
+                              ["VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes"], df=df)
+
     X = df[["VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes"]]
     X = sm.add_constant(X)
     y = df["asleep_minutes"]
@@ -142,8 +161,7 @@ def run_multi_activity_regression(df):
 
 # === MAIN ===
 def main():
-    db_path = "data/fitbit_database_modified.db"
-    conn = connect_to_db(db_path)
+    conn = get_backend(use_modified=True)
 
     # Sleep duration per logId
     sleep_by_logid = get_asleep_minutes_by_logid(conn)
@@ -158,9 +176,11 @@ def main():
     print(merged_df.head())
 
     # --- Regression: Total Active Minutes vs Asleep Minutes ---
-    model = run_regression(merged_df)
+    model = run_regression(merged_df, n_resamples=10000, use_registry=True)
     print("\nRegression Summary:")
     print(model.summary())
+    print("\nCluster Bootstrap and Permutation Results (resampled by user):")
+    print(model.resampling)
 
     plot_sleep_vs_activity(merged_df, model)
     
@@ -5,6 +5,7 @@ import statsmodels.api as sm
 from datetime import datetime
 
 from database_queries import get_table_names, fetch_table_data, save_table_data
+from model_registry import registered_fit
 
 
 def load_activity_data():
@@ -29,10 +30,13 @@ def merge_activity_sleep_data(activity_df, sleep_df):
     return merged_df
 
 
-def run_regression(df):
+def run_regression(df, use_registry=False):
     X = sm.add_constant(df["TotalActiveMinutes"])
     y = df["TotalMinutesAsleep"]
-    model = sm.OLS(y, X).fit()
+    if use_registry:
+        model = registered_fit(lambda: sm.OLS(y, X).fit(), "TotalMinutesAsleep", ["TotalActiveMinutes"], df=df)
+    else:
+        model = sm.OLS(y, X).fit()
     
     print("\nRegression Results:\n")
     print(model.summary())
@@ -43,4 +47,4 @@ if __name__ == "__main__":
     activity_df = load_activity_data()
     sleep_df = load_sleep_data()
     merged_df = merge_activity_sleep_data(activity_df, sleep_df)
-    run_regression(merged_df)
+    run_regression(merged_df, use_registry=True)
@@ -0,0 +1,168 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from database_queries import scan_table, save_table_data
+from storage_backends import get_backend
+from perf_probes import probed
+from dedup import enforce_natural_keys
+from heart_rate_zones import timestamp_seconds
+
+# Heart rate during sleep, one row per sleep log (episode) of minute_sleep.
+# Every heart_rate sample is matched to the sleep minute it falls in with a sorted
+# merge_asof per user: a sample belongs to the last sleep minute that started at most
+# TOLERANCE_SECONDS before it, samples outside any sleep log find none and drop out.
+# Both sides are sorted once, so the join is linear in the number of rows instead of
+# comparing every sample with every minute, and users are processed in batches so
+# months of second-level samples are never in memory at once.
+EPISODE_TABLE = "sleep_episodes"
+SOURCE_TABLES = ["minute_sleep", "heart_rate"]
+
+# minute_sleep.value: the state of the minute
+SLEEP_STATES = {1: "Asleep", 2: "Restless", 3: "Awake"}
+# A sleep minute covers the 60 seconds from its timestamp
+TOLERANCE_SECONDS = 59
+# Users per batch
+BATCH_USERS = 20
+
+EPISODE_COLUMNS = (["Id", "logId", "Date", "Start", "End", "MinutesInBed", "MinutesAsleep", "HRSamples",
+                    "MinutesWithHR", "SleepingHR", "LowestHR", "LowestHRMinute", "HRDip"]
+                   + [f"{state}HR" for state in SLEEP_STATES.values() if state != "Asleep"])
+
+
+def _format_seconds(seconds):
+    return pd.to_datetime(seconds, unit="s").dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+@probed("pandas: align_sleep_heart_rate")
+def align_sleep_heart_rate(sleep, samples, tolerance=TOLERANCE_SECONDS):
+    """
+    Matches heart_rate samples to the sleep minutes they fall in.
+
+    Parameters:
+        sleep (pd.DataFrame): minute_sleep rows (Id, logId, Date, Time, TimeOfDay, value).
+        samples (pd.DataFrame): heart_rate rows (Id, Date, Time, TimeOfDay, Value) of the
+            same users.
+        tolerance (int): Seconds after the start of a sleep minute that still belong to it.
+
+    Returns:
+        pd.DataFrame: One row per matched sample: Id, logId, Minute (seconds since the
+        epoch of the sleep minute), value (the sleep state) and Value (the heart rate).
+    """
+    minutes = pd.DataFrame({
+        "Id": sleep["Id"].to_numpy(dtype=np.int64),
+        "Seconds": timestamp_seconds(sleep),
+        "logId": sleep["logId"].to_numpy(),
+        "value": sleep["value"].to_numpy(),
+    })
+    minutes["Minute"] = minutes["Seconds"]
+    heart = pd.DataFrame({
+        "Id": samples["Id"].to_numpy(dtype=np.int64),
+        "Seconds": timestamp_seconds(samples),
+        "Value": samples["Value"].to_numpy(dtype=float),
+    })
+    # merge_asof needs both sides sorted on the join key; "by" keeps the users apart
+    matched = pd.merge_asof(heart.sort_values("Seconds", kind="stable"), minutes.sort_values("Seconds", kind="stable"),
+                            on="Seconds", by="Id", direction="backward", tolerance=tolerance)
+    matched = matched[matched["logId"].notna()]
+    return matched.astype({"logId": minutes["logId"].dtype, "value": minutes["value"].dtype})[
+        ["Id", "logId", "Minute", "value", "Value"]]
+
+
+def summarize_episodes(sleep):
+    """
+    One row per sleep log: Id, logId, Date (of the first minute), Start and End
+    ('YYYY-MM-DD HH:MM:SS'), MinutesInBed and MinutesAsleep (value = 1), like the
+    sleep episodes of the JSON API.
+    """
+    minutes = sleep.assign(Seconds=timestamp_seconds(sleep)).sort_values("Seconds", kind="stable")
+    episodes = minutes.groupby(["Id", "logId"]).agg(
+        Date=("Date", "first"), Start=("Seconds", "min"), End=("Seconds", "max"),
+        MinutesInBed=("value", "size"), MinutesAsleep=("value", lambda v: int((v == 1).sum()))
+    ).reset_index()
+    return episodes
+
+
+@probed("pandas: compute_sleep_heart_rate")
+def compute_sleep_heart_rate(sleep, samples, tolerance=TOLERANCE_SECONDS):
+    """
+    The sleep episodes of a batch of users with their heart rate during sleep.
+
+    Returns:
+        pd.DataFrame: EPISODE_COLUMNS: the summarize_episodes columns plus HRSamples
+        and MinutesWithHR (matched samples and minutes), SleepingHR (mean of the
+        per-minute heart rate while asleep), LowestHR (lowest asleep minute),
+        LowestHRMinute (its minutes since the start of the episode), HRDip (SleepingHR
+        minus LowestHR) and the mean heart rate of the restless and awake minutes.
+        The heart rate columns are NaN for episodes without samples.
+    """
+    if sleep.empty:
+        return pd.DataFrame(columns=EPISODE_COLUMNS)
+    episodes = summarize_episodes(sleep)
+    matched = align_sleep_heart_rate(sleep, samples, tolerance)
+
+    # The heart rate of each sleep minute first, so a minute with many samples weighs as much as one with few
+    per_minute = matched.groupby(["Id", "logId", "Minute", "value"])["Value"].agg(["mean", "size"]).reset_index()
+    keys = ["Id", "logId"]
+    heart = per_minute.groupby(keys).agg(HRSamples=("size", "sum"), MinutesWithHR=("mean", "size"))
+
+    asleep = per_minute[per_minute["value"] == 1]
+    heart["SleepingHR"] = asleep.groupby(keys)["mean"].mean()
+    lowest = asleep.sort_values("mean", kind="stable").drop_duplicates(keys).set_index(keys)
+    heart["LowestHR"] = lowest["mean"]
+    heart["LowestHRMinute"] = lowest["Minute"]
+    for value, state in SLEEP_STATES.items():
+        if state != "Asleep":
+            heart[f"{state}HR"] = per_minute[per_minute["value"] == value].groupby(keys)["mean"].mean()
+
+    episodes = episodes.merge(heart.reset_index(), on=keys, how="left")
+    episodes["LowestHRMinute"] = (episodes["LowestHRMinute"] - episodes["Start"]) / 60
+    episodes["HRDip"] = episodes["SleepingHR"] - episodes["LowestHR"]
+    episodes[["HRSamples", "MinutesWithHR"]] = episodes[["HRSamples", "MinutesWithHR"]].fillna(0).astype(int)
+    episodes["Start"] = _format_seconds(episodes["Start"])
+    episodes["End"] = _format_seconds(episodes["End"])
+    return episodes[EPISODE_COLUMNS]
+
+
+def build_sleep_episodes(use_modified=True, batch_users=BATCH_USERS, tolerance=TOLERANCE_SECONDS):
+    """
+    Builds sleep_episodes from minute_sleep and heart_rate, batch_users users at a time.
+
+    Returns:
+        pd.DataFrame: The stored table.
+    """
+    backend = get_backend(use_modified)
+    existing = set(backend.list_tables())
+    if "minute_sleep" not in existing:
+        print("The minute_sleep table does not exist, sleep_episodes was not built.")
+        return None
+
+    users = sorted(int(user_id) for user_id in backend.distinct("minute_sleep", ["Id"])["Id"])
+    frames = []
+    for i in range(0, len(users), batch_users):
+        filters = [("Id", "in", users[i:i + batch_users])]
+        sleep = scan_table("minute_sleep", columns=["Id", "logId", "Date", "Time", "TimeOfDay", "value"],
+                           filters=filters, use_modified=use_modified)
+        if "heart_rate" in existing:
+            samples = scan_table("heart_rate", columns=["Id", "Date", "Time", "TimeOfDay", "Value"],
+                                 filters=filters, use_modified=use_modified)
+        else:
+            samples = pd.DataFrame(columns=["Id", "Date", "Time", "TimeOfDay", "Value"])
+        frames.append(compute_sleep_heart_rate(sleep, samples, tolerance))
+    episodes = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=EPISODE_COLUMNS)
+
+    save_table_data(episodes, EPISODE_TABLE, use_modified=use_modified, inputs=SOURCE_TABLES)
+    enforce_natural_keys([EPISODE_TABLE], use_modified=use_modified)
+    with_heart_rate = int((episodes["MinutesWithHR"] > 0).sum())
+    print(f"Built {EPISODE_TABLE}: {len(episodes)} sleep logs of {len(users)} users, {with_heart_rate} with heart rate.")
+    return episodes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Align heart rate with the sleep minutes and summarize it per sleep log.")
+    parser.add_argument("--batch-users", type=int, default=BATCH_USERS, help="Users per batch.")
+    parser.add_argument("--tolerance", type=int, default=TOLERANCE_SECONDS,
+                        help="Seconds after the start of a sleep minute that still belong to it.")
+    args = parser.parse_args()
+    build_sleep_episodes(use_modified=True, batch_users=args.batch_users, tolerance=args.tolerance)
@@ -0,0 +1,395 @@
+import os
+import sys
+import uuid
+import shutil
+import sqlite3
+import argparse
+from abc import ABC, abstractmethod
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# FITBIT_DB_PATH and FITBIT_MODIFIED_DB_PATH point everything at other databases, e.g.
+# a synthetic one from synthetic_data.py
+DB_PATH = os.environ.get("FITBIT_DB_PATH", os.path.join(BASE_DIR, "..", "data", "fitbit_database.db"))
+MODIFIED_DB_PATH = os.environ.get("FITBIT_MODIFIED_DB_PATH", os.path.join(BASE_DIR, "..", "data", "fitbit_database_modified.db"))
+PARQUET_DIR = os.environ.get("FITBIT_PARQUET_DIR", os.path.join(BASE_DIR, "..", "data", "parquet"))
+
+# Which backend database_queries (and everything built on it) reads and writes:
+# "sqlite" (default) or "parquet"
+BACKEND_ENV = "FITBIT_STORAGE_BACKEND"
+
+# Parquet tables are split into one directory per value of these columns, so a filter
+# on a user only opens that user's files
+PARTITION_COLUMNS = ("Id",)
+
+# Filters are a list of (column, op, value) tuples that are all required to hold,
+# with op one of: =, ==, !=, <, <=, >, >=, in, not in
+FILTER_OPS = {"=", "==", "!=", "<", "<=", ">", ">=", "in", "not in"}
+
+
+def _check_filters(filters):
+    for column, op, value in filters or []:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator '{op}' on column '{column}'")
+
+
+class StorageBackend(ABC):
+    """
+    Where the tables live. The analysis code only needs these operations, so the
+    same scripts run against the SQLite file or the Parquet dataset. A backend that
+    does not implement all of them cannot be created.
+    """
+
+    name = None
+    # Where the tables are (file or directory), identifies the database in caches
+    location = None
+
+    @abstractmethod
+    def list_tables(self):
+        """
+        Returns:
+            list: The table names.
+        """
+
+    @abstractmethod
+    def schema(self, table_name):
+        """
+        Returns:
+            dict: Column name -> type name, in column order. Empty if the table does not exist.
+        """
+
+    @abstractmethod
+    def scan(self, table_name, columns=None, filters=None):
+        """
+        Reads a table.
+
+        Parameters:
+            table_name (str): The table.
+            columns (list): Only read these columns, None for all.
+            filters (list): (column, op, value) tuples that rows must all satisfy.
+
+        Returns:
+            pd.DataFrame: The matching rows.
+        """
+
+    def distinct(self, table_name, columns):
+        """
+        The distinct combinations of the given columns, sorted.
+        """
+        df = self.scan(table_name, columns=columns).drop_duplicates()
+        return df.sort_values(columns).reset_index(drop=True)
+
+    @abstractmethod
+    def write(self, df, table_name):
+        """
+        Replaces the table with the DataFrame.
+        """
+
+    @abstractmethod
+    def append(self, df, table_name):
+        """
+        Adds the rows of the DataFrame to the table, creating it if needed.
+
+        Returns:
+            int: The number of rows added.
+        """
+
+    @abstractmethod
+    def drop(self, table_name):
+        """
+        Removes the table if it exists.
+        """
+
+    @abstractmethod
+    def version(self, table_name=None):
+        """
+        Cheap token that changes whenever the table (or, without a table, anything) is written.
+        """
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    The SQLite database file. Pass an open connection to reuse it (it is then not closed).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path=None, connection=None, read_only=False):
+        if db_path is None and connection is None:
+            raise ValueError("SQLiteBackend needs a db_path or a connection")
+        if db_path is None:
+            db_path = connection.execute("PRAGMA database_list").fetchone()[2]
+        self.db_path = db_path
+        self.location = os.path.abspath(db_path)
+        self.read_only = read_only
+        self._connection = connection
+
+    def _connect(self):
+        if self._connection is not None:
+            return self._connection
+        if self.read_only:
+            return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        return sqlite3.connect(self.db_path)
+
+    def _close(self, conn):
+        if conn is not self._connection:
+            conn.close()
+
+    def list_tables(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+        finally:
+            self._close(conn)
+        return [row[0] for row in rows]
+
+    def schema(self, table_name):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        finally:
+            self._close(conn)
+        return {row[1]: row[2] for row in rows}
+
+    @staticmethod
+    def _where(filters):
+        clauses, params = [], []
+        for column, op, value in filters or []:
+            if op in ("in", "not in"):
+                values = list(value)
+                clauses.append(f'"{column}" {op.upper()} ({", ".join("?" * len(values))})')
+                params += values
+            else:
+                clauses.append(f'"{column}" {"=" if op == "==" else op} ?')
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def scan(self, table_name, columns=None, filters=None):
+        _check_filters(filters)
+        select = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+        where, params = self._where(filters)
+        conn = self._connect()
+        try:
+            return pd.read_sql_query(f'SELECT {select} FROM "{table_name}"{where}', conn, params=params)
+        finally:
+            self._close(conn)
+
+    def distinct(self, table_name, columns):
+        select = ", ".join(f'"{column}"' for column in columns)
+        conn = self._connect()
+        try:
+            return pd.read_sql_query(f'SELECT DISTINCT {select} FROM "{table_name}" ORDER BY {select}', conn)
+        finally:
+            self._close(conn)
+
+    def write(self, df, table_name):
+        conn = self._connect()
+        try:
+            df.to_sql(table_name, conn, if_exists="replace", index=False)
+        finally:
+            self._close(conn)
+
+    @staticmethod
+    def _insert_or_ignore(table, conn, keys, data_iter):
+        # pandas to_sql insert method: rows that break a UNIQUE index (see dedup.py) are skipped
+        columns = ", ".join(f'"{key}"' for key in keys)
+        cursor = conn.executemany(
+            f'INSERT OR IGNORE INTO "{table.name}" ({columns}) VALUES ({", ".join("?" * len(keys))})',
+            list(data_iter),
+        )
+        return cursor.rowcount
+
+    def append(self, df, table_name):
+        conn = self._connect()
+        try:
+            return df.to_sql(table_name, conn, if_exists="append", index=False, method=self._insert_or_ignore) or 0
+        finally:
+            self._close(conn)
+
+    def drop(self, table_name):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        finally:
+            self._close(conn)
+
+    def version(self, table_name=None):
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return "missing"
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class ParquetBackend(StorageBackend):
+    """
+    A directory with one Parquet dataset per table, hive-partitioned on PARTITION_COLUMNS
+    (root/<table>/Id=<id>/part-*.parquet). Scans go through pyarrow.dataset, so the
+    projection is applied per file and filters on a partition column skip the
+    directories of other users without opening them.
+    """
+
+    name = "parquet"
+    SCHEMA_FILE = "_schema.arrow"
+
+    def __init__(self, root, partition_columns=PARTITION_COLUMNS):
+        self.root = root
+        self.location = os.path.abspath(root)
+        self.partition_columns = tuple(partition_columns)
+
+    def _table_dir(self, table_name):
+        return os.path.join(self.root, table_name)
+
+    def _read_schema(self, table_name):
+        # The full schema is stored next to the data: partition columns are not in the
+        # files, and an empty table has no files at all
+        try:
+            with open(os.path.join(self._table_dir(table_name), self.SCHEMA_FILE), "rb") as f:
+                return pa.ipc.read_schema(pa.py_buffer(f.read()))
+        except OSError:
+            return None
+
+    def _dataset(self, table_name, schema):
+        partition_fields = [schema.field(column) for column in self.partition_columns if column in schema.names]
+        partitioning = ds.partitioning(pa.schema(partition_fields), flavor="hive") if partition_fields else None
+        # Files and directories starting with "_" or "." (the schema file) are ignored
+        return ds.dataset(self._table_dir(table_name), schema=schema, format="parquet", partitioning=partitioning)
+
+    def list_tables(self):
+        try:
+            names = sorted(os.listdir(self.root))
+        except OSError:
+            return []
+        return [name for name in names if os.path.exists(os.path.join(self.root, name, self.SCHEMA_FILE))]
+
+    def schema(self, table_name):
+        schema = self._read_schema(table_name)
+        if schema is None:
+            return {}
+        return {field.name: str(field.type) for field in schema}
+
+    def scan(self, table_name, columns=None, filters=None):
+        _check_filters(filters)
+        schema = self._read_schema(table_name)
+        if schema is None:
+            raise FileNotFoundError(f"No Parquet table '{table_name}' in {self.root}")
+        expression = pq.filters_to_expression(filters) if filters else None
+        table = self._dataset(table_name, schema).to_table(columns=columns, filter=expression)
+        return table.to_pandas()
+
+    def distinct(self, table_name, columns):
+        schema = self._read_schema(table_name)
+        if schema is None:
+            raise FileNotFoundError(f"No Parquet table '{table_name}' in {self.root}")
+        table = self._dataset(table_name, schema).to_table(columns=columns)
+        df = table.group_by(columns).aggregate([]).to_pandas()
+        return df.sort_values(columns).reset_index(drop=True)
+
+    def _to_arrow(self, df, schema=None):
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+    def _write_files(self, table, directory):
+        partition_fields = [table.schema.field(column) for column in self.partition_columns if column in table.schema.names]
+        ds.write_dataset(
+            table,
+            directory,
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema(partition_fields), flavor="hive") if partition_fields else None,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+    def write(self, df, table_name):
+        table = self._to_arrow(df)
+        os.makedirs(self.root, exist_ok=True)
+        # Written next to the old version and swapped in, so readers never see half a table
+        tmp_dir = os.path.join(self.root, f"_tmp-{table_name}-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        self._write_files(table, tmp_dir)
+        with open(os.path.join(tmp_dir, self.SCHEMA_FILE), "wb") as f:
+            f.write(table.schema.remove_metadata().serialize().to_pybytes())
+
+        table_dir = self._table_dir(table_name)
+        old_dir = None
+        if os.path.exists(table_dir):
+            old_dir = os.path.join(self.root, f"_old-{table_name}-{uuid.uuid4().hex}")
+            os.rename(table_dir, old_dir)
+        os.rename(tmp_dir, table_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    def append(self, df, table_name):
+        schema = self._read_schema(table_name)
+        if schema is None:
+            self.write(df, table_name)
+            return len(df)
+        # No unique constraints here, every row is added
+        self._write_files(self._to_arrow(df[schema.names], schema=schema), self._table_dir(table_name))
+        return len(df)
+
+    def drop(self, table_name):
+        shutil.rmtree(self._table_dir(table_name), ignore_errors=True)
+
+    def version(self, table_name=None):
+        directory = self._table_dir(table_name) if table_name else self.root
+        latest, count = 0, 0
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                try:
+                    latest = max(latest, os.stat(os.path.join(dirpath, filename)).st_mtime_ns)
+                except OSError:
+                    continue
+                count += 1
+        return f"{latest}-{count}" if count else "missing"
+
+
+def get_backend(use_modified=False, kind=None):
+    """
+    The backend of the raw or the modified database, chosen with the
+    FITBIT_STORAGE_BACKEND environment variable (sqlite or parquet).
+    """
+    kind = kind or os.environ.get(BACKEND_ENV, "sqlite")
+    if kind == "sqlite":
+        return SQLiteBackend(MODIFIED_DB_PATH if use_modified else DB_PATH)
+    if kind == "parquet":
+        return ParquetBackend(os.path.join(PARQUET_DIR, "modified" if use_modified else "raw"))
+    raise ValueError(f"Unknown storage backend '{kind}', expected 'sqlite' or 'parquet'")
+
+
+def as_backend(source):
+    """
+    Accepts a backend or an open sqlite3 connection, for functions that used to take a connection.
+    """
+    # Checked by behaviour, not class: the dashboard imports this module as scripts.storage_backends too
+    if hasattr(source, "scan") and hasattr(source, "list_tables"):
+        return source
+    if isinstance(source, sqlite3.Connection):
+        return SQLiteBackend(connection=source)
+    raise TypeError(f"Expected a StorageBackend or sqlite3.Connection, got {type(source).__name__}")
+
+
+def copy_tables(source, target, tables=None):
+    """
+    Copies tables from one backend to another, e.g. SQLite to Parquet.
+    """
+    for table_name in tables or source.list_tables():
+        target.write(source.scan(table_name), table_name)
+        print(f"Copied table: {table_name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the SQLite databases to the Parquet dataset directory.")
+    parser.add_argument("--raw", action="store_true", help="Copy the raw database instead of the modified one.")
+    parser.add_argument("--tables", nargs="*", help="Only copy these tables.")
+    args = parser.parse_args()
+
+    use_modified = not args.raw
+    source = get_backend(use_modified, kind="sqlite")
+    if not os.path.exists(source.db_path):
+        sys.exit(f"Database not found: {source.db_path}")
+    copy_tables(source, get_backend(use_modified, kind="parquet"), tables=args.tables)
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from batched_ols import group_cross_products, solve_cross_products, results_to_frame
+from perf_probes import probed
+
+
+def build_sufficient_statistics(df, y_variables, x_variables, group_columns=("Id", "TimeBlock")):
+    """
+    Precomputes n, X'X, X'y and y'y per group for every candidate predictor and target.
+    Any regression over a subset of the groups and variables can afterwards be
+    fitted by summing these small matrices instead of going back to the rows.
+
+    Parameters:
+        df (pd.DataFrame): The data, rows with a missing value in any of the variables are dropped.
+        y_variables (list): Candidate target columns, e.g. ['StepTotal', 'Calories'].
+        x_variables (list): Candidate predictor columns, e.g. ['temp', 'temp_squared', 'precip'].
+        group_columns (list): The columns that define the cells of the cache.
+
+    Returns:
+        dict: keys (one row per group), cross (groups x m x m array with Z = [1, x_variables, y_variables]),
+        columns (the names of Z) and group_columns.
+    """
+    columns = list(x_variables) + [y for y in y_variables if y not in x_variables]
+    keys, cross = group_cross_products(df, columns, group_columns)
+    return {
+        "keys": keys,
+        "cross": cross,
+        "columns": ["const"] + columns,
+        "group_columns": list(group_columns) if group_columns else [],
+    }
+
+
+def _select_groups(statistics, selection):
+    keys = statistics["keys"]
+    mask = np.ones(len(keys), dtype=bool)
+    for column, values in (selection or {}).items():
+        if values is None:
+            continue
+        if not isinstance(values, (list, tuple, set, np.ndarray, pd.Series)):
+            values = [values]
+        mask &= keys[column].isin(list(values)).to_numpy()
+    return mask
+
+
+def _variable_indices(statistics, y_variable, x_variables):
+    columns = statistics["columns"]
+    missing = [col for col in [y_variable] + list(x_variables) if col not in columns]
+    if missing:
+        raise KeyError(f"Variables not in the sufficient statistics: {missing}")
+    return [0] + [columns.index(x) for x in x_variables], columns.index(y_variable)
+
+
+@probed("model: fit_from_sufficient_statistics")
+def fit_from_sufficient_statistics(statistics, y_variable, x_variables, selection=None):
+    """
+    Fits y ~ const + x_variables pooled over the selected groups.
+
+    Parameters:
+        statistics (dict): The output of build_sufficient_statistics.
+        y_variable (str): The target column.
+        x_variables (list): The predictor columns.
+        selection (dict): Values to keep per group column, e.g. {'Id': 1503960366, 'TimeBlock': ['8-12']}.
+
+    Returns:
+        SimpleNamespace with params, bse, tvalues, pvalues (pd.Series) and rsquared,
+        rsquared_adj, nobs, df_resid, like a statsmodels results object.
+        None if no observations are selected.
+    """
+    x_indices, y_index = _variable_indices(statistics, y_variable, x_variables)
+    mask = _select_groups(statistics, selection)
+    cross = statistics["cross"][mask].sum(axis=0, keepdims=True)
+    if cross[0, 0, 0] == 0:
+        return None
+
+    results = solve_cross_products(cross, x_indices, y_index)
+    index = ["const"] + list(x_variables)
+    return SimpleNamespace(
+        params=pd.Series(results["params"][0], index=index),
+        bse=pd.Series(results["bse"][0], index=index),
+        tvalues=pd.Series(results["tvalues"][0], index=index),
+        pvalues=pd.Series(results["pvalues"][0], index=index),
+        rsquared=float(results["rsquared"][0]),
+        rsquared_adj=float(results["rsquared_adj"][0]),
+        nobs=float(results["nobs"][0]),
+        df_resid=float(results["df_resid"][0]),
+    )
+
+
+def fit_groups_from_sufficient_statistics(statistics, y_variable, x_variables, by=("Id",), selection=None):
+    """
+    Fits one regression per value of `by`, pooling the remaining group columns.
+    For example by=['Id'] with selection={'TimeBlock': ['8-12', '12-16']} gives per-user
+    fits over those two time blocks.
+
+    Returns:
+        pd.DataFrame: The same tidy layout as batched_ols.fit_grouped_ols.
+    """
+    x_indices, y_index = _variable_indices(statistics, y_variable, x_variables)
+    mask = _select_groups(statistics, selection)
+    keys = statistics["keys"][mask]
+    cross = statistics["cross"][mask]
+
+    grouped = keys.groupby(list(by), observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    summed = np.zeros((grouped.ngroups,) + cross.shape[1:])
+    np.add.at(summed, codes, cross)
+
+    results = solve_cross_products(summed, x_indices, y_index)
+    return results_to_frame(grouped.size().index.to_frame(index=False), results, ["const"] + list(x_variables))
@@ -0,0 +1,223 @@
+import os
+import sys
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ingest_csv import EXPORT_TABLES
+from storage_backends import DB_PATH
+
+# Deterministic synthetic raw databases with the schema of fitbit_database.db (the
+# columns of ingest_csv.EXPORT_TABLES), for benchmarking at sizes beyond the sample.
+# scale=1 is roughly the sample: 35 users over 31 days, 40% of them with second-level
+# heart rate (~2.5M rows), 70% with sleep logs and 25% with weight entries. The scale
+# multiplies the users; days sets the duration. Every user gets its own random stream
+# (seeded with (seed, user index)), so a user's rows do not depend on how many users
+# are generated or how they are batched.
+SAMPLE_USERS = 35
+SAMPLE_DAYS = 31
+START_DATE = "2016-03-12"
+
+HEART_RATE_SHARE = 0.4
+SLEEP_SHARE = 0.7
+WEIGHT_SHARE = 0.25
+
+# Heart rate is recorded from WEAR_START for WEAR_HOURS, every 5 to 15 seconds
+WEAR_START = 7 * 3600
+WEAR_HOURS = 16
+
+# Share of the day's steps per hour, low at night and peaking in the afternoon
+HOURLY_PROFILE = np.array([
+    0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.5, 3.0, 5.0, 6.0, 6.5, 7.0,
+    8.0, 7.5, 7.0, 7.0, 7.5, 8.5, 8.0, 6.5, 4.5, 3.0, 1.5, 0.6,
+])
+HOURLY_PROFILE = HOURLY_PROFILE / HOURLY_PROFILE.sum()
+
+BATCH_USERS = 25
+
+
+def _time_strings():
+    # 'h:mm:ss AM' for every second of the day, so timestamps are formatted with a lookup
+    seconds = np.arange(86400)
+    hours, minutes, secs = seconds // 3600, seconds // 60 % 60, seconds % 60
+    return np.array([f"{(h % 12) or 12}:{m:02d}:{s:02d} {'AM' if h < 12 else 'PM'}"
+                     for h, m, s in zip(hours, minutes, secs)], dtype=object)
+
+
+TIME_STRINGS = _time_strings()
+
+
+def _date_strings(start_date, n_days):
+    # One day extra, sleep logs run past midnight of the last day
+    days = pd.date_range(start_date, periods=n_days + 1, freq="D")
+    return np.array([f"{day.month}/{day.day}/{day.year}" for day in days], dtype=object)
+
+
+def _timestamps(date_strings, day_index, second_of_day):
+    # 'M/D/YYYY h:mm:ss AM', as in the Fitbit export
+    day_index = day_index + second_of_day // 86400
+    return date_strings[day_index] + " " + TIME_STRINGS[second_of_day % 86400]
+
+
+def user_ids(n_users, seed=0):
+    """
+    n_users distinct 10-digit Ids like the export's, the same for the same seed.
+    """
+    rng = np.random.default_rng([seed, 2**31 - 1])
+    return np.sort(rng.choice(np.arange(1_000_000_000, 9_999_999_999, 7919, dtype=np.int64), n_users, replace=False))
+
+
+def _user_tables(user_id, user_index, n_days, date_strings, start_date, seed):
+    rng = np.random.default_rng([seed, user_index])
+    days = np.arange(n_days)
+    tables = {}
+
+    # Daily totals, with a few days the tracker was not worn
+    worn = rng.random(n_days) > 0.05
+    steps = np.where(worn, np.clip(rng.normal(rng.uniform(4000, 11000), 3000, n_days), 0, None), 0).astype(np.int64)
+    distance = np.round(steps * rng.uniform(0.0006, 0.0008), 2)
+    very = np.where(worn, np.clip(steps / 400 + rng.normal(0, 8, n_days), 0, None), 0).astype(np.int64)
+    fairly = np.where(worn, np.clip(steps / 900 + rng.normal(0, 5, n_days), 0, None), 0).astype(np.int64)
+    lightly = np.where(worn, np.clip(rng.normal(190, 60, n_days), 0, None), 0).astype(np.int64)
+    sedentary = np.clip(1440 - very - fairly - lightly - np.where(worn, rng.normal(420, 60, n_days), 0), 0, 1440).astype(np.int64)
+    calories = (rng.uniform(1400, 2100) + steps * 0.05 + rng.normal(0, 120, n_days)).astype(np.int64)
+    tables["daily_activity"] = pd.DataFrame({
+        "Id": user_id, "ActivityDate": date_strings[days], "TotalSteps": steps,
+        "TotalDistance": distance, "TrackerDistance": distance, "LoggedActivitiesDistance": 0.0,
+        "VeryActiveDistance": np.round(distance * very / np.maximum(very + fairly + lightly, 1), 2),
+        "ModeratelyActiveDistance": np.round(distance * fairly / np.maximum(very + fairly + lightly, 1), 2),
+        "LightActiveDistance": np.round(distance * lightly / np.maximum(very + fairly + lightly, 1), 2),
+        "SedentaryActiveDistance": 0.0, "VeryActiveMinutes": very, "FairlyActiveMinutes": fairly,
+        "LightlyActiveMinutes": lightly, "SedentaryMinutes": sedentary, "Calories": calories,
+    })
+
+    # Hourly rows split the daily totals over the day
+    shares = rng.dirichlet(HOURLY_PROFILE * 40, n_days)
+    hour_steps = np.round(steps[:, None] * shares).astype(np.int64).ravel()
+    hour_calories = np.round(calories[:, None] * (0.6 / 24 + 0.4 * shares)).astype(np.int64).ravel()
+    intensity = np.clip(np.round(hour_steps / 40 + rng.normal(0, 2, hour_steps.size)), 0, 180).astype(np.int64)
+    hour_day, hour = np.repeat(days, 24), np.tile(np.arange(24), n_days)
+    activity_hour = _timestamps(date_strings, hour_day, hour * 3600)
+    tables["hourly_steps"] = pd.DataFrame({"Id": user_id, "ActivityHour": activity_hour, "StepTotal": hour_steps})
+    tables["hourly_calories"] = pd.DataFrame({"Id": user_id, "ActivityHour": activity_hour, "Calories": hour_calories})
+    tables["hourly_intensity"] = pd.DataFrame({"Id": user_id, "ActivityHour": activity_hour,
+                                               "TotalIntensity": intensity, "AverageIntensity": np.round(intensity / 60, 6)})
+
+    group = rng.random(3)
+    if group[0] < HEART_RATE_SHARE:
+        # Irregular samples over the wear window of each worn day, raised in active hours
+        n_samples = int(WEAR_HOURS * 3600 / 10 * 1.2)
+        offsets = np.cumsum(rng.integers(5, 16, (n_days, n_samples)), axis=1)
+        keep = (offsets < WEAR_HOURS * 3600) & worn[:, None]
+        sample_day = np.broadcast_to(days[:, None], offsets.shape)[keep]
+        second = WEAR_START + offsets[keep]
+        hour_intensity = intensity.reshape(n_days, 24)[sample_day, second // 3600]
+        value = rng.uniform(55, 72) + 0.9 * hour_intensity + rng.normal(0, 4, second.size)
+        tables["heart_rate"] = pd.DataFrame({
+            "Id": user_id, "Time": _timestamps(date_strings, sample_day, second),
+            "Value": np.clip(np.round(value), 40, 200).astype(np.int64),
+        })
+
+    if group[1] < SLEEP_SHARE:
+        # One log on most nights, starting between 10 PM and 1 AM, one row per minute
+        nights = days[rng.random(n_days) < 0.85]
+        starts = 22 * 3600 + rng.integers(0, 180, nights.size) * 60 + 30
+        lengths = rng.integers(300, 540, nights.size)
+        night = np.repeat(np.arange(nights.size), lengths)
+        minute = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        tables["minute_sleep"] = pd.DataFrame({
+            "Id": user_id,
+            "date": _timestamps(date_strings, nights[night], starts[night] + minute * 60),
+            "value": rng.choice([1, 2, 3], night.size, p=[0.91, 0.07, 0.02]),
+            "logId": np.int64(10**10) + user_index * 10_000 + night,
+        })
+
+    if group[2] < WEIGHT_SHARE:
+        n_entries = rng.integers(1, min(n_days, 10) + 1)
+        entry_days = np.sort(rng.choice(days, n_entries, replace=False))
+        entry_seconds = rng.integers(6 * 3600, 23 * 3600, n_entries)
+        weight = np.round(rng.normal(75, 14) + rng.normal(0, 0.8, n_entries), 1)
+        fat = np.where(rng.random(n_entries) < 0.1, rng.integers(15, 35, n_entries).astype(float), np.nan)
+        epoch = (pd.Timestamp(start_date) - pd.Timestamp("1970-01-01")) // pd.Timedelta(milliseconds=1)
+        tables["weight_log"] = pd.DataFrame({
+            "Id": user_id, "Date": _timestamps(date_strings, entry_days, entry_seconds),
+            "WeightKg": weight, "WeightPounds": np.round(weight * 2.20462, 2), "Fat": fat,
+            "BMI": np.round(weight / rng.uniform(1.55, 1.95) ** 2, 2),
+            "IsManualReport": (rng.random(n_entries) < 0.6).astype(np.int64),
+            "LogId": epoch + (entry_days * 86400 + entry_seconds) * 1000,
+        })
+    return tables
+
+
+def generate_database(db_path, scale=1.0, users=None, days=None, start_date=START_DATE, seed=0,
+                      batch_users=BATCH_USERS):
+    """
+    Writes a synthetic raw database with the tables and columns of fitbit_database.db.
+    An existing file is replaced.
+
+    Parameters:
+        db_path (str): The SQLite file to create.
+        scale (float): Users as a multiple of the sample (35 users), e.g. 1, 10 or 100.
+        users (int): Number of users, overrides scale.
+        days (int): Number of days, defaults to the sample's 31.
+        start_date (str): The first day.
+        seed (int): Same seed and sizes give the same database.
+        batch_users (int): Users generated and written at a time, bounds the memory used.
+
+    Returns:
+        dict: Table name -> number of rows.
+    """
+    n_users = users or max(1, round(SAMPLE_USERS * scale))
+    n_days = days or SAMPLE_DAYS
+    ids = user_ids(n_users, seed)
+    date_strings = _date_strings(start_date, n_days)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    # A throwaway file, so there is no need for a journal
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    row_counts = {table_name: 0 for table_name in EXPORT_TABLES}
+    try:
+        # Every table exists with its full column list, even if no user has rows in it
+        for table_name, (_, columns) in EXPORT_TABLES.items():
+            pd.DataFrame({name: pd.Series(dtype=dtype.to_pandas_dtype()) for name, dtype in columns}).to_sql(
+                table_name, conn, if_exists="replace", index=False)
+
+        for batch_start in range(0, n_users, batch_users):
+            batch = {table_name: [] for table_name in EXPORT_TABLES}
+            for user_index in range(batch_start, min(batch_start + batch_users, n_users)):
+                for table_name, df in _user_tables(ids[user_index], user_index, n_days, date_strings, start_date, seed).items():
+                    batch[table_name].append(df)
+            for table_name, frames in batch.items():
+                if frames:
+                    df = pd.concat(frames, ignore_index=True)[[name for name, _ in EXPORT_TABLES[table_name][1]]]
+                    df.to_sql(table_name, conn, if_exists="append", index=False)
+                    row_counts[table_name] += len(df)
+            conn.commit()
+            print(f"Generated {min(batch_start + batch_users, n_users)}/{n_users} users")
+    finally:
+        conn.close()
+    return row_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic raw Fitbit database.")
+    parser.add_argument("db_path", help="SQLite file to write, e.g. data/synthetic/fitbit_10x.db")
+    parser.add_argument("--scale", type=float, default=1.0, help="Users as a multiple of the sample (35 users).")
+    parser.add_argument("--users", type=int, default=None, help="Number of users, overrides --scale.")
+    parser.add_argument("--days", type=int, default=SAMPLE_DAYS)
+    parser.add_argument("--start-date", default=START_DATE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db_path) == os.path.abspath(DB_PATH):
+        sys.exit("Refusing to overwrite the sample database, choose another path.")
+    counts = generate_database(args.db_path, args.scale, args.users, args.days, args.start_date, args.seed)
+    for table_name, rows in counts.items():
+        print(f"{table_name}: {rows} rows")
@@ -0,0 +1,217 @@
+import sqlite3
+import pandas as pd
+
+from database_queries import DB_PATH, MODIFIED_DB_PATH
+from perf_probes import probed
+
+FILTER_OPERATORS = {
+    "=": "= ?",
+    "!=": "!= ?",
+    "<": "< ?",
+    "<=": "<= ?",
+    ">": "> ?",
+    ">=": ">= ?",
+    "contains": "LIKE '%' || ? || '%'",
+    "is null": "IS NULL",
+    "is not null": "IS NOT NULL",
+}
+
+
+def _connect(use_modified=False):
+    # Read-only, so browsing never changes the file (and its version token), except for
+    # the index _ensure_sort_index creates the first time a column is sorted on
+    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_columns(conn, table_name):
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+    if table_name not in tables:
+        raise ValueError(f"Unknown table: {table_name}")
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table_name)})")]
+
+
+def _filter_clause(filters, columns):
+    """
+    Turns [(column, operator, value), ...] into a SQL condition with bound parameters.
+    Column names are checked against the table so they can be quoted safely.
+    """
+    conditions, params = [], []
+    for column, operator, value in filters or []:
+        if column not in columns:
+            raise ValueError(f"Unknown column: {column}")
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown operator: {operator}")
+        conditions.append(f"{_quote(column)} {FILTER_OPERATORS[operator]}")
+        if "?" in FILTER_OPERATORS[operator]:
+            params.append(value)
+    return conditions, params
+
+
+def parse_filter_value(text):
+    """
+    Filter values come in as text, numbers are converted so they compare as numbers in SQL.
+    """
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _keyset_segments(sort_column, descending, after):
+    """
+    The page order as segments that SQLite can each read from an index in order,
+    starting at the cursor `after` = (sort value, rowid): the rows without a sort
+    value (first when ascending, last when descending) and the rows with one.
+
+    Returns:
+        list: (conditions, params, ORDER BY) per segment, in page order.
+    """
+    direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+    if sort_column is None:
+        if after is None:
+            return [([], [], f"rowid {direction}")]
+        return [([f"rowid {compare} ?"], [after[1]], f"rowid {direction}")]
+
+    column = _quote(sort_column)
+    nulls = ([f"{column} IS NULL"], [], f"rowid {direction}")
+    values = ([f"{column} IS NOT NULL"], [], f"{column} {direction}, rowid {direction}")
+    segments = [values, nulls] if descending else [nulls, values]
+    if after is None:
+        return segments
+
+    value, rowid = after
+    if value is None:
+        # Inside the NULL segment; ascending, all the values still follow
+        nulls = ([f"{column} IS NULL", f"rowid {compare} ?"], [rowid], nulls[2])
+        return [nulls] if descending else [nulls, values]
+    # A row-value comparison, so SQLite seeks to the cursor in the index instead of scanning up to it
+    values = ([f"{column} IS NOT NULL", f"({column}, rowid) {compare} (?, ?)"], [value, rowid], values[2])
+    return [values, nulls] if descending else [values]
+
+
+def _ensure_sort_index(conn, table_name, sort_column, use_modified=False):
+    """
+    Creates an index on the sort column the first time a table is sorted by it, so
+    every page is read from the index instead of sorting the filtered table.
+    This is the only write of the browser; if the file is read-only the pages are
+    sorted without an index.
+    """
+    for index in conn.execute(f"PRAGMA index_list({_quote(table_name)})").fetchall():
+        if [row[2] for row in conn.execute(f"PRAGMA index_info({_quote(index[1])})")] == [sort_column]:
+            return
+
+    # conn is read-only
+    write_conn = sqlite3.connect(MODIFIED_DB_PATH if use_modified else DB_PATH)
+    try:
+        with write_conn:
+            write_conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{table_name}_{sort_column}')} "
+                         f"ON {_quote(table_name)} ({_quote(sort_column)})")
+    except sqlite3.OperationalError as e:
+        print(f"Error creating an index on {table_name}.{sort_column}: {e}")
+    finally:
+        write_conn.close()
+
+
+def approximate_row_count(table_name, use_modified=False):
+    """
+    Row count without a full scan: the ANALYZE statistics when present, otherwise
+    the largest rowid (exact unless rows were deleted).
+    """
+    conn = _connect(use_modified)
+    try:
+        _table_columns(conn, table_name)
+        has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        if has_stats:
+            row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table_name,)).fetchone()
+            if row:
+                return int(row[0].split()[0])
+        row = conn.execute(f"SELECT MAX(rowid) FROM {_quote(table_name)}").fetchone()
+        return int(row[0] or 0)
+    finally:
+        conn.close()
+
+
+@probed("sql: fetch_page")
+def fetch_page(table_name, page_size=100, after=None, sort_column=None, descending=False, filters=None, use_modified=False):
+    """
+    Fetches one page of a table with keyset pagination, filters and sorting done in SQL.
+
+    Parameters:
+        table_name (str): The table to browse.
+        page_size (int): Rows per page.
+        after (tuple): The cursor returned with the previous page, None for the first page.
+        sort_column (str): Column to sort on, None keeps the rowid order.
+        descending (bool): Sort direction.
+        filters (list): Conditions as (column, operator, value), see FILTER_OPERATORS.
+
+    Returns:
+        page (pd.DataFrame): The rows of the page.
+        next_cursor (tuple): Cursor for the next page, None when this was the last page.
+    """
+    conn = _connect(use_modified)
+    try:
+        columns = _table_columns(conn, table_name)
+        if sort_column is not None and sort_column not in columns:
+            raise ValueError(f"Unknown column: {sort_column}")
+        if sort_column is not None:
+            _ensure_sort_index(conn, table_name, sort_column, use_modified)
+
+        conditions, params = _filter_clause(filters, columns)
+        # One extra row tells whether there is a next page
+        pages = []
+        remaining = page_size + 1
+        for segment_conditions, segment_params, order in _keyset_segments(sort_column, descending, after):
+            where = " AND ".join(conditions + segment_conditions)
+            query = f"SELECT rowid AS _rowid, * FROM {_quote(table_name)}"
+            if where:
+                query += f" WHERE {where}"
+            query += f" ORDER BY {order} LIMIT ?"
+            pages.append(pd.read_sql_query(query, conn, params=params + segment_params + [remaining]))
+            remaining -= len(pages[-1])
+            if remaining == 0:
+                break
+        page = pd.concat(pages, ignore_index=True) if len(pages) > 1 else pages[0]
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.iloc[:page_size]
+        last = page.iloc[-1]
+        sort_value = None if sort_column is None or pd.isna(last[sort_column]) else last[sort_column]
+        if hasattr(sort_value, "item"):
+            sort_value = sort_value.item()
+        next_cursor = (sort_value, int(last["_rowid"]))
+
+    return page.drop(columns=["_rowid"]), next_cursor
+
+
+@probed("sql: column_summary")
+def column_summary(table_name, column, filters=None, use_modified=False):
+    """
+    Summary statistics for one column, computed in SQL over the filtered rows.
+    """
+    conn = _connect(use_modified)
+    try:
+        columns = _table_columns(conn, table_name)
+        if column not in columns:
+            raise ValueError(f"Unknown column: {column}")
+        conditions, params = _filter_clause(filters, columns)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        col = _quote(column)
+        query = f"""
+        SELECT COUNT(*) AS rows, COUNT({col}) AS non_null, COUNT(DISTINCT {col}) AS distinct_values,
+               MIN({col}) AS min, MAX({col}) AS max, AVG({col}) AS mean
+        FROM {_quote(table_name)}{where};
+        """
+        summary = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    return summary.iloc[0]
@@ -0,0 +1,171 @@
+import json
+import time
+import hashlib
+import threading
+
+import pandas as pd
+
+from storage_backends import get_backend
+
+# Every write through database_queries.save_table_data / append_table_data adds a row
+# to _table_versions: a per-table counter, the row count, a hash of the content, the
+# step that wrote it and, for derived tables, the version tokens of the inputs at the
+# time. The version token of a table is "<version>-<hash prefix>", so caches and
+# materialized tables can check whether they are current without reading the table.
+VERSIONS_TABLE = "_table_versions"
+VERSION_COLUMNS = ["table_name", "version", "row_count", "content_hash", "step", "inputs", "written_at"]
+
+# Latest row per table, per database, valid as long as the storage does not change
+_latest_cache = {}
+_latest_cache_lock = threading.Lock()
+
+
+def content_hash(df, previous_hash=None):
+    """
+    Hash of the column names and values of a DataFrame (not the index).
+    With previous_hash, the hash of the table after appending df to it.
+    """
+    digest = hashlib.sha1((previous_hash or "").encode())
+    digest.update("\x1f".join(map(str, df.columns)).encode())
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _token(row):
+    return f"{int(row['version'])}-{row['content_hash'][:16]}"
+
+
+def _latest_versions(backend):
+    key = backend.location
+    storage_version = backend.version(VERSIONS_TABLE)
+    with _latest_cache_lock:
+        cached = _latest_cache.get(key)
+        if cached is not None and cached[0] == storage_version:
+            return cached[1]
+
+    try:
+        history = backend.scan(VERSIONS_TABLE)
+    except Exception:
+        history = pd.DataFrame(columns=VERSION_COLUMNS)
+    latest = {}
+    if not history.empty:
+        history = history.sort_values("version").drop_duplicates("table_name", keep="last")
+        latest = {row["table_name"]: row for row in history.to_dict("records")}
+    with _latest_cache_lock:
+        _latest_cache[key] = (storage_version, latest)
+    return latest
+
+
+def current_version(table_name, use_modified=False):
+    """
+    The latest _table_versions entry of a table.
+
+    Returns:
+        dict: version, row_count, content_hash, step, inputs (dict of table -> token) and
+        written_at. None if the table was never written through database_queries.
+    """
+    row = _latest_versions(get_backend(use_modified)).get(table_name)
+    if row is None:
+        return None
+    return dict(row, inputs=json.loads(row["inputs"] or "{}"))
+
+
+def version_token(table_name, use_modified=False):
+    """
+    The version token of a table. Tables without a lineage entry (e.g. a prebuilt raw
+    database) fall back to the storage version, which changes with any write.
+    """
+    backend = get_backend(use_modified)
+    row = _latest_versions(backend).get(table_name)
+    if row is None:
+        return f"storage-{backend.version(table_name)}"
+    return _token(row)
+
+
+def lineage_token(tables, use_modified=False):
+    """
+    Version token of a dataset derived from several tables, e.g. a merged frame held in a cache.
+    """
+    return "|".join(f"{table_name}:{version_token(table_name, use_modified)}" for table_name in tables)
+
+
+def record_table_version(table_name, df, step, inputs=None, use_modified=False, appended=False,
+                         row_count=None, digest=None):
+    """
+    Adds the _table_versions entry for a write of df to table_name.
+    A table written in chunks passes df=None with its row_count and digest (the
+    content_hash of the chunks, chained).
+
+    Parameters:
+        table_name (str): The table written.
+        df (pd.DataFrame): The rows written (for appended=True only the new rows).
+        row_count (int): With df, the rows actually added if some were skipped by a
+            unique index.
+        step (str): The function or script that wrote it.
+        inputs (list): Tables the data was derived from; their current tokens are stored.
+        appended (bool): df was added to the existing rows instead of replacing them.
+
+    Returns:
+        str: The new version token.
+    """
+    backend = get_backend(use_modified)
+    previous = _latest_versions(backend).get(table_name)
+    previous_hash = None
+    if df is not None:
+        row_count = len(df) if row_count is None else row_count
+        if appended and previous is not None:
+            row_count += int(previous["row_count"])
+            previous_hash = previous["content_hash"]
+        digest = content_hash(df, previous_hash)
+
+    row = {
+        "table_name": table_name,
+        "version": int(previous["version"]) + 1 if previous is not None else 1,
+        "row_count": row_count,
+        "content_hash": digest,
+        "step": step,
+        "inputs": json.dumps({name: version_token(name, use_modified) for name in inputs or []}),
+        "written_at": time.time(),
+    }
+    backend.append(pd.DataFrame([row], columns=VERSION_COLUMNS), VERSIONS_TABLE)
+    return _token(row)
+
+
+def track_tables(step, tables=None, use_modified=False):
+    """
+    Records a first version for tables that have none yet, e.g. after copying a prebuilt
+    database, so they get stable tokens instead of the storage version.
+    """
+    backend = get_backend(use_modified)
+    latest = _latest_versions(backend)
+    for table_name in tables or backend.list_tables():
+        if not table_name.startswith("_") and table_name not in latest:
+            record_table_version(table_name, backend.scan(table_name), step, use_modified=use_modified)
+
+
+def stale_inputs(table_name, use_modified=False):
+    """
+    The inputs of a derived table that changed since it was written.
+
+    Returns:
+        list: Names of the changed inputs, empty if the table is current.
+        None if the table has no lineage entry.
+    """
+    entry = current_version(table_name, use_modified)
+    if entry is None:
+        return None
+    return [name for name, token in entry["inputs"].items() if version_token(name, use_modified) != token]
+
+
+def version_history(table_name=None, use_modified=False):
+    """
+    All _table_versions entries (of one table), oldest first.
+    """
+    try:
+        history = get_backend(use_modified).scan(VERSIONS_TABLE)
+    except Exception:
+        return pd.DataFrame(columns=VERSION_COLUMNS)
+    if table_name is not None:
+        history = history[history["table_name"] == table_name]
+    return history.sort_values(["table_name", "version"]).reset_index(drop=True)
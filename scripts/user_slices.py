@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from database_queries import DB_PATH, MODIFIED_DB_PATH
+from storage_backends import get_backend
+from perf_probes import probed
+
+# The per-user tables of the dashboard and the column that holds their 'M/D/YYYY' date
+USER_TABLES = {
+    "heart_rate": "Date",
+    "hourly_intensity": "Date",
+    "daily_activity": "ActivityDate",
+    "merged_heart_rate_activity": "Date",
+    "weight_log": "Date",
+    "daily_heart_rate": "Date",
+    "sleep_episodes": "Date",
+}
+
+MAX_CACHED_USERS = 8
+
+# The slices of the most recently viewed users, keyed on (version, user_id, start, end, tables)
+_slice_cache = OrderedDict()
+_slice_cache_lock = threading.Lock()
+
+
+def _connect(use_modified=True, read_only=True):
+    db_path = MODIFIED_DB_PATH if use_modified else DB_PATH
+    if read_only:
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    return sqlite3.connect(db_path)
+
+
+def _existing_tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+
+
+def create_user_indexes(use_modified=True):
+    """
+    Creates an (Id, date) index on every per-user table, so a user's rows and the
+    distinct user list are read from the index instead of a full table scan.
+    Only needed for the SQLite backend, Parquet tables are partitioned on Id instead.
+    """
+    if get_backend(use_modified).name != "sqlite":
+        print("User indexes are only used by the SQLite backend, skipped.")
+        return
+    conn = _connect(use_modified, read_only=False)
+    tables = _existing_tables(conn)
+    with conn:
+        for table_name, date_column in USER_TABLES.items():
+            if table_name in tables:
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_Id_{date_column}" '
+                    f'ON "{table_name}" (Id, "{date_column}");'
+                )
+    conn.close()
+    print("User indexes have been created.")
+
+
+def date_strings(start_date, end_date):
+    # Dates are stored as unpadded 'M/D/YYYY' text, which does not sort, so the range
+    # is matched as the list of its days
+    days = pd.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date), freq="D")
+    return [f"{day.month}/{day.day}/{day.year}" for day in days]
+
+
+@probed("sql: list_users")
+def list_users(table_name="daily_activity", min_days=None, use_modified=True):
+    """
+    The distinct user Ids of a table, read from its (Id, date) index (SQLite) or
+    the partition directories (Parquet).
+
+    Parameters:
+        table_name (str): One of USER_TABLES.
+        min_days (int): Only users with at least this many distinct dates.
+
+    Returns:
+        list: The sorted user Ids.
+    """
+    date_column = USER_TABLES[table_name]
+    backend = get_backend(use_modified)
+    if min_days:
+        days = backend.distinct(table_name, ["Id", date_column]).groupby("Id").size()
+        return [int(user_id) for user_id in days.index[days >= min_days]]
+    return [int(user_id) for user_id in backend.distinct(table_name, ["Id"])["Id"]]
+
+
+@probed("sql: fetch_user_slice")
+def fetch_user_slice(user_id, start_date=None, end_date=None, tables=None, use_modified=True):
+    """
+    Fetches the rows of one user, optionally for a date range, from several tables.
+    The filters reach the backend, so SQLite reads them through the (Id, date) index
+    and Parquet only opens the user's partition.
+
+    Parameters:
+        user_id (int): The user Id.
+        start_date, end_date (str or date): First and last day to include, None for all days.
+        tables (list): Tables to read, defaults to all USER_TABLES.
+
+    Returns:
+        dict: Table name -> DataFrame with the user's rows (empty if the table does not exist).
+    """
+    tables = list(tables or USER_TABLES)
+    dates = None
+    if start_date is not None and end_date is not None:
+        dates = date_strings(start_date, end_date)
+
+    backend = get_backend(use_modified)
+    existing = set(backend.list_tables())
+    slices = {}
+    for table_name in tables:
+        if table_name not in existing:
+            slices[table_name] = pd.DataFrame()
+            continue
+        filters = [("Id", "=", user_id)]
+        if dates is not None:
+            filters.append((USER_TABLES[table_name], "in", dates))
+        slices[table_name] = backend.scan(table_name, filters=filters)
+    return slices
+
+
+def get_user_slice(user_id, start_date=None, end_date=None, tables=None, version=None, use_modified=True):
+    """
+    fetch_user_slice with a small LRU of the most recently viewed users.
+    Pass a version token of the tables (e.g. get_tables_version) so writes invalidate the entries.
+    """
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date).date()
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date).date()
+    key = (version, user_id, start_date, end_date, tuple(tables or USER_TABLES), use_modified)
+    with _slice_cache_lock:
+        if key in _slice_cache:
+            _slice_cache.move_to_end(key)
+            return _slice_cache[key]
+
+    slices = fetch_user_slice(user_id, start_date, end_date, tables=tables, use_modified=use_modified)
+    with _slice_cache_lock:
+        _slice_cache[key] = slices
+        while len(_slice_cache) > MAX_CACHED_USERS:
+            _slice_cache.popitem(last=False)
+    return slices
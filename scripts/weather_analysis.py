@@ -1,23 +1,22 @@
-import sqlite3
 import pandas as pd
+import numpy as np
 import statsmodels.api as sm
 import seaborn as sns
 import matplotlib.pyplot as plt
 from datetime import datetime
 import sys
 import os
-from divide_the_day import convert_time_to_twentyfour_hours, assign_time_blocks
+from divide_the_day import load_data_from_database, convert_time_to_twentyfour_hours, assign_time_blocks
+from sufficient_statistics import build_sufficient_statistics, fit_from_sufficient_statistics
+from activity_cube import build_activity_cube, is_activity_cube, daily_averages
+from resampling import resampling_summary, cluster_bootstrap_from_cross
+from model_registry import registered_fit
+from perf_probes import probed
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def load_data_from_database(db_path, query): 
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
-    connection.close()
-    return df
+WEATHER_TARGETS = ["StepTotal", "Calories", "TotalIntensity"]
+WEATHER_PREDICTORS = ["temp", "temp_squared", "precip", "humidity", "windspeed", "cloudcover"]
 
 def merge_fitbit_data(hourly_steps_df, hourly_calories_df, hourly_intensity_df):
     merged_df = pd.merge(hourly_calories_df, hourly_steps_df, on=["Id", "ActivityHour", "Date", "TimeOfDay"], how="inner")
@@ -58,33 +57,47 @@ def match_weather_df(weather_df):
 def merge_fitbit_and_weather_data(fitbit_df, weather_df):
     return pd.merge(fitbit_df, weather_df, on=["ActivityHour", "Date", "TimeOfDay"], how="inner")
 
-def run_weather_regression_(df, y_variable=None, x_variables=None, selected_blocks=None):
+def run_weather_regression_(df, y_variable=None, x_variables=None, selected_blocks=None, n_resamples=0, use_registry=False):
     if selected_blocks is not None:
         df = df[df["TimeBlock"].isin(selected_blocks)]
     if df.empty:
         print("No data available for the selected time blocks.")
         return None
-    X = df[x_variables]
-    y = df[y_variable]  
-    X = sm.add_constant(X)
-    model = sm.OLS(y, X).fit()
+
+    def fit():
+        X = df[x_variables]
+        y = df[y_variable]  
+        X = sm.add_constant(X)
+        model = sm.OLS(y, X).fit()
+        if n_resamples:
+            model.resampling = resampling_summary(df, y_variable, x_variables, cluster_column="Id", n_resamples=n_resamples)
+        return model
+
+    if use_registry:
+        model = registered_fit(fit, y_variable, x_variables, filter_spec={"TimeBlock": selected_blocks, "n_resamples": n_resamples}, df=df)
+    else:
+        model = fit()
     print(f"\nRegression Results for {y_variable}:\n")
     print(model.summary())
+    if n_resamples:
+        print(model.resampling)
     return model
 
-def plot_general_weather_analysis(df, y_variable = None, x_variable = None, selected_blocks=None, precip_scale=20):
-    if selected_blocks is None:
-        selected_blocks = ["8-12", "12-16", "16-20"]
-    filtered_df = df[df["TimeBlock"].isin(selected_blocks)]
-    filtered_df["Date"] = pd.to_datetime(filtered_df["Date"])
-    filtered_df = filtered_df.dropna(subset=[y_variable, x_variable, "precip", "temp"])
-    
-    daily_avg = filtered_df.groupby("Date").agg({
-        y_variable: "mean",
-        x_variable: "mean",
-        "precip": "mean"
-    }).reset_index()
+def build_weather_statistics(df):
+    df = df.copy()
+    df["temp_squared"] = df["temp"] ** 2
+    predictors = [col for col in WEATHER_PREDICTORS if col in df.columns]
+    return build_sufficient_statistics(df, WEATHER_TARGETS, predictors, group_columns=["Id", "TimeBlock"])
+
+@probed("model: run_weather_regression_from_statistics")
+def run_weather_regression_from_statistics(statistics, y_variable=None, x_variables=None, selected_blocks=None, user_id=None):
+    selection = {"TimeBlock": selected_blocks, "Id": user_id}
+    model = fit_from_sufficient_statistics(statistics, y_variable, x_variables, selection=selection)
+    if model is None:
+        print("No data available for the selected time blocks.")
+    return model
 
+def _plot_daily_weather(daily_avg, y_variable, x_variable, title, precip_scale=20):
     if x_variable == "precip":
         precip_scale = 100 / (daily_avg["precip"].max() + 0.1)
     daily_avg["precip_scaled"] = daily_avg["precip"] * precip_scale
@@ -106,7 +119,7 @@ def plot_general_weather_analysis(df, y_variable = None, x_variable = None, sele
     
     ax2.set_ylabel(f"{x_variable.capitalize()} (scaled for visibility)", color="black")
 
-    plt.title(f"Avg {y_variable} (Bar) vs. {x_variable} (Line) Across All Users (Time Blocks: {', '.join(selected_blocks)})")
+    plt.title(title)
     fig.autofmt_xdate(rotation=45)
     ax1.legend(loc="upper left")
     ax2.legend(loc="upper right")
@@ -114,60 +127,62 @@ def plot_general_weather_analysis(df, y_variable = None, x_variable = None, sele
     plt.tight_layout()
     return fig
 
-def plot_user_weather_analysis(df, user_id, y_variable = None, x_variable = None, selected_blocks=None, precip_scale=20):
+def _as_cube(df):
+    return df if is_activity_cube(df) else build_activity_cube(df)
+
+def weather_daily_averages(df, y_variable, x_variable, selected_blocks, user_id=None):
+    """
+    Daily averages of y_variable, x_variable, precip and temp over the selected time blocks,
+    from the hourly merged frame or a cube, for all users or one user.
+    """
+    return daily_averages(_as_cube(df), [y_variable, x_variable, "precip", "temp"], selected_blocks=selected_blocks, user_id=user_id)
+
+def bootstrap_weather_regression_from_statistics(statistics, y_variable=None, x_variables=None, selected_blocks=None, n_resamples=10000, n_workers=1):
+    """
+    Cluster bootstrap by user for the pooled weather regression, straight from the
+    per (Id, TimeBlock) sufficient statistics.
+    """
+    keys = statistics["keys"]
+    mask = keys["TimeBlock"].isin(selected_blocks).to_numpy() if selected_blocks is not None else slice(None)
+    codes, _ = pd.factorize(keys["Id"][mask])
+    cross = statistics["cross"][mask]
+    per_user = np.zeros((codes.max() + 1,) + cross.shape[1:])
+    np.add.at(per_user, codes, cross)
+
+    columns = statistics["columns"]
+    x_indices = [0] + [columns.index(x) for x in x_variables]
+    return cluster_bootstrap_from_cross(per_user, x_indices, columns.index(y_variable), ["const"] + list(x_variables),
+                                        n_resamples=n_resamples, n_workers=n_workers)
+
+@probed("plot: plot_general_weather_analysis")
+def plot_general_weather_analysis(df, y_variable = None, x_variable = None, selected_blocks=None, precip_scale=20):
+    # df can be the hourly merged frame or a cube from build_activity_cube
     if selected_blocks is None:
         selected_blocks = ["8-12", "12-16", "16-20"]
-        
-    user_df = df[(df["Id"] == user_id) & (df["TimeBlock"].isin(selected_blocks))]
-    if user_df.empty:
-        print(f"No data found for user ID {user_id} in time blocks {selected_blocks}.")
-        return
-    
-    user_df["Date"] = pd.to_datetime(user_df["Date"])
-    user_df = user_df.dropna(subset=[y_variable, x_variable, "precip", "temp"])
-    
-    daily_avg = user_df.groupby("Date").agg({
-        y_variable: "mean",
-        x_variable: "mean",
-        "precip": "mean"
-    }).reset_index()
-
-    if x_variable == "precip":
-        precip_scale = 100 / (daily_avg["precip"].max() + 0.1)
-    daily_avg["precip_scaled"] = daily_avg["precip"] * precip_scale
-
-    fig, ax1 = plt.subplots(figsize=(12, 6))
-
-    bar_width = 0.8
-    ax1.bar(daily_avg["Date"], daily_avg[y_variable], label=f"Avg {y_variable}", color="blue", alpha=0.7, width=bar_width)
-    ax1.set_xlabel("Date")
-    ax1.set_ylabel(f"Avg {y_variable}", color="blue")
-    ax1.tick_params(axis='y', labelcolor="blue")
-    ax1.grid(True, linestyle='--', alpha=0.5)
+    daily_avg = weather_daily_averages(df, y_variable, x_variable, selected_blocks)
 
-    ax2 = ax1.twinx()
-    ax2.plot(daily_avg["Date"], daily_avg[x_variable], label=f"Avg {x_variable}", color="red", marker="o", linestyle="--")
+    title = f"Avg {y_variable} (Bar) vs. {x_variable} (Line) Across All Users (Time Blocks: {', '.join(selected_blocks)})"
+    return _plot_daily_weather(daily_avg, y_variable, x_variable, title, precip_scale)
 
-    if x_variable == "precip":
-        ax2.plot(daily_avg["Date"], daily_avg["precip_scaled"], label=f"Avg Precip (x{precip_scale:.1f})", color="green", marker="o", linestyle="-.")
-    
-    ax2.set_ylabel(f"{x_variable.capitalize()} (scaled for visibility)", color="black")
+@probed("plot: plot_user_weather_analysis")
+def plot_user_weather_analysis(df, user_id, y_variable = None, x_variable = None, selected_blocks=None, precip_scale=20):
+    if selected_blocks is None:
+        selected_blocks = ["8-12", "12-16", "16-20"]
 
-    plt.title(f"Avg {y_variable} (Bar) vs. {x_variable} (Line) for User {user_id} (Time Blocks: {', '.join(selected_blocks)})")
-    fig.autofmt_xdate(rotation=45)
-    ax1.legend(loc="upper left")
-    ax2.legend(loc="upper right")
+    daily_avg = weather_daily_averages(df, y_variable, x_variable, selected_blocks, user_id=user_id)
+    if daily_avg.empty:
+        print(f"No data found for user ID {user_id} in time blocks {selected_blocks}.")
+        return
 
-    plt.tight_layout()
-    return fig
+    title = f"Avg {y_variable} (Bar) vs. {x_variable} (Line) for User {user_id} (Time Blocks: {', '.join(selected_blocks)})"
+    return _plot_daily_weather(daily_avg, y_variable, x_variable, title, precip_scale)
 
 def data_used():
-    db_path = os.path.join(BASE_DIR, "..", "data", "fitbit_database_modified.db")
     weather_path = os.path.join(BASE_DIR, "..", "data", "Chicago 2016-03-11 to 2016-04-13 hourly.csv")
 
-    hourly_calories_df = load_data_from_database(db_path, 'SELECT * FROM hourly_calories')
-    hourly_steps_df = load_data_from_database(db_path, 'SELECT * FROM hourly_steps')
-    hourly_intensity_df = load_data_from_database(db_path, 'SELECT * FROM hourly_intensity')
+    hourly_calories_df = load_data_from_database("hourly_calories")
+    hourly_steps_df = load_data_from_database("hourly_steps")
+    hourly_intensity_df = load_data_from_database("hourly_intensity")
     weather_df = match_weather_df(load_weather_data(weather_path))
 
     fitbit_df = merge_fitbit_data(hourly_steps_df, hourly_calories_df, hourly_intensity_df)
@@ -176,6 +191,8 @@ def data_used():
     return merged_df
 
 merged_df = data_used()
+weather_statistics = build_weather_statistics(merged_df)
+weather_cube = build_activity_cube(merged_df)
 selected_blocks = ["8-12", "12-16", "16-20"]
 filtered_df = merged_df[merged_df["TimeBlock"].isin(selected_blocks)]
 filtered_df["temp_squared"] = filtered_df["temp"] ** 2